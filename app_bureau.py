@@ -1,5 +1,8 @@
 # C:\MON PROJET\app_bureau.py
+import json
+import os
 import sys
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QLineEdit, QComboBox, QMessageBox, QGroupBox)
 import requests # Pour faire des requêtes HTTP à votre API Django
@@ -11,9 +14,20 @@ class StockMovementApp(QWidget):
         self.setGeometry(100, 100, 600, 400) # x, y, largeur, hauteur
 
         self.api_base_url = 'http://127.0.0.1:8000/api/' # L'URL de votre API Django
+        # L'API exige un jeton ('manage.py drf_create_token <utilisateur>') :
+        # variable d'environnement EISF_API_TOKEN ou fichier jeton_api.txt à côté de ce script
+        self.api = requests.Session()
+        api_token = self.load_api_token()
+        if api_token:
+            self.api.headers['Authorization'] = f'Token {api_token}'
 
         self.products = {} # Dictionnaire pour stocker {ID: Nom_Produit}
         self.locations = {} # Dictionnaire pour stocker {ID: Nom_Lieu}
+        self.stock_levels = {} # {ID_Produit: {ID_Lieu: Quantité}}
+        # Copie locale du catalogue, tenue à jour par /api/changes/?since=<jeton>
+        self.catalogue_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogue_local.json')
+        self.sync_token = '0'
+        self.sync_interval_ms = 60000
 
         self.init_ui()
         self.load_data_from_api()
@@ -40,6 +54,12 @@ class StockMovementApp(QWidget):
         location_layout.addWidget(self.location_combo)
         movement_layout.addLayout(location_layout)
 
+        # Stock actuel du produit dans le lieu sélectionné
+        self.stock_label = QLabel("Stock actuel : -", self)
+        movement_layout.addWidget(self.stock_label)
+        self.product_combo.currentIndexChanged.connect(self.update_stock_label)
+        self.location_combo.currentIndexChanged.connect(self.update_stock_label)
+
         # Quantité
         quantity_layout = QHBoxLayout()
         quantity_layout.addWidget(QLabel("Quantité:"))
@@ -52,9 +72,11 @@ class StockMovementApp(QWidget):
         type_layout = QHBoxLayout()
         type_layout.addWidget(QLabel("Type de Mouvement:"))
         self.type_combo = QComboBox(self)
-        # Ces types doivent correspondre aux CHOICES définis dans votre modèle StockMovement
-        # dans models.py (TYPE_MOUVEMENT_CHOICES)
-        self.type_combo.addItems(['ENTREE_ACHAT', 'SORTIE_VENTE', 'TRANSFERT', 'AJUSTEMENT_POSITIF', 'AJUSTEMENT_NEGATIF'])
+        # Libellé affiché -> type de StockMovement (TYPE_CHOICES dans models.py).
+        # Un transfert exige un lieu de destination, absent de ce formulaire.
+        for label, movement_type in [('ENTREE_ACHAT', 'ENTREE'), ('SORTIE_VENTE', 'SORTIE'),
+                                     ('AJUSTEMENT_POSITIF', 'ENTREE'), ('AJUSTEMENT_NEGATIF', 'SORTIE')]:
+            self.type_combo.addItem(label, movement_type)
         type_layout.addWidget(self.type_combo)
         movement_layout.addLayout(type_layout)
 
@@ -80,33 +102,125 @@ class StockMovementApp(QWidget):
         self.setLayout(main_layout)
 
     def load_data_from_api(self):
-        """Charge les produits et les lieux de stockage depuis l'API Django."""
+        """
+        Charge la copie locale du catalogue, puis ne demande à l'API que les
+        changements depuis le dernier jeton de synchronisation.
+        """
+        self.load_local_catalogue()
         try:
-            # Charger les produits
-            products_response = requests.get(f"{self.api_base_url}produits/")
-            products_response.raise_for_status()
-            for product in products_response.json():
-                self.products[product['id']] = product['nom']
-                self.product_combo.addItem(product['nom'], product['id'])
-
-            # Charger les lieux de stockage
-            locations_response = requests.get(f"{self.api_base_url}lieux-stockage/")
-            locations_response.raise_for_status()
-            for location in locations_response.json():
-                self.locations[location['id']] = location['nom']
-                self.location_combo.addItem(location['nom'], location['id'])
-
+            self.sync_catalogue()
         except requests.exceptions.RequestException as e:
             QMessageBox.critical(self, "Erreur de chargement des données",
                                  f"Impossible de charger les données depuis l'API: {e}\n"
-                                 "Veuillez vous assurer que le serveur Django est en cours d'exécution.")
+                                 "Veuillez vous assurer que le serveur Django est en cours d'exécution\n"
+                                 "et que le jeton d'API (EISF_API_TOKEN ou jeton_api.txt) est valide.\n"
+                                 "La dernière copie locale du catalogue est utilisée.")
+        self.refresh_combos()
+
+        # Mise à jour périodique (quelques kilo-octets quand rien n'a changé)
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.periodic_sync)
+        self.sync_timer.start(self.sync_interval_ms)
+
+    def load_api_token(self):
+        token = os.environ.get('EISF_API_TOKEN')
+        if token:
+            return token.strip()
+        try:
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jeton_api.txt'), encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def load_local_catalogue(self):
+        """Relit la copie locale enregistrée lors de la dernière synchronisation."""
+        try:
+            with open(self.catalogue_path, encoding='utf-8') as f:
+                catalogue = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.sync_token = catalogue['jeton']
+        self.products = {int(product_id): name for product_id, name in catalogue['produits'].items()}
+        self.locations = {int(location_id): name for location_id, name in catalogue['lieux'].items()}
+        self.stock_levels = {
+            int(product_id): {int(location_id): quantity for location_id, quantity in per_location.items()}
+            for product_id, per_location in catalogue['stocks'].items()
+        }
+
+    def save_local_catalogue(self):
+        catalogue = {
+            'jeton': self.sync_token,
+            'produits': self.products,
+            'lieux': self.locations,
+            'stocks': self.stock_levels,
+        }
+        with open(self.catalogue_path, 'w', encoding='utf-8') as f:
+            json.dump(catalogue, f)
+
+    def sync_catalogue(self):
+        """
+        Applique les changements renvoyés par /api/changes/?since=<jeton> (produits,
+        prix, stocks et lieux modifiés ou supprimés). Retourne True si quelque chose a changé.
+        """
+        changed = False
+        while True:
+            response = self.api.get(f"{self.api_base_url}changes/", params={'since': self.sync_token})
+            response.raise_for_status()
+            changes = response.json()
+            for product in changes['produits']:
+                self.products[product['id']] = product['nom']
+                self.stock_levels[product['id']] = {
+                    int(location_id): float(quantity) for location_id, quantity in product['stocks'].items()
+                }
+            for product_id in changes['produits_supprimes']:
+                self.products.pop(product_id, None)
+                self.stock_levels.pop(product_id, None)
+            for location in changes['lieux']:
+                self.locations[location['id']] = location['nom']
+            for location_id in changes['lieux_supprimes']:
+                self.locations.pop(location_id, None)
+            changed = changed or any(changes[key] for key in ('produits', 'produits_supprimes', 'lieux', 'lieux_supprimes'))
+            self.sync_token = changes['jeton']
+            if not changes['suite']:
+                break
+        self.save_local_catalogue()
+        return changed
+
+    def periodic_sync(self):
+        try:
+            if self.sync_catalogue():
+                self.refresh_combos()
+        except requests.exceptions.RequestException:
+            pass # Serveur injoignable : nouvel essai au prochain intervalle
+
+    def refresh_combos(self):
+        """Remplit les listes de produits et de lieux en conservant la sélection."""
+        for combo, items in ((self.product_combo, self.products), (self.location_combo, self.locations)):
+            selected = combo.currentData()
+            combo.blockSignals(True)
+            combo.clear()
+            for item_id, name in sorted(items.items(), key=lambda item: item[1]):
+                combo.addItem(name, item_id)
+            if selected is not None and combo.findData(selected) >= 0:
+                combo.setCurrentIndex(combo.findData(selected))
+            combo.blockSignals(False)
+        self.update_stock_label()
+
+    def update_stock_label(self):
+        product_id = self.product_combo.currentData()
+        location_id = self.location_combo.currentData()
+        if product_id is None or location_id is None:
+            self.stock_label.setText("Stock actuel : -")
+            return
+        quantity = self.stock_levels.get(product_id, {}).get(location_id, 0)
+        self.stock_label.setText(f"Stock actuel : {quantity}")
 
     def record_stock_movement(self):
         """Enregistre un nouveau mouvement de stock via l'API."""
         selected_product_id = self.product_combo.currentData()
         selected_location_id = self.location_combo.currentData()
         quantity_str = self.quantity_input.text()
-        movement_type = self.type_combo.currentText()
+        movement_type = self.type_combo.currentData()
         description = self.description_input.text()
 
         if not selected_product_id or not selected_location_id:
@@ -122,27 +236,34 @@ class StockMovementApp(QWidget):
             QMessageBox.warning(self, "Quantité Invalide", "La quantité doit être un nombre entier valide.")
             return
 
-        # Construire les données à envoyer à l'API
-        data = {
-            'produit_id': selected_product_id,
-            'lieu_stockage_id': selected_location_id,
+        # Construire les données à envoyer à l'API (lot d'un seul mouvement)
+        location_field = 'lieu_stockage_destination' if movement_type == 'ENTREE' else 'lieu_stockage_source'
+        data = [{
+            'produit': selected_product_id,
+            location_field: selected_location_id,
             'quantite': quantity,
             'type_mouvement': movement_type,
             'description': description
-        }
+        }]
 
+        response = None
         try:
-            response = requests.post(f"{self.api_base_url}mouvements-stock/", json=data)
+            response = self.api.post(f"{self.api_base_url}mouvements-stock/", json=data)
             response.raise_for_status() # Lève une exception pour les codes d'état d'erreur HTTP
 
             QMessageBox.information(self, "Succès", "Mouvement de stock enregistré avec succès!")
+            try:
+                self.sync_catalogue()
+                self.update_stock_label()
+            except requests.exceptions.RequestException:
+                pass # Le mouvement est enregistré ; le stock affiché sera rafraîchi à la prochaine synchronisation
             # Optionnel: Réinitialiser les champs après un enregistrement réussi
             self.quantity_input.clear()
             self.description_input.clear()
 
         except requests.exceptions.RequestException as e:
             error_message = f"Erreur lors de l'enregistrement du mouvement: {e}"
-            if response.status_code == 400: # Bad Request, souvent dû à des erreurs de validation
+            if response is not None and response.status_code == 400: # Bad Request, souvent dû à des erreurs de validation
                 try:
                     error_details = response.json()
                     error_message += f"\nDétails: {error_details}"
@@ -1,5 +1,5 @@
 """
-ASGI config for logiciel_gestion project.
+ASGI config for eisf project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
@@ -7,10 +7,26 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import logging
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logiciel_gestion.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eisf.settings')
 
 application = get_asgi_application()
+
+# Table des codes-barres chargée avant la première requête de caisse
+from django.db import connections  # noqa: E402
+
+from gestion_produits_stock.catalogue import prechauffer  # noqa: E402
+
+try:
+    prechauffer()
+except Exception:
+    # Base absente ou non migrée : la table sera chargée au premier scan
+    logging.getLogger(__name__).warning("Préchauffage de la table des codes impossible", exc_info=True)
+finally:
+    # Connexion du préchauffage fermée : chargée une fois par gunicorn
+    # (preload_app), elle serait sinon partagée par tous les workers
+    connections.close_all()
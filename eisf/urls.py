@@ -14,6 +14,9 @@ urlpatterns = [
     # va voir les définitions d'URL dans le fichier 'gestion_produits_stock/urls.py'."
     path('', include('gestion_produits_stock.urls')),
 
+    # API REST (caisses distantes, application de bureau) : gestion_produits_stock/api/urls.py
+    path('api/', include('gestion_produits_stock.api.urls')),
+
     # Si vous aviez d'autres applications Django, leurs chemins seraient ajoutés ici, par exemple :
     # path('blog/', include('blog.urls')),
 ]
@@ -1,5 +1,6 @@
 # C:\MON PROJET\eisf\wsgi.py
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -8,3 +9,18 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eisf.settings')
 
 application = get_wsgi_application()
+
+# Table des codes-barres chargée avant la première requête de caisse
+from django.db import connections  # noqa: E402
+
+from gestion_produits_stock.catalogue import prechauffer  # noqa: E402
+
+try:
+    prechauffer()
+except Exception:
+    # Base absente ou non migrée : la table sera chargée au premier scan
+    logging.getLogger(__name__).warning("Préchauffage de la table des codes impossible", exc_info=True)
+finally:
+    # Connexion du préchauffage fermée : chargée une fois par gunicorn
+    # (preload_app), elle serait sinon partagée par tous les workers
+    connections.close_all()
@@ -2,9 +2,6 @@
 
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Sum, DecimalField
-from django.db.models.functions import Coalesce
-from decimal import Decimal # Ajout de l'import pour la valeur par défaut
 
 from .models import (
     Client, Categorie, Fournisseur, LieuStockage, Produit,
@@ -35,25 +32,11 @@ class ClientAdmin(admin.ModelAdmin):
 # =====================================================================
 @admin.register(Produit)
 class ProduitAdmin(admin.ModelAdmin):
-    list_display = ('nom', 'code_produit', 'prix_unitaire', 'get_stock_total', 'categorie', 'fournisseur')
+    list_display = ('nom', 'code_produit', 'prix_unitaire', 'stock_total', 'categorie', 'fournisseur')
     search_fields = ('nom', 'code_produit')
     list_filter = ('categorie', 'fournisseur')
-    
-    # On utilise cette méthode pour afficher le stock total calculé par l'annotation
-    def get_stock_total(self, obj):
-        # La valeur 'stock_total' est ajoutée à chaque objet 'Produit' par get_queryset
-        return obj.stock_total
-    
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        # On annote le queryset pour calculer le stock total de chaque produit
-        queryset = queryset.annotate(
-            # Coalesce s'assure que la valeur est 0.00 si aucun stock n'est trouvé
-            stock_total=Coalesce(Sum('stocks__quantite'), Decimal('0.00'), output_field=DecimalField())
-        )
-        return queryset
-    
-    get_stock_total.short_description = 'Stock Total'
+    # Le stock total est une colonne dénormalisée, maintenue à chaque écriture sur Stock
+    readonly_fields = ('stock_total',)
 
 
 # =====================================================================
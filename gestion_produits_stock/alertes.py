@@ -0,0 +1,90 @@
+# gestion_produits_stock/alertes.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .lieux import id_lieu_vente
+from .models import Facture, Produit, Stock
+from .routage import lecture_principale
+
+# Nombre maximum d'éléments conservés par type d'alerte dans l'instantané
+ALERTES_NB_ELEMENTS = getattr(settings, 'ALERTES_NB_ELEMENTS', 10)
+# Durée de vie de l'instantané en cache (filet de sécurité si une invalidation est manquée)
+ALERTES_DUREE_CACHE = getattr(settings, 'ALERTES_DUREE_CACHE', 300)
+
+PREFIXE_CLE_ALERTES = 'alertes:instantane'
+
+
+def _cle_cache(date_jour):
+    # La date fait partie de la clé : les dettes en retard dépendent du jour courant
+    return f"{PREFIXE_CLE_ALERTES}:{date_jour.isoformat()}"
+
+
+def calculer_alertes(date_jour=None):
+    """
+    Construit l'instantané des alertes : les compteurs et les N premiers éléments
+    de chaque liste, sous forme de dictionnaires simples (sérialisables en cache).
+    """
+    date_jour = date_jour or timezone.localdate()
+
+    dettes = Facture.objects.filter(est_payee=False, date_echeance__lt=date_jour)
+    dettes_top = dettes.order_by('date_echeance', 'pk').values(
+        'pk', 'client__nom', 'date_echeance'
+    )[:ALERTES_NB_ELEMENTS]
+
+    produits_faibles = Produit.objects.filter(
+        pk__in=Stock.objects.filter(quantite__lte=F('produit__seuil_alerte')).values('produit_id')
+    )
+    stock_principal = Stock.objects.filter(
+        produit=OuterRef('pk'), lieu_stockage_id=id_lieu_vente()
+    ).values('quantite')[:1]
+    produits_top = produits_faibles.annotate(
+        stock_principal=Subquery(stock_principal)
+    ).order_by('nom', 'pk').values('pk', 'nom', 'stock_principal')[:ALERTES_NB_ELEMENTS]
+
+    return {
+        'date': date_jour,
+        'nb_dettes': dettes.count(),
+        'dettes': [
+            {
+                'pk': d['pk'],
+                'client_nom': d['client__nom'],
+                'date_echeance': d['date_echeance'],
+            }
+            for d in dettes_top
+        ],
+        'nb_stock_faible': produits_faibles.count(),
+        'stock_faible': [
+            {
+                'pk': p['pk'],
+                'nom': p['nom'],
+                'stock_principal': p['stock_principal'] or 0,
+            }
+            for p in produits_top
+        ],
+    }
+
+
+def obtenir_alertes():
+    """
+    Retourne l'instantané des alertes depuis le cache, en le recalculant si besoin.
+    """
+    cle = _cle_cache(timezone.localdate())
+    instantane = cache.get(cle)
+    if instantane is None:
+        # Jamais depuis la réplique : un état en retard resterait en cache
+        with lecture_principale():
+            instantane = calculer_alertes()
+        cache.set(cle, instantane, ALERTES_DUREE_CACHE)
+    return instantane
+
+
+def invalider_alertes():
+    """
+    Supprime l'instantané du jour. L'invalidation est différée après le commit
+    pour qu'une page concurrente ne remette pas en cache un état non validé.
+    """
+    transaction.on_commit(lambda: cache.delete(_cle_cache(timezone.localdate())))
@@ -0,0 +1,53 @@
+# gestion_produits_stock/api/export.py
+
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+# Nombre de lignes lues par aller-retour avec la base pendant un export
+API_TAILLE_LOT_EXPORT = getattr(settings, 'API_TAILLE_LOT_EXPORT', 2000)
+
+
+class RenduNDJSON(BaseRenderer):
+    """
+    JSON délimité par des retours à la ligne : un objet par ligne.
+    Sélectionné par '?format=ndjson' ou 'Accept: application/x-ndjson'.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Réponses non diffusées (détail, erreurs) : une seule ligne
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class ExportNDJSONMixin:
+    """
+    Liste diffusée en NDJSON pour les exports : le queryset est parcouru avec
+    .iterator(chunk_size=...) et chaque ligne est écrite dès sa sérialisation,
+    sans pagination ni matérialisation de la table ; la mémoire reste constante.
+    Les paramètres ?fields= / ?expand= et le plan de chargement s'appliquent.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, RenduNDJSON]
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != RenduNDJSON.format:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Base de lecture choisie maintenant : la réponse est diffusée après le retour de la vue
+        queryset = queryset.using(queryset.db)
+        # Un seul serializer, réutilisé pour chaque ligne
+        serializer = self.get_serializer()
+
+        def lignes():
+            for objet in queryset.iterator(chunk_size=API_TAILLE_LOT_EXPORT):
+                yield json.dumps(serializer.to_representation(objet), cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(lignes(), content_type=RenduNDJSON.media_type)
@@ -0,0 +1,15 @@
+# gestion_produits_stock/api/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class PaginationCurseur(CursorPagination):
+    """
+    Pagination par curseur de toutes les listes de l'API : chaque page est une
+    requête "WHERE id < dernier_id ORDER BY id DESC LIMIT n" servie par la clé
+    primaire, aussi rapide en fin de table qu'au début, et stable si des lignes
+    sont ajoutées pendant le parcours.
+    """
+    ordering = '-pk'
+    page_size_query_param = 'taille'
+    max_page_size = 500
@@ -2,29 +2,174 @@
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import action
-from django.db.models import Sum
+from rest_framework.decorators import action, api_view
+from django.db.models import Prefetch
 
 # Importation des modèles (celle-ci devrait être correcte maintenant)
-from ..models import Produit, LieuStockage, Stock, Client, Facture, LigneFacture, Paiement, TransfertStock
+from ..models import Categorie, Fournisseur, Produit, LieuStockage, Stock, StockMovement, Client, Facture, LigneFacture, Paiement
+from ..mouvements import NB_MOUVEMENTS_MAX_PAR_LOT, LotInvalide, enregistrer_mouvements
+from ..revalidation import etat_collection, poser_validateurs, reponse_si_inchange, validateurs
+from ..routage import lecture_seule
+from ..stocks import NB_PRODUITS_MAX_PAR_LOT, ajuster_stock, lire_ids, quantites_par_lieu
+from ..synchronisation import changements_depuis
+from .export import ExportNDJSONMixin
 
 # CORRECTION ICI : Importation des serializers.
 # Ils se trouvent probablement dans le dossier parent (gestion_produits_stock/)
-from ..serializers import ProduitSerializer, LieuStockageSerializer, StockSerializer, ClientSerializer, FactureSerializer, LigneFactureSerializer, PaiementSerializer, TransfertStockSerializer
+from ..serializers import ProduitSerializer, LieuStockageSerializer, StockSerializer, StockMovementSerializer, ClientSerializer, FactureSerializer, LigneFactureSerializer, PaiementSerializer
+
+
+def _liste_parametre(request, nom):
+    # '?expand=a,b' ou '?expand=a&expand=b'
+    return [
+        valeur.strip()
+        for brut in request.query_params.getlist(nom)
+        for valeur in brut.split(',')
+        if valeur.strip()
+    ]
+
+
+class PlanRequetesMixin:
+    """
+    Chaque viewset déclare son plan de chargement : pour chaque relation
+    dépliable (?expand=), les chemins select_related (clés étrangères) et
+    prefetch_related (relations multiples) à ajouter. Les listes s'exécutent
+    ainsi en un nombre constant de requêtes, quelles que soient les expansions.
+    ?fields= restreint les colonnes sérialisées.
+    """
+    select_related_par_expansion = {}
+    prefetch_par_expansion = {}
+
+    def expansions_demandees(self):
+        """
+        Expansions demandées et prévues par le plan ('facture.client' inclut
+        'facture'). Les autres sont ignorées : elles feraient une requête par ligne.
+        """
+        prevues = set(self.select_related_par_expansion) | set(self.prefetch_par_expansion)
+        expansions = set()
+        for chemin in _liste_parametre(self.request, 'expand'):
+            morceaux = chemin.split('.')
+            prefixes = ['.'.join(morceaux[:i]) for i in range(1, len(morceaux) + 1)]
+            if all(prefixe in prevues for prefixe in prefixes):
+                expansions.update(prefixes)
+        return sorted(expansions)
+
+    def champs_demandes(self):
+        return _liste_parametre(self.request, 'fields') or None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select_related = []
+        prefetch = {}
+        for expansion in self.expansions_demandees():
+            select_related.extend(self.select_related_par_expansion.get(expansion, []))
+            for lookup in self.prefetch_par_expansion.get(expansion, []):
+                cle = getattr(lookup, 'prefetch_to', lookup)
+                # Un Prefetch() personnalisé remplace le lookup simple de même chemin
+                if not isinstance(prefetch.get(cle), Prefetch):
+                    prefetch[cle] = lookup
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch.values())
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.champs_demandes())
+        kwargs.setdefault('expand', self.expansions_demandees())
+        return super().get_serializer(*args, **kwargs)
+
+
+class RevalidationMixin:
+    """
+    Requêtes conditionnelles pour les modèles portant 'date_derniere_maj' :
+    l'ETag d'une liste dépend de MAX(date_derniere_maj) et du nombre de lignes
+    du queryset filtré (plus ceux des modèles dépliés par ?expand=, déclarés
+    dans modeles_par_expansion), celui d'un détail de la date de l'objet.
+    Une copie à jour répond 304 sans sérialisation.
+    """
+    modeles_par_expansion = {}
+
+    def list(self, request, *args, **kwargs):
+        etats = [etat_collection(self.filter_queryset(self.get_queryset()))]
+        for expansion in self.expansions_demandees():
+            if expansion in self.modeles_par_expansion:
+                etats.append(etat_collection(self.modeles_par_expansion[expansion].objects.all()))
+        etag, derniere_maj = validateurs(etats, request.get_full_path())
+        reponse = reponse_si_inchange(request, etag, derniere_maj)
+        if reponse is None:
+            reponse = super().list(request, *args, **kwargs)
+            poser_validateurs(reponse, etag, derniere_maj)
+        return reponse
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etats = [(instance.date_derniere_maj, instance.pk)]
+        for expansion in self.expansions_demandees():
+            liee = getattr(instance, expansion, None) if expansion in self.modeles_par_expansion else None
+            if liee is not None:
+                etats.append((liee.date_derniere_maj, liee.pk))
+        etag, derniere_maj = validateurs(etats, request.get_full_path())
+        reponse = reponse_si_inchange(request, etag, derniere_maj)
+        if reponse is None:
+            reponse = Response(self.get_serializer(instance).data)
+            poser_validateurs(reponse, etag, derniere_maj)
+        return reponse
+
+
+class LectureRepliqueMixin:
+    """
+    Listes lues sur la réplique en lecture quand elle est configurée (voir
+    routage.py) ; détails et écritures restent sur la base principale.
+    """
+
+    def list(self, request, *args, **kwargs):
+        with lecture_seule():
+            return super().list(request, *args, **kwargs)
+
+
+def _enregistrer_lot(elements):
+    """
+    Applique un lot de mouvements (voir mouvements.enregistrer_mouvements).
+    Retourne (résultats, None) ou (None, Response d'erreur 400) ; les erreurs
+    sont données élément par élément, dans l'ordre du lot.
+    """
+    if not isinstance(elements, list) or not elements:
+        return None, Response({"detail": "Une liste d'éléments non vide est attendue."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(elements) > NB_MOUVEMENTS_MAX_PAR_LOT:
+        return None, Response({"detail": f"{NB_MOUVEMENTS_MAX_PAR_LOT} éléments au maximum par appel."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return enregistrer_mouvements(elements), None
+    except LotInvalide as e:
+        return None, Response({"detail": e.message, "erreurs": e.erreurs}, status=status.HTTP_400_BAD_REQUEST)
 
 
 # ViewSets pour vos modèles
-class ProduitViewSet(viewsets.ModelViewSet):
+class ProduitViewSet(LectureRepliqueMixin, RevalidationMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = Produit.objects.all()
     serializer_class = ProduitSerializer
+    select_related_par_expansion = {
+        'categorie': ['categorie'],
+        'fournisseur': ['fournisseur'],
+    }
+    modeles_par_expansion = {
+        'categorie': Categorie,
+        'fournisseur': Fournisseur,
+    }
 
-class LieuStockageViewSet(viewsets.ModelViewSet):
+class LieuStockageViewSet(LectureRepliqueMixin, RevalidationMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = LieuStockage.objects.all()
     serializer_class = LieuStockageSerializer
 
-class StockViewSet(viewsets.ModelViewSet):
+class StockViewSet(LectureRepliqueMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
+    select_related_par_expansion = {
+        'produit': ['produit'],
+        'lieu_stockage': ['lieu_stockage'],
+        'produit.categorie': ['produit__categorie'],
+        'produit.fournisseur': ['produit__fournisseur'],
+    }
 
     # Surcharge de la méthode 'create' pour gérer l'ajout/mise à jour du stock
     def create(self, request, *args, **kwargs):
@@ -47,22 +192,63 @@ class StockViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({"detail": "La quantité doit être un nombre entier valide."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Vérifier si un stock pour ce produit et ce lieu existe déjà
-        existing_stock = Stock.objects.filter(produit=produit, lieu_stockage=lieu_stockage).first()
-
-        if existing_stock:
-            # Si le stock existe, mettre à jour la quantité
-            existing_stock.quantite += quantite_ajoutee
-            existing_stock.save()
-            serializer = self.get_serializer(existing_stock)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
-            # Si le stock n'existe pas, créer un nouvel enregistrement de stock
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            headers = self.get_success_headers(serializer.data)
-            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        # Ajout atomique (ligne créée si besoin) et mouvement d'entrée, sans lecture préalable
+        ajuster_stock(produit.pk, lieu_stockage.pk, quantite_ajoutee, description="Entrée de stock via l'API.")
+        stock = Stock.objects.get(produit=produit, lieu_stockage=lieu_stockage)
+        serializer = self.get_serializer(stock)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def lot(self, request):
+        """
+        Entrées de stock groupées (réception d'une livraison) :
+        [{"produit": 1, "lieu_stockage": 2, "quantite": "10", "description": "..."}, ...].
+        Tout le lot est enregistré ou rien ; chaque entrée crée un mouvement ENTREE.
+        """
+        elements = request.data
+        if isinstance(elements, list):
+            elements = [
+                {
+                    'produit': element.get('produit'),
+                    'lieu_stockage_destination': element.get('lieu_stockage'),
+                    'quantite': element.get('quantite'),
+                    'type_mouvement': 'ENTREE',
+                    'description': element.get('description') or "Entrée de stock (lot).",
+                } if isinstance(element, dict) else element
+                for element in elements
+            ]
+        resultats, erreur = _enregistrer_lot(elements)
+        if erreur is not None:
+            for erreurs in erreur.data.get('erreurs', []):
+                if 'lieu_stockage_destination' in erreurs:
+                    erreurs['lieu_stockage'] = erreurs.pop('lieu_stockage_destination')
+            return erreur
+        return Response({"resultats": [
+            {
+                "mouvement": resultat['mouvement'].pk,
+                "produit": resultat['mouvement'].produit_id,
+                "lieu_stockage": resultat['mouvement'].lieu_stockage_destination_id,
+                "quantite": resultat['stocks'][resultat['mouvement'].lieu_stockage_destination_id],
+            }
+            for resultat in resultats
+        ]}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def quantites(self, request):
+        """
+        Stock de plusieurs produits en une requête : ?ids=1,2,3[&lieux=4,5].
+        Sans 'lieux', tous les lieux où chaque produit a du stock.
+        """
+        try:
+            produit_ids = lire_ids(request.query_params, 'ids')
+            lieu_ids = lire_ids(request.query_params, 'lieux') or None
+        except ValueError:
+            return Response({"detail": "Les identifiants doivent être des entiers."}, status=status.HTTP_400_BAD_REQUEST)
+        if not produit_ids:
+            return Response({"detail": "Le paramètre 'ids' est requis."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(produit_ids) > NB_PRODUITS_MAX_PAR_LOT:
+            return Response({"detail": f"{NB_PRODUITS_MAX_PAR_LOT} produits au maximum par appel."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"stocks": quantites_par_lieu(produit_ids, lieu_ids)}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'])
     def total_par_produit(self, request):
@@ -71,34 +257,92 @@ class StockViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Le paramètre 'produit_id' est requis."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            produit = Produit.objects.get(id=produit_id)
+            # Total dénormalisé, tenu à jour à chaque écriture sur Stock : pas d'agrégat
+            produit = Produit.objects.only('nom', 'stock_total').get(id=produit_id)
         except Produit.DoesNotExist:
             return Response({"detail": "Produit introuvable."}, status=status.HTTP_404_NOT_FOUND)
 
-        total_quantite = Stock.objects.filter(produit=produit).aggregate(Sum('quantite'))['quantite__sum'] or 0
         return Response({
             "produit_id": produit_id,
             "produit_nom": produit.nom,
-            "total_quantite_globale": total_quantite
+            "total_quantite_globale": produit.stock_total
         }, status=status.HTTP_200_OK)
 
 
-class ClientViewSet(viewsets.ModelViewSet):
+class MouvementStockViewSet(LectureRepliqueMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Historique des mouvements (lecture) et enregistrement groupé : POST d'une
+    liste de mouvements {produit, type_mouvement, quantite, lieu_stockage_source,
+    lieu_stockage_destination, description}, ou d'un seul objet.
+    """
+    queryset = StockMovement.objects.all()
+    serializer_class = StockMovementSerializer
+    select_related_par_expansion = {
+        'produit': ['produit'],
+        'lieu_stockage_source': ['lieu_stockage_source'],
+        'lieu_stockage_destination': ['lieu_stockage_destination'],
+    }
+
+    def create(self, request, *args, **kwargs):
+        elements = request.data if isinstance(request.data, list) else [request.data]
+        resultats, erreur = _enregistrer_lot(elements)
+        if erreur is not None:
+            return erreur
+        mouvements = StockMovementSerializer([resultat['mouvement'] for resultat in resultats], many=True).data
+        return Response({"resultats": [
+            {"mouvement": mouvement, "stocks": resultat['stocks']}
+            for mouvement, resultat in zip(mouvements, resultats)
+        ]}, status=status.HTTP_201_CREATED)
+
+
+class ClientViewSet(LectureRepliqueMixin, RevalidationMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
 
-class FactureViewSet(viewsets.ModelViewSet):
+class FactureViewSet(LectureRepliqueMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = Facture.objects.all()
     serializer_class = FactureSerializer
+    select_related_par_expansion = {
+        'client': ['client'],
+    }
+    prefetch_par_expansion = {
+        'lignes': ['lignes_facture'],
+        'lignes.produit': [Prefetch('lignes_facture', queryset=LigneFacture.objects.select_related('produit'))],
+        'paiements': ['paiement_set'],
+    }
 
-class LigneFactureViewSet(viewsets.ModelViewSet):
+class LigneFactureViewSet(LectureRepliqueMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = LigneFacture.objects.all()
     serializer_class = LigneFactureSerializer
+    select_related_par_expansion = {
+        'produit': ['produit'],
+        'facture': ['facture'],
+        'facture.client': ['facture__client'],
+    }
 
-class PaiementViewSet(viewsets.ModelViewSet):
+class PaiementViewSet(LectureRepliqueMixin, ExportNDJSONMixin, PlanRequetesMixin, viewsets.ModelViewSet):
     queryset = Paiement.objects.all()
     serializer_class = PaiementSerializer
+    select_related_par_expansion = {
+        'facture': ['facture'],
+        'facture.client': ['facture__client'],
+    }
+    prefetch_par_expansion = {
+        'facture.lignes': ['facture__lignes_facture'],
+        'facture.paiements': ['facture__paiement_set'],
+    }
+
 
-class TransfertStockViewSet(viewsets.ModelViewSet):
-    queryset = TransfertStock.objects.all()
-    serializer_class = TransfertStockSerializer
+@api_view(['GET'])
+def changements(request):
+    """
+    Synchronisation incrémentale du catalogue : ?since=<jeton> (0 ou absent :
+    tout le catalogue). Rappeler avec le 'jeton' reçu tant que 'suite' est vrai.
+    """
+    try:
+        jeton = int(request.query_params.get('since') or 0)
+        if jeton < 0:
+            raise ValueError(jeton)
+    except ValueError:
+        return Response({"detail": "Le paramètre 'since' doit être un jeton reçu de ce point d'accès."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changements_depuis(jeton), status=status.HTTP_200_OK)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestionProduitsStockConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_produits_stock'
+
+    def ready(self):
+        # Enregistrement des récepteurs de signaux
+        from . import signals  # noqa: F401
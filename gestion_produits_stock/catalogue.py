@@ -0,0 +1,225 @@
+# gestion_produits_stock/catalogue.py
+
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .lieux import id_lieu_vente
+from .models import JournalModification, Produit, Stock
+
+# Au-delà de ce retard (en entrées du journal), la table est reconstruite
+# plutôt que rattrapée
+MAX_ENTREES_RATTRAPEES = 1000
+
+
+def version_catalogue():
+    """
+    Numéro de version du catalogue (produits, prix, stocks) : le dernier
+    identifiant du journal des modifications, où chaque écriture note les
+    produits touchés dans sa transaction. Lu dans la base, il est le même pour
+    tous les processus serveur, et ne change qu'au commit de l'écriture.
+    Une requête sur la clé primaire (index), faite seulement quand le jeton
+    du catalogue a changé.
+    """
+    return JournalModification.objects.aggregate(version=Max('pk'))['version'] or 0
+
+
+# Jeton du catalogue, dans le cache partagé par les processus serveur : une
+# valeur aléatoire renouvelée après le commit de chaque écriture journalisée.
+# Tant qu'il ne change pas, la version en base n'a pas à être relue. Jamais
+# deux fois la même valeur : un renouvellement perdu entre deux processus, ou
+# un jeton évincé du cache, provoque au pire une relecture de trop.
+CLE_JETON = 'catalogue:jeton'
+
+
+def _renouveler_jeton():
+    cache.set(CLE_JETON, uuid.uuid4().hex, timeout=None)
+
+
+def jeton_catalogue():
+    """
+    Jeton courant du catalogue, lu dans le cache (sans requête SQL). Toute
+    écriture validée avant sa lecture est visible dans la base.
+    """
+    jeton = cache.get(CLE_JETON)
+    if jeton is None:
+        cache.add(CLE_JETON, uuid.uuid4().hex, timeout=None)
+        jeton = cache.get(CLE_JETON) or uuid.uuid4().hex
+    return jeton
+
+
+# Types d'objets du journal des modifications (synchronisation.py)
+TYPE_PRODUIT = 'produit'
+TYPE_LIEU = 'lieu'
+
+
+def journaliser(type_objet, objet_ids):
+    """
+    Note les objets modifiés dans le journal de synchronisation, dans la
+    transaction de l'écriture.
+
+    Les identifiants du journal deviennent visibles dans l'ordre croissant :
+    un lecteur qui voit l'entrée N ne verra jamais plus tard une entrée
+    inférieure à N. Sous SQLite, les transactions d'écriture sont déjà
+    sérialisées (BEGIN IMMEDIATE) ; sous PostgreSQL, un verrou consultatif
+    pris avant l'insertion et gardé jusqu'au commit sérialise l'attribution
+    des identifiants entre les transactions qui journalisent.
+    """
+    journal = [
+        JournalModification(type_objet=type_objet, objet_id=objet_id)
+        for objet_id in sorted({pk for pk in objet_ids if pk is not None})
+    ]
+    if not journal:
+        return
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as curseur:
+                curseur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [JournalModification._meta.db_table])
+        JournalModification.objects.bulk_create(journal)
+        # Les tables des codes des processus serveur relisent la version après le commit
+        transaction.on_commit(_renouveler_jeton)
+
+
+def signaler_modification_catalogue(produit_ids=None):
+    """
+    Journalise les produits modifiés (None : tout le catalogue), ce qui fait
+    avancer la version du catalogue au commit et sert à la synchronisation.
+    À appeler après les écritures faites par update() / bulk_create(), qui ne
+    déclenchent pas les signaux.
+    """
+    journaliser(TYPE_PRODUIT, Produit.objects.values_list('pk', flat=True) if produit_ids is None else produit_ids)
+
+
+class TableCodes:
+    """
+    Table de correspondance du processus : code produit -> (id, nom, prix) et,
+    par lieu de stockage, id du produit -> quantité. Un scan ne coûte qu'une
+    lecture du jeton dans le cache et deux accès dictionnaire ; après une
+    écriture, la version est relue dans la base et seuls les produits notés
+    au journal depuis la version connue sont relus.
+    """
+
+    def __init__(self):
+        self.jeton = None
+        self.version = None
+        self.codes = {}
+        self.produits = {}
+        self.stocks = {}
+        self._verrou = threading.Lock()
+
+    def synchroniser(self):
+        # Le jeton est lu avant la version, et la version avant les données :
+        # une écriture concurrente sera vue au prochain appel
+        jeton = jeton_catalogue()
+        if jeton == self.jeton:
+            return
+        with self._verrou:
+            if jeton == self.jeton:
+                return
+            version = version_catalogue()
+            if version == self.version:
+                self.jeton = jeton
+                return
+            if self.version is None or not 0 < version - self.version <= MAX_ENTREES_RATTRAPEES:
+                self._charger_tout()
+            else:
+                # Le compactage du journal ne retire que des entrées remplacées
+                # par une plus récente du même objet : aucun produit n'est manqué
+                self._recharger(set(JournalModification.objects.filter(
+                    pk__gt=self.version, pk__lte=version, type_objet=TYPE_PRODUIT,
+                ).values_list('objet_id', flat=True)))
+            self.version, self.jeton = version, jeton
+
+    def _charger_tout(self):
+        produits = {}
+        codes = {}
+        for pk, code, nom, prix in Produit.objects.exclude(code_produit__isnull=True).exclude(
+            code_produit=''
+        ).values_list('pk', 'code_produit', 'nom', 'prix_unitaire'):
+            produits[pk] = (code, nom, prix)
+            codes[code] = pk
+        self.produits, self.codes, self.stocks = produits, codes, {}
+
+    def _recharger(self, produit_ids):
+        # Les scans lisent les dictionnaires sans verrou : chaque entrée est
+        # remplacée en une opération, jamais retirée puis remise
+        if not produit_ids:
+            return
+        nouveaux = {
+            pk: (code, nom, prix)
+            for pk, code, nom, prix in Produit.objects.filter(pk__in=produit_ids).exclude(
+                code_produit__isnull=True
+            ).exclude(code_produit='').values_list('pk', 'code_produit', 'nom', 'prix_unitaire')
+        }
+        for pk in produit_ids:
+            ancien, nouveau = self.produits.get(pk), nouveaux.get(pk)
+            if nouveau is not None:
+                self.produits[pk] = nouveau
+                self.codes[nouveau[0]] = pk
+            else:
+                self.produits.pop(pk, None)
+            # Code retiré ou changé
+            if ancien is not None and (nouveau is None or nouveau[0] != ancien[0]) and self.codes.get(ancien[0]) == pk:
+                self.codes.pop(ancien[0], None)
+        if self.stocks:
+            lus = {}
+            for produit_id, lieu_id, quantite in Stock.objects.filter(
+                produit_id__in=produit_ids, lieu_stockage_id__in=list(self.stocks)
+            ).values_list('produit_id', 'lieu_stockage_id', 'quantite'):
+                lus[(lieu_id, produit_id)] = quantite
+            for lieu_id, quantites in self.stocks.items():
+                for pk in produit_ids:
+                    if (lieu_id, pk) in lus:
+                        quantites[pk] = lus[(lieu_id, pk)]
+                    else:
+                        quantites.pop(pk, None)
+
+    def quantites(self, lieu_stockage_id):
+        # Stock de chaque produit dans le lieu, chargé en une requête au premier usage
+        quantites = self.stocks.get(lieu_stockage_id)
+        if quantites is None:
+            with self._verrou:
+                quantites = self.stocks.get(lieu_stockage_id)
+                if quantites is None:
+                    quantites = dict(Stock.objects.filter(
+                        lieu_stockage_id=lieu_stockage_id
+                    ).values_list('produit_id', 'quantite'))
+                    self.stocks[lieu_stockage_id] = quantites
+        return quantites
+
+    def scanner(self, code, lieu_stockage_id):
+        """
+        Retourne {id, code, nom, prix_unitaire, stock_quantite} pour un code
+        exact, ou None si aucun produit ne porte ce code.
+        """
+        self.synchroniser()
+        pk = self.codes.get(code)
+        # Sans verrou : le produit peut avoir été retiré ou recodé entre les deux lectures
+        entree = self.produits.get(pk)
+        if entree is None or entree[0] != code:
+            return None
+        code, nom, prix = entree
+        return {
+            'id': pk,
+            'code': code,
+            'nom': nom,
+            'prix_unitaire': prix,
+            'stock_quantite': self.quantites(lieu_stockage_id).get(pk, 0),
+        }
+
+
+table_codes = TableCodes()
+
+
+def prechauffer(lieu_stockage_id=None):
+    """
+    Charge la table des codes (et le stock du lieu de vente) au démarrage du
+    serveur, pour que le premier scan n'attende pas la base.
+    """
+    table_codes.synchroniser()
+    lieu_stockage_id = lieu_stockage_id or id_lieu_vente()
+    if lieu_stockage_id is not None:
+        table_codes.quantites(lieu_stockage_id)
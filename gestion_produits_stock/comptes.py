@@ -0,0 +1,127 @@
+# gestion_produits_stock/comptes.py
+
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .alertes import invalider_alertes
+from .models import Facture, Paiement
+
+
+def _total_paye_reel():
+    return Coalesce(
+        Subquery(
+            Paiement.objects.filter(facture=OuterRef('pk'))
+            .values('facture')
+            .annotate(total=Sum('montant_paye'))
+            .values('total')
+        ),
+        Decimal('0.00'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def factures_en_ecart():
+    """
+    Retourne les factures dont le montant payé, le solde ou le statut dénormalisés
+    ne correspondent plus aux paiements enregistrés, annotées avec 'montant_paye_reel'.
+    """
+    return Facture.objects.annotate(montant_paye_reel=_total_paye_reel()).filter(
+        ~Q(montant_paye=F('montant_paye_reel'))
+        | ~Q(solde=F('montant_total') - F('montant_paye_reel'))
+        | Q(est_payee=True, montant_paye_reel__lt=F('montant_total'))
+        | Q(est_payee=False, montant_paye_reel__gte=F('montant_total'))
+    )
+
+
+def reconcilier_factures():
+    """
+    Recalcule montant payé, solde et statut des factures en écart à partir
+    de la table Paiement. Retourne le nombre de factures corrigées.
+    """
+    with transaction.atomic():
+        ids = list(factures_en_ecart().select_for_update().values_list('pk', flat=True))
+        if not ids:
+            return 0
+        Facture.objects.filter(pk__in=ids).update(montant_paye=_total_paye_reel())
+        Facture.objects.filter(pk__in=ids).update(
+            solde=F('montant_total') - F('montant_paye'),
+            est_payee=Case(
+                When(montant_paye__gte=F('montant_total'), then=Value(True)),
+                default=Value(False),
+            ),
+        )
+    invalider_alertes()
+    return len(ids)
+
+
+def releve_client(client):
+    """
+    Rassemble le relevé "Banque et Caisse" d'un client en un nombre constant de
+    requêtes : factures (avec montant payé et solde), totaux et paiements.
+    """
+    factures = list(Facture.objects.filter(client=client).order_by('-date_facturation'))
+    total_factures = sum((f.montant_total for f in factures), Decimal('0.00'))
+    total_paiements = sum((f.montant_paye for f in factures), Decimal('0.00'))
+    historique_paiements = Paiement.objects.filter(
+        facture__client=client
+    ).select_related('facture').order_by('-date_paiement')
+
+    return {
+        'factures': factures,
+        'total_factures': total_factures,
+        'total_paiements': total_paiements,
+        'solde_total': total_factures - total_paiements,
+        'historique_paiements': historique_paiements,
+    }
+
+
+def imputer_paiement(client, montant_paye, methode_paiement):
+    """
+    Répartit un paiement sur les factures non payées du client, de la plus
+    ancienne à la plus récente, dans une seule transaction : les factures sont
+    verrouillées en une requête, les paiements créés en masse et les soldes
+    mis à jour en masse. Retourne la liste des paiements créés.
+    """
+    with transaction.atomic():
+        factures_non_payees = list(
+            Facture.objects.select_for_update()
+            .filter(client=client, est_payee=False)
+            .order_by('date_facturation', 'pk')
+        )
+        solde_total = sum((f.solde for f in factures_non_payees), Decimal('0.00'))
+        if montant_paye > solde_total:
+            raise ValidationError(
+                f"Le montant du paiement ({montant_paye} FCFA) dépasse le solde total dû ({solde_total} FCFA)."
+            )
+
+        paiements = []
+        factures_modifiees = []
+        montant_restant_a_imputer = montant_paye
+        for facture in factures_non_payees:
+            if montant_restant_a_imputer <= Decimal('0.00'):
+                break
+            montant_impute = min(montant_restant_a_imputer, facture.solde)
+            if montant_impute <= Decimal('0.00'):
+                continue
+            paiements.append(Paiement(
+                facture=facture,
+                montant_paye=montant_impute,
+                methode_paiement=methode_paiement,
+            ))
+            facture.montant_paye += montant_impute
+            facture.solde -= montant_impute
+            facture.est_payee = facture.solde <= Decimal('0.00')
+            factures_modifiees.append(facture)
+            montant_restant_a_imputer -= montant_impute
+
+        # bulk_create/bulk_update ne passent ni par save() ni par les signaux :
+        # les totaux dénormalisés sont donc reportés ici explicitement.
+        Paiement.objects.bulk_create(paiements)
+        Facture.objects.bulk_update(factures_modifiees, ['montant_paye', 'solde', 'est_payee'])
+        invalider_alertes()
+
+    return paiements
@@ -0,0 +1,178 @@
+# gestion_produits_stock/factures_pdf.py
+
+import hashlib
+import io
+import os
+import tempfile
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Facture, LigneFacture, Paiement
+from .rendu_pdf import VERSION_GABARIT, rendre_facture_pdf
+
+# Factures en PDF avec un cache disque : un fichier par facture et par
+# contenu. L'empreinte couvre tout ce qui est imprimé (client, lignes,
+# paiements, totaux), donc un fichier en cache n'est jamais périmé ; une
+# facture modifiée obtient simplement une nouvelle empreinte.
+# La mise en page elle-même est dans rendu_pdf.py.
+
+REPERTOIRE_CACHE_PDF = Path(getattr(settings, 'FACTURES_PDF_CACHE', settings.BASE_DIR / 'cache_pdf' / 'factures'))
+
+
+def _client(client):
+    return {
+        'nom': client.nom,
+        'adresse': client.adresse or 'N/A',
+        'telephone': client.telephone or 'N/A',
+    }
+
+
+def _paiement(paiement):
+    return (
+        f"- {paiement.date_paiement.strftime('%d/%m/%Y')} : {paiement.montant_paye} FCFA "
+        f"({paiement.get_methode_paiement_display()})"
+    )
+
+
+def _donnees(facture, lignes, paiements):
+    return {
+        'id': facture.id,
+        'date': facture.date_facturation.strftime('%d/%m/%Y %H:%M'),
+        'client': _client(facture.client),
+        'lignes': [
+            [ligne.produit.nom, str(ligne.quantite), f"{ligne.prix_unitaire_negocie} FCFA", f"{ligne.total_ligne} FCFA"]
+            for ligne in lignes
+        ],
+        'paiements': [_paiement(paiement) for paiement in paiements],
+        'montant_total': str(facture.montant_total),
+        'total_paye': str(facture.montant_paye),
+        'solde_du': str(facture.solde),
+    }
+
+
+def donnees_facture(facture_id):
+    """
+    Tout ce qu'imprime la facture, en chaînes de caractères (sérialisable, donc
+    utilisable dans un autre processus), lu en trois requêtes : la facture et
+    son client, les lignes et leurs produits, les paiements.
+    Lève Facture.DoesNotExist.
+    """
+    facture = Facture.objects.select_related('client').get(pk=facture_id)
+    lignes = facture.lignes_facture.select_related('produit').order_by('pk')
+    paiements = Paiement.objects.filter(facture_id=facture_id).order_by('date_paiement', 'pk')
+    return _donnees(facture, lignes, paiements)
+
+
+def donnees_factures(factures):
+    """
+    Comme donnees_facture() pour un queryset de factures, en trois requêtes
+    quel que soit le nombre de factures. Retourne une liste, dans l'ordre des pk.
+    """
+    factures = factures.select_related('client').prefetch_related(
+        Prefetch('lignes_facture', queryset=LigneFacture.objects.select_related('produit').order_by('pk')),
+        Prefetch('paiement_set', queryset=Paiement.objects.order_by('date_paiement', 'pk')),
+    ).order_by('pk')
+    return [
+        _donnees(facture, facture.lignes_facture.all(), facture.paiement_set.all())
+        for facture in factures
+    ]
+
+
+def donnees_releves(clients):
+    """
+    Relevés de compte (les données de la page "Banque et Caisse") d'un
+    queryset de clients, en trois requêtes au total : clients, factures,
+    paiements. Retourne une liste dans l'ordre des noms.
+    """
+    clients = list(clients.order_by('nom', 'pk'))
+    factures = defaultdict(list)
+    for facture in Facture.objects.filter(client__in=clients).order_by('-date_facturation', '-pk'):
+        factures[facture.client_id].append(facture)
+    paiements = defaultdict(list)
+    for paiement in Paiement.objects.filter(facture__client__in=clients).select_related('facture').order_by('-date_paiement', '-pk'):
+        paiements[paiement.facture.client_id].append(paiement)
+
+    date = timezone.localdate().strftime('%d/%m/%Y')
+    releves = []
+    for client in clients:
+        total_factures = sum((f.montant_total for f in factures[client.pk]), Decimal('0.00'))
+        total_paiements = sum((f.montant_paye for f in factures[client.pk]), Decimal('0.00'))
+        releves.append({
+            'id': client.pk,
+            'date': date,
+            'client': _client(client),
+            'factures': [
+                [f"#{f.id}", f.date_facturation.strftime('%d/%m/%Y'), f"{f.montant_total} FCFA", f"{f.montant_paye} FCFA", f"{f.solde} FCFA"]
+                for f in factures[client.pk]
+            ],
+            'paiements': [f"{_paiement(p)} - Facture #{p.facture_id}" for p in paiements[client.pk]],
+            'total_factures': str(total_factures),
+            'total_paiements': str(total_paiements),
+            'solde_total': str(total_factures - total_paiements),
+        })
+    return releves
+
+
+def empreinte_facture(donnees):
+    contenu = repr((VERSION_GABARIT, sorted(donnees.items())))
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def chemin_pdf(facture_id, empreinte):
+    return REPERTOIRE_CACHE_PDF / f"facture_{facture_id}_{empreinte[:32]}.pdf"
+
+
+def ecrire_atomiquement(chemin, contenu):
+    """
+    Écrit un fichier via un fichier temporaire renommé : un lecteur concurrent
+    ne voit jamais un fichier partiel.
+    """
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=chemin.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descripteur, 'wb') as fichier:
+            fichier.write(contenu)
+        os.replace(temporaire, chemin)
+    except BaseException:
+        os.unlink(temporaire)
+        raise
+
+
+def mettre_en_cache(donnees, empreinte, contenu):
+    """
+    Range le PDF d'une facture dans le cache et supprime ses versions précédentes.
+    Une version encore lue par une autre requête (sous Windows, un fichier
+    ouvert ne peut pas être supprimé) est laissée : elle sera supprimée au
+    prochain rendu de la facture.
+    """
+    chemin = chemin_pdf(donnees['id'], empreinte)
+    ecrire_atomiquement(chemin, contenu)
+    for ancien in REPERTOIRE_CACHE_PDF.glob(f"facture_{donnees['id']}_*.pdf"):
+        if ancien != chemin:
+            try:
+                ancien.unlink(missing_ok=True)
+            except OSError:
+                pass
+    return chemin
+
+
+def ouvrir_pdf_facture(donnees, empreinte=None):
+    """
+    Ouvre le PDF en cache pour ces données (fichier binaire), en le rendant s'il
+    manque. Un fichier supprimé entre-temps par le rendu d'une version plus
+    récente n'est pas une erreur : le PDF est rendu à nouveau et servi depuis
+    la mémoire.
+    """
+    empreinte = empreinte or empreinte_facture(donnees)
+    try:
+        return open(chemin_pdf(donnees['id'], empreinte), 'rb')
+    except FileNotFoundError:
+        pass
+    contenu = rendre_facture_pdf(donnees)
+    mettre_en_cache(donnees, empreinte, contenu)
+    return io.BytesIO(contenu)
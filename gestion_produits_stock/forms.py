@@ -119,6 +119,18 @@ class StockForm(forms.ModelForm):
             'quantite': 'Quantité',
         }
 
+    def clean_quantite(self):
+        # Formulaire d'entrée : la quantité s'ajoute au stock, les sorties passent par les ventes et les mouvements
+        quantite = self.cleaned_data['quantite']
+        if quantite is not None and quantite <= 0:
+            raise forms.ValidationError("La quantité doit être supérieure à zéro.")
+        return quantite
+
+    def validate_unique(self):
+        # Une entrée s'ajoute à la ligne de stock existante (produit, lieu) :
+        # l'unicité ne doit pas la refuser
+        pass
+
 
 class StockMovementForm(forms.ModelForm):
     class Meta:
@@ -141,16 +153,74 @@ class FactureForm(forms.ModelForm):
             self.fields['date_echeance'].initial = timezone.now().date() + timezone.timedelta(days=30)
             
             
+class ChoixPrechargeField(forms.ModelChoiceField):
+    """
+    Choix d'un objet pouvant être résolu depuis un dictionnaire {pk: objet}
+    préchargé pour tout un formset, au lieu d'une requête par ligne.
+    """
+    objets_precharges = None
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if self.objets_precharges is not None:
+            try:
+                return self.objets_precharges[int(value)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_python(value)
+
+
 class LigneFactureForm(forms.ModelForm):
     class Meta:
         model = LigneFacture
         fields = ['produit', 'quantite', 'prix_unitaire_negocie']
+        field_classes = {'produit': ChoixPrechargeField}
         widgets = {
             'produit': forms.Select(attrs={'class': 'form-control produit-select'}),
             'quantite': forms.NumberInput(attrs={'class': 'form-control quantite-input', 'min': '0', 'step': '0.01'}),
             'prix_unitaire_negocie': forms.NumberInput(attrs={'class': 'form-control prix-input', 'min': '0', 'step': '0.01'}),
         }
 
+    def _get_validation_exclusions(self):
+        exclusions = super()._get_validation_exclusions()
+        # Un produit préchargé existe déjà : inutile que le modèle revérifie la clé étrangère
+        if self.fields['produit'].objets_precharges is not None:
+            exclusions.add('produit')
+        return exclusions
+
+
+class BaseLigneFactureFormSet(forms.BaseInlineFormSet):
+    """
+    Formset des lignes de facture : les produits de toutes les lignes sont
+    chargés en une requête avant la validation, et les lignes existantes sont
+    reprises du queryset du formset.
+    """
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        champ = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = ChoixPrechargeField(
+            champ.queryset, initial=champ.initial, required=False, widget=champ.widget
+        )
+
+    def full_clean(self):
+        if self.is_bound:
+            self._precharger()
+        super().full_clean()
+
+    def _precharger(self):
+        ids = set()
+        for form in self.forms:
+            valeur = self.data.get(form.add_prefix('produit'))
+            if valeur and str(valeur).isdigit():
+                ids.add(int(valeur))
+        produits = Produit.objects.in_bulk(ids)
+        lignes = {ligne.pk: ligne for ligne in self.get_queryset()}
+        for form in self.forms:
+            form.fields['produit'].objets_precharges = produits
+            form.fields[self._pk_field.name].objets_precharges = lignes
+
 
 class PaiementForm(forms.ModelForm):
     class Meta:
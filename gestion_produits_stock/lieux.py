@@ -0,0 +1,73 @@
+# gestion_produits_stock/lieux.py
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import LieuStockage
+from .routage import lecture_principale
+
+# Lieu de stockage dont les ventes sont décomptées, et surcharges par caisse :
+# LIEUX_VENTE_PAR_CAISSE = {'caisse-depot': 'Dépôt'}
+LIEU_VENTE_PAR_DEFAUT = getattr(settings, 'LIEU_VENTE_PAR_DEFAUT', 'Principal')
+LIEUX_VENTE_PAR_CAISSE = getattr(settings, 'LIEUX_VENTE_PAR_CAISSE', {})
+CAISSE_COOKIE = 'caisse'
+
+# Nom du lieu -> clé primaire, dans le cache partagé par les processus serveur
+# (vidé à chaque écriture sur LieuStockage ; la durée est un filet de sécurité)
+DUREE_CACHE_LIEUX = 3600
+
+
+def _cle_cache(nom):
+    # Noms avec espaces ou accents : clé sûre pour tous les backends de cache
+    return f"lieux:id:{hashlib.md5(nom.encode('utf-8')).hexdigest()}"
+
+
+def id_lieu(nom):
+    """
+    Retourne la clé primaire du lieu de stockage 'nom' (None s'il n'existe pas),
+    sans requête SQL après le premier appel.
+    """
+    cle = _cle_cache(nom)
+    pk = cache.get(cle)
+    if pk is None:
+        # Mis en cache pour tous les processus : lu sur la base principale
+        with lecture_principale():
+            pk = LieuStockage.objects.filter(nom=nom).values_list('pk', flat=True).first()
+        if pk is not None:
+            cache.set(cle, pk, DUREE_CACHE_LIEUX)
+    return pk
+
+
+def invalider_cache_lieux():
+    """
+    Oublie les lieux de vente configurés (seuls noms résolus par id_lieu),
+    aussitôt puis de nouveau après le commit : une requête concurrente qui
+    aurait remis l'ancien lieu en cache entre-temps est ainsi corrigée.
+    """
+    cles = [_cle_cache(nom) for nom in {LIEU_VENTE_PAR_DEFAUT, *LIEUX_VENTE_PAR_CAISSE.values()}]
+    cache.delete_many(cles)
+    transaction.on_commit(lambda: cache.delete_many(cles))
+
+
+def caisse_de_la_requete(request):
+    """
+    Identifiant de la caisse : en-tête X-Caisse (client bureau) ou cookie 'caisse' (navigateur).
+    """
+    if request is None:
+        return None
+    return request.headers.get('X-Caisse') or request.COOKIES.get(CAISSE_COOKIE)
+
+
+def nom_lieu_vente(request=None):
+    return LIEUX_VENTE_PAR_CAISSE.get(caisse_de_la_requete(request), LIEU_VENTE_PAR_DEFAUT)
+
+
+def id_lieu_vente(request=None):
+    """
+    Clé primaire du lieu de vente de la caisse à l'origine de la requête
+    (ou du lieu de vente par défaut).
+    """
+    return id_lieu(nom_lieu_vente(request))
@@ -0,0 +1,302 @@
+# gestion_produits_stock/lots_pdf.py
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .factures_pdf import (
+    chemin_pdf, donnees_factures, donnees_releves, empreinte_facture, mettre_en_cache
+)
+from .models import Client, TravailPDF
+from .rapports import factures_de_la_periode
+from .rendu_pdf import rendre_document, rendre_documents_fusionnes
+
+# PDF par lots (fin de mois : toutes les factures d'une période, relevés de
+# compte des clients), hors des requêtes web. Les données sont lues en
+# quelques requêtes groupées, puis les documents sont rendus en parallèle par
+# un pool de processus (le rendu ReportLab est du pur calcul Python, limité
+# à un cœur par processus) et rangés dans un ZIP ou fusionnés en un seul PDF.
+# L'avancement est enregistré sur le TravailPDF, consultable pendant le rendu.
+
+REPERTOIRE_LOTS_PDF = Path(getattr(settings, 'LOTS_PDF_REPERTOIRE', settings.BASE_DIR / 'cache_pdf' / 'lots'))
+# Nombre de processus de rendu (None : un par cœur)
+LOTS_PDF_PROCESSUS = getattr(settings, 'LOTS_PDF_PROCESSUS', None)
+# Exécuter les travaux demandés depuis le web dans un fil du serveur ; par
+# défaut ils restent en attente pour 'manage.py generer_pdf_lot --surveiller'
+LOTS_PDF_EN_ARRIERE_PLAN = getattr(settings, 'LOTS_PDF_EN_ARRIERE_PLAN', False)
+# Secondes sans signe de vie après lesquelles un travail EN_COURS est tenu
+# pour abandonné (exécutant arrêté) et remis en attente
+LOTS_PDF_DELAI_ABANDON = getattr(settings, 'LOTS_PDF_DELAI_ABANDON', 600)
+
+# Signe de vie de l'exécutant 'generer_pdf_lot --surveiller', dans le cache
+# partagé : sans exécutant actif, les lots demandés depuis le web sont refusés
+CLE_EXECUTANT = 'lots_pdf:executant'
+
+# Documents rendus entre deux mises à jour de l'avancement
+PAS_PROGRESSION = 20
+# En dessous, rendu dans le processus courant : démarrer les processus
+# (import de ReportLab compris) coûte plus que quelques dizaines de factures
+NB_DOCUMENTS_MIN_POOL = 100
+
+# Un seul travail à la fois par processus web : chacun occupe déjà tous les cœurs
+_executeur = None
+
+
+def creer_travail(type_document, format_sortie='zip', du=None, au=None, clients=None):
+    """
+    Valide et enregistre un travail en attente. 'du' et 'au' (dates ou
+    chaînes ISO) bornent les factures, le mois en cours par défaut ; 'clients'
+    restreint les relevés (par défaut : tous les clients ayant une facture).
+    Lève ValidationError.
+    """
+    if type_document not in dict(TravailPDF.DOCUMENT_CHOICES):
+        raise ValidationError("Type de document inconnu, attendu : factures ou releves.")
+    if format_sortie not in dict(TravailPDF.FORMAT_CHOICES):
+        raise ValidationError("Format inconnu, attendu : zip ou pdf.")
+
+    parametres = {}
+    if type_document == 'factures':
+        try:
+            au = (parse_date(au) if isinstance(au, str) else au) or timezone.localdate()
+            du = (parse_date(du) if isinstance(du, str) else du) or au.replace(day=1)
+        except ValueError:
+            raise ValidationError("Date invalide (format AAAA-MM-JJ).")
+        if au < du:
+            du, au = au, du
+        parametres = {'du': du.isoformat(), 'au': au.isoformat()}
+    elif clients:
+        try:
+            parametres = {'clients': sorted({int(pk) for pk in clients})}
+        except (TypeError, ValueError):
+            raise ValidationError("Identifiants de clients invalides.")
+    return TravailPDF.objects.create(
+        type_document=type_document, format_sortie=format_sortie, parametres=parametres,
+    )
+
+
+def documents_du_travail(travail):
+    """
+    Liste des documents (type, données) du travail, lus en trois requêtes.
+    """
+    if travail.type_document == 'factures':
+        factures = factures_de_la_periode(
+            parse_date(travail.parametres['du']), parse_date(travail.parametres['au'])
+        )
+        return [('facture', donnees) for donnees in donnees_factures(factures)]
+    clients = Client.objects.all()
+    if travail.parametres.get('clients'):
+        clients = clients.filter(pk__in=travail.parametres['clients'])
+    else:
+        clients = clients.filter(facture__isnull=False).distinct()
+    return [('releve', donnees) for donnees in donnees_releves(clients)]
+
+
+def _nom_fichier(type_document, donnees):
+    if type_document == 'facture':
+        return f"facture_{donnees['id']}.pdf"
+    return f"releve_client_{donnees['id']}.pdf"
+
+
+def _rendus(documents, processus):
+    """
+    Produit les PDF des documents, dans l'ordre. Les factures déjà dans le
+    cache disque sont relues ; les autres sont rendues par le pool de
+    processus et ajoutées au cache.
+    """
+    empreintes = [empreinte_facture(d) if t == 'facture' else None for t, d in documents]
+    en_cache = [
+        empreinte is not None and chemin_pdf(donnees['id'], empreinte).exists()
+        for (_, donnees), empreinte in zip(documents, empreintes)
+    ]
+    a_rendre = [document for document, present in zip(documents, en_cache) if not present]
+
+    if processus > 1 and len(a_rendre) >= NB_DOCUMENTS_MIN_POOL:
+        # 'spawn' : les processus de rendu n'héritent ni des connexions à la
+        # base ni des fils du serveur, et le comportement est celui de Windows
+        pool = ProcessPoolExecutor(
+            max_workers=min(processus, len(a_rendre)), mp_context=multiprocessing.get_context('spawn'),
+        )
+        taille_paquet = max(1, min(PAS_PROGRESSION, len(a_rendre) // (processus * 4)))
+        nouveaux = pool.map(rendre_document, a_rendre, chunksize=taille_paquet)
+    else:
+        pool = None
+        nouveaux = map(rendre_document, a_rendre)
+
+    try:
+        for document, empreinte, present in zip(documents, empreintes, en_cache):
+            donnees = document[1]
+            if present:
+                try:
+                    contenu = chemin_pdf(donnees['id'], empreinte).read_bytes()
+                except FileNotFoundError:
+                    # Remplacé entre-temps par une version plus récente : rendu ici
+                    contenu = rendre_document(document)
+            else:
+                contenu = next(nouveaux)
+                if empreinte is not None:
+                    mettre_en_cache(donnees, empreinte, contenu)
+            yield contenu
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def remettre_en_attente_abandonnes(delai=None):
+    """
+    Remet en attente les travaux EN_COURS sans signe de vie depuis 'delai'
+    secondes (LOTS_PDF_DELAI_ABANDON par défaut) : leur exécutant a été
+    arrêté en plein rendu (redémarrage du serveur, poste éteint). Ils seront
+    repris depuis le début. Retourne le nombre de travaux remis en attente.
+    """
+    limite = timezone.now() - timedelta(seconds=LOTS_PDF_DELAI_ABANDON if delai is None else delai)
+    # Travaux pris avant l'ajout de la date d'activité : date de création
+    return TravailPDF.objects.filter(
+        Q(date_activite__lt=limite) | Q(date_activite__isnull=True, date_creation__lt=limite),
+        statut='EN_COURS',
+    ).update(
+        statut='EN_ATTENTE', nb_faits=0, date_activite=None,
+    )
+
+
+class _SigneDeVie(threading.Thread):
+    """
+    Fil qui rafraîchit la date d'activité du travail pendant le rendu, même
+    quand l'avancement ne bouge pas (PDF fusionné rendu d'un bloc).
+    """
+
+    def __init__(self, travail_id):
+        super().__init__(name=f'lots_pdf_{travail_id}', daemon=True)
+        self.travail_id = travail_id
+        self.arret = threading.Event()
+
+    def run(self):
+        try:
+            while not self.arret.wait(LOTS_PDF_DELAI_ABANDON / 4):
+                TravailPDF.objects.filter(pk=self.travail_id, statut='EN_COURS').update(
+                    date_activite=timezone.now(),
+                )
+        finally:
+            connection.close()
+
+
+def executer_travail(travail_id, processus=None, rappel=None):
+    """
+    Exécute un travail en attente. Retourne le TravailPDF à jour, ou None si
+    le travail n'est plus en attente (déjà pris par un autre exécutant).
+    'rappel(travail)' est appelé à chaque mise à jour de l'avancement.
+    Une erreur de rendu est enregistrée sur le travail (statut ECHEC) puis relevée.
+    """
+    if not TravailPDF.objects.filter(pk=travail_id, statut='EN_ATTENTE').update(
+        statut='EN_COURS', date_activite=timezone.now(),
+    ):
+        return None
+    travail = TravailPDF.objects.get(pk=travail_id)
+    processus = processus or LOTS_PDF_PROCESSUS or os.cpu_count() or 1
+
+    def avancer(nb_faits):
+        if nb_faits == travail.nb_faits:
+            return
+        travail.nb_faits = nb_faits
+        TravailPDF.objects.filter(pk=travail.pk).update(nb_faits=nb_faits, date_activite=timezone.now())
+        if rappel:
+            rappel(travail)
+
+    signe_de_vie = _SigneDeVie(travail.pk)
+    signe_de_vie.start()
+    try:
+        documents = documents_du_travail(travail)
+        travail.nb_total = len(documents)
+        TravailPDF.objects.filter(pk=travail.pk).update(nb_total=travail.nb_total)
+
+        nom = f"lot_{travail.pk}_{travail.type_document}.{travail.format_sortie}"
+        REPERTOIRE_LOTS_PDF.mkdir(parents=True, exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(dir=REPERTOIRE_LOTS_PDF, suffix='.tmp')
+        try:
+            with os.fdopen(descripteur, 'wb') as sortie:
+                if travail.format_sortie == 'pdf':
+                    # Un seul document ReportLab : rendu d'un bloc, dans ce processus
+                    sortie.write(rendre_documents_fusionnes(documents))
+                    avancer(len(documents))
+                else:
+                    with zipfile.ZipFile(sortie, 'w', zipfile.ZIP_DEFLATED) as archive:
+                        for nb, ((type_document, donnees), contenu) in enumerate(
+                            zip(documents, _rendus(documents, processus)), start=1
+                        ):
+                            archive.writestr(_nom_fichier(type_document, donnees), contenu)
+                            if nb % PAS_PROGRESSION == 0:
+                                avancer(nb)
+                        avancer(len(documents))
+            os.replace(temporaire, REPERTOIRE_LOTS_PDF / nom)
+        except BaseException:
+            os.unlink(temporaire)
+            raise
+    except Exception as e:
+        TravailPDF.objects.filter(pk=travail.pk).update(
+            statut='ECHEC', erreur=str(e) or e.__class__.__name__, date_fin=timezone.now(),
+        )
+        raise
+    finally:
+        signe_de_vie.arret.set()
+        signe_de_vie.join()
+
+    travail.statut, travail.fichier, travail.date_fin = 'TERMINE', nom, timezone.now()
+    travail.save(update_fields=['statut', 'fichier', 'date_fin'])
+    return travail
+
+
+def signaler_executant(duree):
+    """
+    Annonce qu'un exécutant des lots en attente est actif pour 'duree' secondes.
+    """
+    cache.set(CLE_EXECUTANT, True, duree)
+
+
+def executant_disponible():
+    """
+    Vrai si un lot demandé maintenant sera exécuté : par un fil du serveur
+    (LOTS_PDF_EN_ARRIERE_PLAN) ou par un exécutant 'generer_pdf_lot --surveiller' actif.
+    """
+    return LOTS_PDF_EN_ARRIERE_PLAN or bool(cache.get(CLE_EXECUTANT))
+
+
+def chemin_fichier(travail):
+    return REPERTOIRE_LOTS_PDF / travail.fichier
+
+
+def _executer_en_arriere_plan(travail_id):
+    try:
+        executer_travail(travail_id)
+    except Exception:
+        # Déjà enregistrée sur le travail (statut ECHEC)
+        pass
+    finally:
+        # Ce fil n'est pas géré par le cycle requête/réponse de Django
+        connection.close()
+
+
+def lancer_travail(travail):
+    """
+    Confie le travail au fil d'arrière-plan du serveur, une fois la transaction
+    courante validée, si LOTS_PDF_EN_ARRIERE_PLAN est activé. Par défaut le
+    travail reste en attente : 'manage.py generer_pdf_lot --surveiller', hors
+    des processus web, l'exécute.
+    """
+    global _executeur
+    if not LOTS_PDF_EN_ARRIERE_PLAN:
+        return
+    if _executeur is None:
+        _executeur = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lots_pdf')
+    transaction.on_commit(lambda: _executeur.submit(_executer_en_arriere_plan, travail.pk))
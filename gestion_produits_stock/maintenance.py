@@ -0,0 +1,67 @@
+# gestion_produits_stock/maintenance.py
+
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+# Entretien de la base SQLite (sans effet sur les autres bases) :
+#   - wal_checkpoint(TRUNCATE) reporte le journal WAL dans la base et le
+#     ramène à zéro (sinon il grossit tant qu'un lecteur reste ouvert) ;
+#   - PRAGMA optimize met à jour les statistiques du planificateur quand
+#     elles sont périmées ; ANALYZE les recalcule toutes (plus long).
+
+SQLITE_MAINTENANCE_INTERVALLE = getattr(settings, 'SQLITE_MAINTENANCE_INTERVALLE', 3600)
+
+logger = logging.getLogger(__name__)
+
+
+def maintenance_sqlite(analyser=False, using='default'):
+    """
+    Point de contrôle du WAL puis optimisation des statistiques (ANALYZE
+    complet si 'analyser'). Retourne {'taille_wal': octets avant le point de
+    contrôle, 'bloque': une connexion ouverte a empêché de tout reporter
+    (réessayé au prochain passage)}, ou None si la base n'est pas SQLite.
+    """
+    connexion = connections[using]
+    if connexion.vendor != 'sqlite':
+        return None
+    chemin_wal = f"{connexion.settings_dict['NAME']}-wal"
+    taille_wal = os.path.getsize(chemin_wal) if os.path.exists(chemin_wal) else 0
+    with connexion.cursor() as cursor:
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        bloque = cursor.fetchone()[0]
+        if analyser:
+            cursor.execute("ANALYZE")
+        cursor.execute("PRAGMA optimize")
+    return {'taille_wal': taille_wal, 'bloque': bool(bloque)}
+
+
+def demarrer_maintenance_periodique(intervalle=SQLITE_MAINTENANCE_INTERVALLE):
+    """
+    Lance maintenance_sqlite() toutes les 'intervalle' secondes dans un fil
+    du serveur. Retourne l'événement qui l'arrête, ou None si désactivée.
+    """
+    if not intervalle or connections['default'].vendor != 'sqlite':
+        return None
+    arret = threading.Event()
+
+    def boucle():
+        while not arret.wait(intervalle):
+            try:
+                resultat = maintenance_sqlite()
+                if resultat and resultat['bloque']:
+                    logger.warning(
+                        "Point de contrôle du WAL incomplet (%s octets) : une connexion reste ouverte.",
+                        resultat['taille_wal'],
+                    )
+            except Exception:
+                # Trace complète dans les journaux du serveur ; le fil continue
+                logger.exception("Maintenance de la base impossible")
+            finally:
+                connections.close_all()
+
+    threading.Thread(target=boucle, name='maintenance_sqlite', daemon=True).start()
+    return arret
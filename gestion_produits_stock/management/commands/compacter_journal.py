@@ -0,0 +1,16 @@
+# gestion_produits_stock/management/commands/compacter_journal.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_produits_stock.synchronisation import compacter_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Réduit le journal de synchronisation à une entrée par objet (la plus récente). "
+        "Sans effet sur les clients : à lancer périodiquement (tâche planifiée)."
+    )
+
+    def handle(self, *args, **options):
+        nb = compacter_journal()
+        self.stdout.write(self.style.SUCCESS(f"{nb} entrée(s) remplacée(s) supprimée(s) du journal."))
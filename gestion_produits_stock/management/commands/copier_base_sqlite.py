@@ -0,0 +1,120 @@
+# gestion_produits_stock/management/commands/copier_base_sqlite.py
+
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+ALIAS_SOURCE = 'source_sqlite'
+
+
+class Command(BaseCommand):
+    help = (
+        "Copie en masse toutes les données d'un fichier SQLite (db.sqlite3 par défaut) "
+        "dans la base configurée (PostgreSQL, voir DATABASE_URL), en une transaction. "
+        "La base cible doit être migrée ('manage.py migrate') ; son contenu est remplacé."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=str(settings.BASE_DIR / 'db.sqlite3'),
+            help="Fichier SQLite à copier.",
+        )
+        parser.add_argument(
+            '--taille-lot', type=int, default=2000,
+            help="Lignes lues et insérées par aller-retour.",
+        )
+        parser.add_argument(
+            '--remplacer', action='store_true',
+            help="Accepter une base cible qui contient déjà des données de l'application.",
+        )
+
+    def handle(self, *args, **options):
+        cible = connections[DEFAULT_DB_ALIAS]
+        if cible.vendor == 'sqlite' and str(cible.settings_dict['NAME']) == options['source']:
+            raise CommandError("La base cible est le fichier source : définir DATABASE_URL.")
+        source = self._ouvrir_source(options['source'])
+
+        # Mêmes colonnes des deux côtés : les deux bases doivent être à jour
+        for connexion, conseil in (
+            (source, "lancer 'manage.py migrate' sans DATABASE_URL"),
+            (cible, "lancer 'manage.py migrate'"),
+        ):
+            executeur = MigrationExecutor(connexion)
+            if executeur.migration_plan(executeur.loader.graph.leaf_nodes()):
+                raise CommandError(f"La base {connexion.settings_dict['NAME']} n'est pas à jour : {conseil}.")
+
+        modeles = [
+            modele for modele in apps.get_models(include_auto_created=True)
+            if modele._meta.managed and not modele._meta.proxy
+        ]
+        if not options['remplacer'] and any(
+            modele._base_manager.using(DEFAULT_DB_ALIAS).exists()
+            for modele in apps.get_app_config('gestion_produits_stock').get_models()
+        ):
+            raise CommandError("La base cible contient déjà des données : relancer avec --remplacer.")
+
+        debut = time.perf_counter()
+        # Une transaction : sur PostgreSQL les clés étrangères sont vérifiées à
+        # la validation (contraintes différées), l'ordre des tables est donc libre
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            with cible.cursor() as cursor:
+                # Tables remplies par 'migrate' (types de contenu, permissions) comprises
+                tables = [modele._meta.db_table for modele in modeles]
+                for sql in cible.ops.sql_flush(no_style(), tables, allow_cascade=True):
+                    cursor.execute(sql)
+
+                for modele in modeles:
+                    nb = self._copier_table(modele, cursor, cible, options['taille_lot'])
+                    self.stdout.write(f"{modele._meta.db_table} : {nb} ligne(s)")
+
+                # Les séquences des clés primaires reprennent après les identifiants copiés
+                for sql in cible.ops.sequence_reset_sql(no_style(), modeles):
+                    cursor.execute(sql)
+
+        source.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(modeles)} table(s) copiée(s) en {time.perf_counter() - debut:.1f} s."
+        ))
+
+    def _ouvrir_source(self, chemin):
+        # Alias ajouté à la volée, avec les valeurs par défaut de Django
+        reglages = connections.configure_settings({
+            DEFAULT_DB_ALIAS: dict(settings.DATABASES[DEFAULT_DB_ALIAS]),
+            ALIAS_SOURCE: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': chemin},
+        })
+        connections.settings[ALIAS_SOURCE] = reglages[ALIAS_SOURCE]
+        return connections[ALIAS_SOURCE]
+
+    def _copier_table(self, modele, cursor, cible, taille_lot):
+        """
+        Copie les lignes d'un modèle par lots d'INSERT multiples. Les valeurs
+        passent par les champs Django (décimaux, dates, JSON convertis d'une
+        base à l'autre) mais pas par save() ni bulk_create() : ni signaux, ni
+        dates auto_now réécrites, ni totaux recalculés.
+        """
+        champs = modele._meta.concrete_fields
+        qn = cible.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(modele._meta.db_table)} ({', '.join(qn(champ.column) for champ in champs)}) "
+            f"VALUES ({', '.join(['%s'] * len(champs))})"
+        )
+        lignes = (
+            modele._base_manager.using(ALIAS_SOURCE)
+            .order_by('pk')
+            .values_list(*[champ.attname for champ in champs])
+            .iterator(chunk_size=taille_lot)
+        )
+        nb = 0
+        while lot := list(islice(lignes, taille_lot)):
+            cursor.executemany(sql, [
+                [champ.get_db_prep_save(valeur, connection=cible) for champ, valeur in zip(champs, ligne)]
+                for ligne in lot
+            ])
+            nb += len(lot)
+        return nb
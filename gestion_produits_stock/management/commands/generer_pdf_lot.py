@@ -0,0 +1,125 @@
+# gestion_produits_stock/management/commands/generer_pdf_lot.py
+
+import shutil
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gestion_produits_stock.lots_pdf import (
+    chemin_fichier, creer_travail, executer_travail, remettre_en_attente_abandonnes, signaler_executant
+)
+from gestion_produits_stock.models import TravailPDF
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère en parallèle les PDF des factures d'une période (mois en cours par défaut) "
+        "ou les relevés de compte des clients, dans un ZIP ou un seul PDF. "
+        "Avec --en-attente, exécute les lots demandés depuis l'interface web ; avec "
+        "--surveiller, les exécute au fil de l'eau (à lancer comme service)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--du', help="Première date de facturation (AAAA-MM-JJ).")
+        parser.add_argument('--au', help="Dernière date de facturation (AAAA-MM-JJ).")
+        parser.add_argument(
+            '--releves', action='store_true',
+            help="Relevés de compte des clients au lieu des factures.",
+        )
+        parser.add_argument(
+            '--clients', type=int, nargs='+', metavar='ID',
+            help="Clients des relevés (par défaut : tous les clients ayant une facture).",
+        )
+        parser.add_argument('--format', choices=['zip', 'pdf'], default='zip')
+        parser.add_argument(
+            '--processus', type=int,
+            help="Nombre de processus de rendu (par défaut : LOTS_PDF_PROCESSUS, sinon un par cœur).",
+        )
+        parser.add_argument('--sortie', help="Copier le fichier produit vers ce chemin.")
+        parser.add_argument(
+            '--en-attente', action='store_true',
+            help="Exécuter les lots en attente au lieu d'en créer un.",
+        )
+        parser.add_argument(
+            '--surveiller', action='store_true',
+            help="Exécuter les lots en attente en continu, jusqu'à interruption (Ctrl+C).",
+        )
+        parser.add_argument(
+            '--intervalle', type=float, default=5,
+            help="Secondes entre deux recherches de lots en attente (avec --surveiller).",
+        )
+
+    def handle(self, *args, **options):
+        if options['surveiller']:
+            self.stdout.write("Surveillance des lots en attente (Ctrl+C pour arrêter).")
+            self._signaler_en_continu(options['intervalle'])
+            try:
+                while True:
+                    self._executer_en_attente(options['processus'], arreter_sur_echec=False)
+                    # Pas de connexion gardée ouverte pendant l'attente
+                    connection.close()
+                    time.sleep(options['intervalle'])
+            except KeyboardInterrupt:
+                return
+        if options['en_attente']:
+            nb = self._executer_en_attente(options['processus'])
+            self.stdout.write(self.style.SUCCESS(f"{nb} lot(s) en attente traité(s)."))
+            return
+
+        try:
+            travail = creer_travail(
+                'releves' if options['releves'] else 'factures', options['format'],
+                du=options['du'], au=options['au'], clients=options['clients'],
+            )
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        travail = self._executer(travail.pk, options['processus'])
+        if travail and options['sortie']:
+            shutil.copyfile(chemin_fichier(travail), options['sortie'])
+            self.stdout.write(f"Copié vers {options['sortie']}")
+
+    def _signaler_en_continu(self, intervalle):
+        # Signe de vie pour le serveur web (lots_pdf.executant_disponible),
+        # entretenu par un fil : il reste valable pendant le rendu d'un long lot
+        duree = max(30, 3 * intervalle)
+
+        def boucle():
+            while True:
+                signaler_executant(duree)
+                time.sleep(duree / 3)
+
+        threading.Thread(target=boucle, name='lots_pdf_executant', daemon=True).start()
+
+    def _executer_en_attente(self, processus, arreter_sur_echec=True):
+        # Les lots dont l'exécutant a disparu en plein rendu sont repris
+        nb = remettre_en_attente_abandonnes()
+        if nb:
+            self.stdout.write(f"{nb} lot(s) abandonné(s) remis en attente.")
+        travaux = list(TravailPDF.objects.filter(statut='EN_ATTENTE').order_by('pk').values_list('pk', flat=True))
+        for travail_id in travaux:
+            try:
+                self._executer(travail_id, processus)
+            except CommandError as e:
+                if arreter_sur_echec:
+                    raise
+                self.stderr.write(str(e))
+        return len(travaux)
+
+    def _executer(self, travail_id, processus):
+        def afficher(travail):
+            self.stdout.write(f"Lot #{travail.pk} : {travail.nb_faits}/{travail.nb_total}")
+
+        try:
+            travail = executer_travail(travail_id, processus, rappel=afficher)
+        except Exception as e:
+            raise CommandError(f"Lot #{travail_id} en échec : {e}")
+        if travail is None:
+            self.stdout.write(f"Lot #{travail_id} déjà pris en charge ailleurs.")
+            return None
+        self.stdout.write(self.style.SUCCESS(
+            f"Lot #{travail.pk} : {travail.nb_total} document(s) dans {chemin_fichier(travail)}"
+        ))
+        return travail
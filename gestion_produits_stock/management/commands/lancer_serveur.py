@@ -1,12 +1,20 @@
 # gestion_produits_stock/management/commands/lancer_serveur.py
 
 from django.core.management.base import BaseCommand
-from django.core.management.commands.runserver import Command as RunserverCommand
 from io import StringIO
 import sys
 
+from gestion_produits_stock.serveur import servir
+
 class Command(BaseCommand):
-    help = "Lancement sécurisé du serveur en mode exécutable."
+    help = "Lancement sécurisé du serveur en mode exécutable (serveur de production multi-fils)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hote', help="Adresse d'écoute (par défaut : SERVEUR_HOTE).")
+        parser.add_argument('--port', type=int, help="Port (par défaut : SERVEUR_PORT).")
+        parser.add_argument('--fils', type=int, help="Requêtes traitées simultanément (par défaut : SERVEUR_FILS).")
+        parser.add_argument('--asgi', action='store_true', help="Servir eisf/asgi.py avec uvicorn.")
+        parser.add_argument('--processus', type=int, help="Processus uvicorn en mode ASGI.")
 
     def handle(self, *args, **options):
         # Création d'un flux de sortie temporaire pour éviter l'erreur de console
@@ -20,11 +28,13 @@ class Command(BaseCommand):
         sys.stderr = stdout_temp
         
         try:
-            # Crée une instance de la commande runserver standard
-            runserver_command = RunserverCommand(stdout=stdout_temp, stderr=stdout_temp)
-            # Exécute la commande avec les options nécessaires
-            runserver_command.run(addr='0.0.0.0', port='8000', use_reloader=False)
+            servir(
+                options['hote'], options['port'], options['fils'], options['processus'],
+                asgi=options['asgi'], sortie=lambda message: stdout_temp.write(message + '\n'),
+            )
+        except KeyboardInterrupt:
+            pass
         finally:
             # Restauration de la sortie standard
             sys.stdout = original_stdout
-            sys.stderr = original_stderr
\ No newline at end of file
+            sys.stderr = original_stderr
@@ -0,0 +1,29 @@
+# gestion_produits_stock/management/commands/maintenance_base.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_produits_stock.maintenance import maintenance_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        "Entretien de la base SQLite : point de contrôle du journal WAL et mise à jour "
+        "des statistiques du planificateur. À planifier (le serveur le fait aussi toutes les heures)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyser', action='store_true',
+            help="Recalculer toutes les statistiques (ANALYZE), par exemple une fois par semaine.",
+        )
+
+    def handle(self, *args, **options):
+        resultat = maintenance_sqlite(analyser=options['analyser'])
+        if resultat is None:
+            self.stdout.write("La base n'est pas SQLite : rien à faire.")
+            return
+        self.stdout.write(
+            f"Journal WAL : {resultat['taille_wal'] // 1024} Ko reporté(s) dans la base"
+            + (" (partiellement : une connexion est encore ouverte)" if resultat['bloque'] else "")
+        )
+        self.stdout.write(self.style.SUCCESS("Maintenance terminée."))
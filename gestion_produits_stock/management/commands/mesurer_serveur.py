@@ -0,0 +1,155 @@
+# gestion_produits_stock/management/commands/mesurer_serveur.py
+
+import http.client
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from gestion_produits_stock.models import Facture, Produit
+
+# Serveur lancé dans un processus à part, comme en production. Le cache des PDF
+# est redirigé vers un dossier vidé avant chaque demande : chaque facture est
+# réellement rendue.
+SCRIPT_SERVEUR = """
+import sys
+import django
+from django.conf import settings
+serveur, port, cache_pdf = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+settings.FACTURES_PDF_CACHE = cache_pdf
+django.setup()
+if serveur == 'wsgiref':
+    from wsgiref.simple_server import make_server, WSGIRequestHandler
+    from eisf.wsgi import application
+    class Silencieux(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+    make_server('127.0.0.1', port, application, handler_class=Silencieux).serve_forever()
+else:
+    from gestion_produits_stock.serveur import servir_asgi, servir_wsgi
+    servir = servir_asgi if serveur == 'uvicorn' else servir_wsgi
+    servir('127.0.0.1', port, sortie=lambda message: None)
+"""
+
+
+def _port_libre():
+    with socket.socket() as prise:
+        prise.bind(('127.0.0.1', 0))
+        return prise.getsockname()[1]
+
+
+def _centile(valeurs, centile):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * centile / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le serveur de caisse : des clients interrogent le stock en continu "
+        "(connexions persistantes) pendant qu'un autre client fait rendre des factures PDF. "
+        "Affiche les requêtes de stock par seconde, le 95e centile et le pire temps de réponse. "
+        "À lancer pour chaque serveur (--serveur wsgiref|waitress|uvicorn) sur la même base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--serveur', choices=['wsgiref', 'waitress', 'uvicorn'], default='waitress')
+        parser.add_argument('--clients', type=int, default=8, help="Clients qui interrogent le stock.")
+        parser.add_argument('--duree', type=float, default=8, help="Durée de la mesure (s).")
+        parser.add_argument(
+            '--facture', type=int,
+            help="Facture rendue en PDF (par défaut : celle qui a le plus de lignes).",
+        )
+        parser.add_argument('--port', type=int, help="Port d'écoute (par défaut : un port libre).")
+
+    def handle(self, *args, **options):
+        produit_ids = list(Produit.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        facture_id = options['facture'] or (
+            Facture.objects.annotate(nb_lignes=Count('lignes_facture'))
+            .order_by('-nb_lignes').values_list('pk', flat=True).first()
+        )
+        if not produit_ids or not facture_id:
+            raise CommandError("La base doit contenir au moins un produit et une facture.")
+
+        port = options['port'] or _port_libre()
+        cache_pdf = tempfile.mkdtemp(prefix='mesure_pdf_')
+        serveur = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT_SERVEUR, options['serveur'], str(port), cache_pdf],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self._attendre(port, serveur)
+            durees, nb_pdf = self._mesurer(
+                port, options['clients'], options['duree'],
+                f"/stocks-produits-ajax/?ids={','.join(map(str, produit_ids))}",
+                f"/factures/generer-pdf/{facture_id}/", cache_pdf,
+            )
+        finally:
+            serveur.terminate()
+            serveur.wait()
+            shutil.rmtree(cache_pdf, ignore_errors=True)
+
+        if not durees:
+            raise CommandError("Aucune requête de stock n'a abouti.")
+        self.stdout.write(
+            f"{options['serveur']} : {len(durees) / options['duree']:.0f} req/s, "
+            f"p95 {_centile(durees, 95) * 1000:.0f} ms, max {max(durees) * 1000:.0f} ms "
+            f"({options['clients']} clients, {nb_pdf} PDF de la facture {facture_id} rendus)"
+        )
+
+    def _attendre(self, port, serveur, delai=30):
+        limite = time.monotonic() + delai
+        while time.monotonic() < limite:
+            if serveur.poll() is not None:
+                raise CommandError("Le serveur s'est arrêté au démarrage (waitress ou uvicorn installé ?).")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Le serveur n'écoute pas sur le port {port} après {delai} s.")
+
+    def _mesurer(self, port, nb_clients, duree, url_stock, url_pdf, cache_pdf):
+        durees, verrou = [], threading.Lock()
+        nb_pdf = [0]
+        fin = time.monotonic() + duree
+
+        def client_stock():
+            # Connexion persistante : rouverte automatiquement si le serveur la ferme
+            connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            mesures = []
+            while time.monotonic() < fin:
+                debut = time.perf_counter()
+                connexion.request('GET', url_stock)
+                reponse = connexion.getresponse()
+                reponse.read()
+                if reponse.status == 200:
+                    mesures.append(time.perf_counter() - debut)
+            connexion.close()
+            with verrou:
+                durees.extend(mesures)
+
+        def client_pdf():
+            connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            while time.monotonic() < fin:
+                shutil.rmtree(cache_pdf, ignore_errors=True)
+                connexion.request('GET', url_pdf)
+                reponse = connexion.getresponse()
+                reponse.read()
+                if reponse.status == 200:
+                    nb_pdf[0] += 1
+            connexion.close()
+
+        fils = [threading.Thread(target=client_stock) for _ in range(nb_clients)]
+        fils.append(threading.Thread(target=client_pdf))
+        for fil in fils:
+            fil.start()
+        for fil in fils:
+            fil.join()
+        return durees, nb_pdf[0]
@@ -0,0 +1,31 @@
+# gestion_produits_stock/management/commands/recalculer_stocks.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_produits_stock.stocks import produits_en_ecart, recalculer_stocks_totaux
+
+
+class Command(BaseCommand):
+    help = "Vérifie et reconstruit le stock total dénormalisé des produits à partir de la table Stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verifier', action='store_true',
+            help="Signale les écarts sans rien corriger (code de sortie non nul en cas d'écart).",
+        )
+
+    def handle(self, *args, **options):
+        ecarts = list(produits_en_ecart().values_list('pk', 'nom', 'stock_total', 'stock_total_reel'))
+        for pk, nom, stock_total, stock_total_reel in ecarts:
+            self.stdout.write(f"Produit #{pk} {nom} : enregistré {stock_total}, réel {stock_total_reel}")
+
+        if options['verifier']:
+            if ecarts:
+                raise CommandError(f"{len(ecarts)} produit(s) présentent un écart de stock.")
+            self.stdout.write(self.style.SUCCESS("Aucun écart de stock."))
+            return
+
+        nb = recalculer_stocks_totaux()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stock total recalculé pour {nb} produit(s) ({len(ecarts)} écart(s) corrigé(s))."
+        ))
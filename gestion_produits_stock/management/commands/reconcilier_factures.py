@@ -0,0 +1,31 @@
+# gestion_produits_stock/management/commands/reconcilier_factures.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_produits_stock.comptes import factures_en_ecart, reconcilier_factures
+
+
+class Command(BaseCommand):
+    help = "Détecte et corrige les écarts entre le montant payé dénormalisé des factures et leurs paiements."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verifier', action='store_true',
+            help="Signale les écarts sans rien corriger (code de sortie non nul en cas d'écart).",
+        )
+
+    def handle(self, *args, **options):
+        ecarts = list(factures_en_ecart().values_list('pk', 'montant_paye', 'montant_paye_reel', 'solde'))
+        for pk, montant_paye, montant_paye_reel, solde in ecarts:
+            self.stdout.write(
+                f"Facture #{pk} : payé enregistré {montant_paye}, payé réel {montant_paye_reel}, solde {solde}"
+            )
+
+        if options['verifier']:
+            if ecarts:
+                raise CommandError(f"{len(ecarts)} facture(s) présentent un écart de paiement.")
+            self.stdout.write(self.style.SUCCESS("Aucun écart de paiement."))
+            return
+
+        nb = reconcilier_factures()
+        self.stdout.write(self.style.SUCCESS(f"{nb} facture(s) corrigée(s)."))
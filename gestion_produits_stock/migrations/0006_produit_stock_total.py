@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:57
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remplir_stock_total(apps, schema_editor):
+    Produit = apps.get_model('gestion_produits_stock', 'Produit')
+    Stock = apps.get_model('gestion_produits_stock', 'Stock')
+    total = Stock.objects.filter(produit=OuterRef('pk')).values('produit').annotate(total=Sum('quantite')).values('total')
+    Produit.objects.update(stock_total=Coalesce(
+        Subquery(total), Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0005_alter_categorie_options_alter_facture_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='stock_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Stock Total'),
+        ),
+        migrations.RunPython(remplir_stock_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:59
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remplir_montant_paye(apps, schema_editor):
+    Facture = apps.get_model('gestion_produits_stock', 'Facture')
+    Paiement = apps.get_model('gestion_produits_stock', 'Paiement')
+    total = Paiement.objects.filter(facture=OuterRef('pk')).values('facture').annotate(total=Sum('montant_paye')).values('total')
+    Facture.objects.update(montant_paye=Coalesce(
+        Subquery(total), Decimal('0.00'), output_field=DecimalField(max_digits=10, decimal_places=2)
+    ))
+    Facture.objects.update(solde=F('montant_total') - F('montant_paye'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0006_produit_stock_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_paye',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10, verbose_name='Montant Payé'),
+        ),
+        migrations.AddField(
+            model_name='facture',
+            name='solde',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10, verbose_name='Solde Restant'),
+        ),
+        migrations.RunPython(remplir_montant_paye, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:02
+
+import django.db.models.deletion
+import re
+
+from django.db import migrations, models
+
+MOTIF_VENTE = re.compile(r'^Vente \(Facture #(\d+)\)$')
+
+
+def relier_mouvements_aux_factures(apps, schema_editor):
+    """
+    Renseigne la nouvelle clé étrangère à partir de la description "Vente (Facture #id)".
+    """
+    StockMovement = apps.get_model('gestion_produits_stock', 'StockMovement')
+    Facture = apps.get_model('gestion_produits_stock', 'Facture')
+    descriptions = StockMovement.objects.filter(
+        description__startswith='Vente (Facture #'
+    ).values_list('description', flat=True).distinct()
+    ids_par_description = {}
+    for description in descriptions:
+        correspondance = MOTIF_VENTE.match(description)
+        if correspondance:
+            ids_par_description[description] = int(correspondance.group(1))
+    ids_existants = set(Facture.objects.filter(pk__in=ids_par_description.values()).values_list('pk', flat=True))
+    for description, facture_id in ids_par_description.items():
+        if facture_id in ids_existants:
+            StockMovement.objects.filter(description=description).update(facture_id=facture_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0007_facture_montant_paye_solde'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='facture',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to='gestion_produits_stock.facture'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['nom', 'id'], name='client_nom_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_facturation', 'id'], name='facture_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(condition=models.Q(('est_payee', False)), fields=['client', 'date_facturation'], name='facture_client_impayee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(condition=models.Q(('est_payee', False)), fields=['date_echeance'], name='facture_impayee_echeance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fournisseur',
+            index=models.Index(fields=['nom', 'id'], name='fournisseur_nom_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['nom', 'id'], name='produit_nom_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['date_mouvement', 'id'], name='mouvement_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['produit', 'date_mouvement'], name='mouvement_produit_date_idx'),
+        ),
+        migrations.RunPython(relier_mouvements_aux_factures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:10
+
+from django.db import migrations
+
+
+def creer_index(apps, schema_editor):
+    from gestion_produits_stock.recherche import installer_index_recherche
+    installer_index_recherche(schema_editor.connection)
+
+
+def supprimer_index(apps, schema_editor):
+    from gestion_produits_stock.recherche import supprimer_index_recherche
+    supprimer_index_recherche(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0008_index_requetes_frequentes'),
+    ]
+
+    operations = [
+        # Table virtuelle FTS5 + triggers de synchronisation (SQLite uniquement)
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
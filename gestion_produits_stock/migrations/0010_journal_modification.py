@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def amorcer_journal(apps, schema_editor):
+    # Une entrée par produit et par lieu existants : 'since=0' donne tout le catalogue
+    JournalModification = apps.get_model('gestion_produits_stock', 'JournalModification')
+    Produit = apps.get_model('gestion_produits_stock', 'Produit')
+    LieuStockage = apps.get_model('gestion_produits_stock', 'LieuStockage')
+    for type_objet, modele in (('lieu', LieuStockage), ('produit', Produit)):
+        JournalModification.objects.bulk_create(
+            (JournalModification(type_objet=type_objet, objet_id=pk)
+             for pk in modele.objects.order_by('pk').values_list('pk', flat=True).iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0009_recherche_produit_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalModification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_objet', models.CharField(choices=[('produit', 'Produit (fiche, prix ou stocks)'), ('lieu', 'Lieu de stockage')], max_length=10)),
+                ('objet_id', models.BigIntegerField()),
+                ('date_modification', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Modification du catalogue',
+                'verbose_name_plural': 'Journal des modifications du catalogue',
+                'indexes': [models.Index(fields=['type_objet', 'objet_id'], name='journal_objet_idx')],
+            },
+        ),
+        migrations.RunPython(amorcer_journal, migrations.RunPython.noop),
+    ]
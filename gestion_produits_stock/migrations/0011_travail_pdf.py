@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0010_journal_modification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravailPDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_document', models.CharField(choices=[('factures', 'Factures'), ('releves', 'Relevés de compte')], max_length=10)),
+                ('format_sortie', models.CharField(choices=[('zip', 'Archive ZIP (un PDF par document)'), ('pdf', 'PDF unique')], default='zip', max_length=3)),
+                ('parametres', models.JSONField(blank=True, default=dict)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec')], default='EN_ATTENTE', max_length=10)),
+                ('nb_total', models.PositiveIntegerField(default=0)),
+                ('nb_faits', models.PositiveIntegerField(default=0)),
+                ('fichier', models.CharField(blank=True, max_length=255)),
+                ('erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Travail PDF',
+                'verbose_name_plural': 'Travaux PDF',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_produits_stock', '0011_travail_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='travailpdf',
+            name='date_activite',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,7 @@
 # gestion_produits_stock/models.py
 
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Sum, F, Case, When, Value
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -39,6 +39,9 @@ class Fournisseur(models.Model):
         verbose_name = "Fournisseur"
         verbose_name_plural = "Fournisseurs"
         ordering = ['nom']
+        indexes = [
+            models.Index(fields=['nom', 'id'], name='fournisseur_nom_id_idx'),
+        ]
 
 # Modèle pour les Produits
 class Produit(models.Model):
@@ -49,6 +52,8 @@ class Produit(models.Model):
     prix_achat = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Prix d'Achat Unitaire")
     prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Prix de Vente Unitaire")
     seuil_alerte = models.IntegerField(default=10, verbose_name="Seuil d'alerte", help_text="Quantité minimale avant qu'une alerte soit déclenchée.") # NOUVEAU
+    # Somme des quantités de tous les lieux, maintenue à chaque écriture sur Stock
+    stock_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Stock Total")
     description = models.TextField(blank=True, null=True, verbose_name="Description")
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de Création")
     date_derniere_maj = models.DateTimeField(auto_now=True, verbose_name="Date Dernière Mise à Jour")
@@ -57,13 +62,13 @@ class Produit(models.Model):
         return self.nom
     
     def get_stock_total(self):
-        return self.stock_set.aggregate(
-            total_quantite=Coalesce(models.Sum('quantite'), Decimal('0.00'))
-        )['total_quantite']
+        # Valeur dénormalisée : voir Stock.save() et la commande 'recalculer_stocks'
+        return self.stock_total
     
-    def get_stock_principal(self):
+    def get_stock_principal(self, request=None):
+        from .lieux import id_lieu_vente
         try:
-            return self.stock_set.get(lieu_stockage__nom="Principal").quantite
+            return self.stock_set.get(lieu_stockage_id=id_lieu_vente(request)).quantite
         except Stock.DoesNotExist:
             return Decimal('0.00')
 
@@ -71,6 +76,10 @@ class Produit(models.Model):
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
         ordering = ['nom']
+        indexes = [
+            # Liste des produits paginée par (nom, id)
+            models.Index(fields=['nom', 'id'], name='produit_nom_id_idx'),
+        ]
 
 # Modèle pour les Clients
 class Client(models.Model):
@@ -88,6 +97,9 @@ class Client(models.Model):
         verbose_name = "Client"
         verbose_name_plural = "Clients"
         ordering = ['nom']
+        indexes = [
+            models.Index(fields=['nom', 'id'], name='client_nom_id_idx'),
+        ]
         
 # Modèle pour les Lieux de Stockage
 class LieuStockage(models.Model):
@@ -117,6 +129,38 @@ class Stock(models.Model):
     def __str__(self):
         return f"{self.produit.nom} ({self.quantite}) dans {self.lieu_stockage.nom}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémorise l'état en base pour calculer le delta à reporter sur Produit.stock_total
+        if 'produit_id' in instance.__dict__ and 'quantite' in instance.__dict__:
+            instance._etat_enregistre = (instance.produit_id, instance.quantite)
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if hasattr(self.quantite, 'resolve_expression'):
+                # Quantité affectée avec une expression F() : relire la valeur réelle
+                self.refresh_from_db(fields=['quantite'])
+            ancien_produit_id, ancienne_quantite = getattr(self, '_etat_enregistre', (None, Decimal('0.00')))
+            if ancien_produit_id is not None and ancien_produit_id != self.produit_id:
+                Stock.reporter_sur_total(ancien_produit_id, -ancienne_quantite)
+                ancienne_quantite = Decimal('0.00')
+            Stock.reporter_sur_total(self.produit_id, Decimal(self.quantite) - Decimal(ancienne_quantite))
+            self._etat_enregistre = (self.produit_id, self.quantite)
+
+    @staticmethod
+    def reporter_sur_total(produit_id, delta):
+        """
+        Applique un delta de quantité au stock total dénormalisé du produit.
+        """
+        if delta:
+            # update() ne touche pas aux champs auto_now : la date est mise à jour ici
+            Produit.objects.filter(pk=produit_id).update(
+                stock_total=F('stock_total') + delta, date_derniere_maj=timezone.now()
+            )
+
 # Modèle pour les Mouvements de Stock
 class StockMovement(models.Model):
     TYPE_CHOICES = [
@@ -138,9 +182,19 @@ class StockMovement(models.Model):
         related_name='mouvements_entrants'
     )
     description = models.TextField(blank=True)
+    # Facture à l'origine du mouvement (ventes), à la place d'une recherche sur la description
+    facture = models.ForeignKey(
+        'Facture', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='mouvements_stock'
+    )
     
     class Meta:
         verbose_name_plural = "Mouvements de Stock"
+        indexes = [
+            # Historique trié par date décroissante, paginé par (date_mouvement, id)
+            models.Index(fields=['date_mouvement', 'id'], name='mouvement_date_id_idx'),
+            models.Index(fields=['produit', 'date_mouvement'], name='mouvement_produit_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.type_mouvement} de {self.produit.nom} - {self.quantite}"
@@ -152,19 +206,61 @@ class Facture(models.Model):
     montant_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     est_payee = models.BooleanField(default=False)
     date_echeance = models.DateField(default=timezone.now, help_text="Date limite de paiement de la facture.") # NOUVEAU
+    # Totaux dénormalisés, maintenus à chaque écriture sur Paiement
+    montant_paye = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Montant Payé")
+    solde = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), editable=False, verbose_name="Solde Restant")
 
     class Meta:
         verbose_name = "Facture"
         verbose_name_plural = "Factures"
+        indexes = [
+            # Rapports par période et liste paginée par (date_facturation, id)
+            models.Index(fields=['date_facturation', 'id'], name='facture_date_id_idx'),
+            # Factures impayées d'un client, de la plus ancienne à la plus récente (imputation des paiements)
+            models.Index(fields=['client', 'date_facturation'], condition=models.Q(est_payee=False), name='facture_client_impayee_idx'),
+            # Alertes de dettes : seules les factures impayées sont indexées
+            models.Index(fields=['date_echeance'], condition=models.Q(est_payee=False), name='facture_impayee_echeance_idx'),
+        ]
 
     def __str__(self):
         return f"Facture #{self.id} pour {self.client.nom}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.solde = self.montant_total - self.montant_paye
+            self.est_payee = self.solde <= Decimal('0.00')
+            return super().save(*args, **kwargs)
+
+        # Le montant payé n'est modifié que par les paiements (expressions F()) :
+        # on ne réécrit jamais la valeur en mémoire, qui peut être périmée.
+        update_fields = kwargs.pop('update_fields', None) or [
+            f.name for f in self._meta.concrete_fields if not f.primary_key
+        ]
+        update_fields = (set(update_fields) - {'montant_paye'}) | {'solde', 'est_payee'}
+        self.solde = Value(self.montant_total) - F('montant_paye')
+        self.est_payee = Case(
+            When(montant_paye__gte=Value(self.montant_total), then=Value(True)),
+            default=Value(False),
+        )
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self.refresh_from_db(fields=['montant_paye', 'solde', 'est_payee'])
+
+    @staticmethod
+    def reporter_paiement(facture_id, delta):
+        """
+        Applique un delta de paiement au montant payé et au solde de la facture,
+        et met à jour son statut, en une seule requête UPDATE.
+        """
+        if delta:
+            Facture.objects.filter(pk=facture_id).update(
+                montant_paye=F('montant_paye') + delta,
+                solde=F('solde') - delta,
+                # Dans un UPDATE, 'solde' désigne l'ancienne valeur
+                est_payee=Case(When(solde__lte=delta, then=Value(True)), default=Value(False)),
+            )
+
     def get_solde_restant(self):
-        total_paye = self.paiement_set.aggregate(
-            total_paye=Coalesce(Sum('montant_paye'), Decimal('0.00'))
-        )['total_paye']
-        return self.montant_total - total_paye
+        return self.montant_total - self.montant_paye
 
     def clean(self):
         if self.get_solde_restant() < Decimal('0.00'):
@@ -195,4 +291,95 @@ class Paiement(models.Model):
     methode_paiement = models.CharField(max_length=20, choices=METHODE_PAIEMENT_CHOICES, default='ESPECES')
 
     def __str__(self):
-        return f"Paiement de {self.montant_paye} pour la Facture #{self.facture.id}"
\ No newline at end of file
+        return f"Paiement de {self.montant_paye} pour la Facture #{self.facture.id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémorise l'état en base pour calculer le delta à reporter sur la facture
+        if 'facture_id' in instance.__dict__ and 'montant_paye' in instance.__dict__:
+            instance._etat_enregistre = (instance.facture_id, instance.montant_paye)
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            ancienne_facture_id, ancien_montant = getattr(self, '_etat_enregistre', (None, Decimal('0.00')))
+            if ancienne_facture_id is not None and ancienne_facture_id != self.facture_id:
+                Facture.reporter_paiement(ancienne_facture_id, -ancien_montant)
+                ancien_montant = Decimal('0.00')
+            delta = Decimal(self.montant_paye) - Decimal(ancien_montant)
+            Facture.reporter_paiement(self.facture_id, delta)
+            self._etat_enregistre = (self.facture_id, self.montant_paye)
+
+        # Garder cohérente la facture déjà chargée en mémoire (sans requête supplémentaire)
+        if delta and Paiement.facture.is_cached(self):
+            self.facture.montant_paye += delta
+            self.facture.solde = self.facture.montant_total - self.facture.montant_paye
+            self.facture.est_payee = self.facture.solde <= Decimal('0.00')
+
+# Journal des modifications du catalogue, pour la synchronisation incrémentale
+# des caisses distantes et de l'application de bureau (voir synchronisation.py)
+class JournalModification(models.Model):
+    TYPE_CHOICES = [
+        ('produit', 'Produit (fiche, prix ou stocks)'),
+        ('lieu', 'Lieu de stockage'),
+    ]
+
+    # L'identifiant, croissant, sert de jeton de synchronisation
+    type_objet = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    objet_id = models.BigIntegerField()
+    date_modification = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Modification du catalogue"
+        verbose_name_plural = "Journal des modifications du catalogue"
+        indexes = [
+            models.Index(fields=['type_objet', 'objet_id'], name='journal_objet_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.type_objet} {self.objet_id}"
+
+
+# Génération de PDF par lots (factures d'une période, relevés de compte),
+# exécutée hors des requêtes web (voir lots_pdf.py)
+class TravailPDF(models.Model):
+    DOCUMENT_CHOICES = [
+        ('factures', 'Factures'),
+        ('releves', 'Relevés de compte'),
+    ]
+    FORMAT_CHOICES = [
+        ('zip', 'Archive ZIP (un PDF par document)'),
+        ('pdf', 'PDF unique'),
+    ]
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+    ]
+
+    type_document = models.CharField(max_length=10, choices=DOCUMENT_CHOICES)
+    format_sortie = models.CharField(max_length=3, choices=FORMAT_CHOICES, default='zip')
+    # Sélection : {'du', 'au'} (dates ISO) pour les factures, {'clients': [ids]} pour les relevés
+    parametres = models.JSONField(default=dict, blank=True)
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    nb_total = models.PositiveIntegerField(default=0)
+    nb_faits = models.PositiveIntegerField(default=0)
+    # Chemin du fichier produit, relatif au répertoire des lots
+    fichier = models.CharField(max_length=255, blank=True)
+    erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    # Dernier signe de vie de l'exécutant (EN_COURS) : un travail muet trop
+    # longtemps (processus arrêté en plein rendu) est remis en attente
+    date_activite = models.DateTimeField(null=True, blank=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Travail PDF"
+        verbose_name_plural = "Travaux PDF"
+        ordering = ['-date_creation']
+
+    def __str__(self):
+        return f"Lot PDF #{self.pk} ({self.get_type_document_display()}, {self.get_statut_display()})"
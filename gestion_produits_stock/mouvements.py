@@ -0,0 +1,187 @@
+# gestion_produits_stock/mouvements.py
+
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .alertes import invalider_alertes
+from .catalogue import signaler_modification_catalogue
+from .models import LieuStockage, Produit, Stock, StockMovement
+from .stocks import appliquer_deltas_stock
+
+# Nombre maximum de mouvements par appel aux points d'accès groupés
+NB_MOUVEMENTS_MAX_PAR_LOT = 1000
+
+TYPES_MOUVEMENT = {code for code, _ in StockMovement.TYPE_CHOICES}
+# Lieux exigés par type de mouvement
+LIEUX_REQUIS = {
+    'ENTREE': ('lieu_stockage_destination',),
+    'SORTIE': ('lieu_stockage_source',),
+    'TRANSFERT': ('lieu_stockage_source', 'lieu_stockage_destination'),
+}
+
+
+class LotInvalide(ValidationError):
+    """
+    Levée quand au moins un élément d'un lot est refusé. 'erreurs' contient,
+    pour chaque élément dans l'ordre reçu, un dictionnaire {champ: message}
+    (vide si l'élément est valide) ; rien n'a été enregistré.
+    """
+
+    def __init__(self, erreurs, message="Lot refusé : aucun mouvement n'a été enregistré."):
+        self.erreurs = erreurs
+        super().__init__(message)
+
+
+def _entier(valeur):
+    if isinstance(valeur, bool):
+        raise ValueError(valeur)
+    return int(valeur)
+
+
+def _lire_element(element):
+    """
+    Convertit un élément reçu (dictionnaire JSON) en valeurs typées.
+    Retourne (valeurs, erreurs) ; les identifiants ne sont pas encore vérifiés.
+    """
+    if not isinstance(element, dict):
+        return None, {'non_field_errors': "Chaque élément doit être un objet."}
+    erreurs = {}
+    valeurs = {'description': str(element.get('description') or '')}
+
+    type_mouvement = element.get('type_mouvement')
+    if type_mouvement not in TYPES_MOUVEMENT:
+        erreurs['type_mouvement'] = f"Type inconnu, attendu : {', '.join(sorted(TYPES_MOUVEMENT))}."
+    valeurs['type_mouvement'] = type_mouvement
+
+    try:
+        quantite = Decimal(str(element.get('quantite')))
+        if not quantite.is_finite() or quantite != quantite.quantize(Decimal('0.01')):
+            raise InvalidOperation
+    except (InvalidOperation, ValueError):
+        erreurs['quantite'] = "Quantité invalide (nombre à deux décimales au plus)."
+    else:
+        if quantite <= 0:
+            erreurs['quantite'] = "La quantité doit être supérieure à zéro."
+        valeurs['quantite'] = quantite
+
+    champs = ['produit', 'lieu_stockage_source', 'lieu_stockage_destination']
+    requis = ['produit', *LIEUX_REQUIS.get(type_mouvement, ())]
+    for champ in champs:
+        valeur = element.get(champ)
+        if valeur in (None, ''):
+            valeurs[champ] = None
+            if champ in requis:
+                erreurs[champ] = "Ce champ est requis pour ce type de mouvement."
+            continue
+        try:
+            valeurs[champ] = _entier(valeur)
+        except (TypeError, ValueError):
+            erreurs[champ] = "Identifiant invalide."
+    if (
+        type_mouvement == 'TRANSFERT' and 'lieu_stockage_source' not in erreurs
+        and valeurs.get('lieu_stockage_source') is not None
+        and valeurs['lieu_stockage_source'] == valeurs.get('lieu_stockage_destination')
+    ):
+        erreurs['lieu_stockage_destination'] = "Le lieu de destination doit différer du lieu source."
+    return valeurs, erreurs
+
+
+def enregistrer_mouvements(elements):
+    """
+    Valide puis applique un lot de mouvements de stock, tout ou rien.
+
+    Chaque élément est un dictionnaire {produit, type_mouvement, quantite,
+    lieu_stockage_source, lieu_stockage_destination, description} : une ENTREE
+    exige une destination, une SORTIE une source, un TRANSFERT les deux.
+    Produits, lieux et lignes de stock sont lus en trois requêtes pour tout le
+    lot ; les quantités sont contrôlées dans l'ordre du lot (une sortie ne peut
+    pas rendre un stock négatif), puis appliquées par un UPDATE groupé, les
+    lignes de stock manquantes par un upsert et les mouvements par un bulk_create.
+
+    Retourne, pour chaque élément, {'mouvement': StockMovement enregistré,
+    'stocks': {lieu_id: quantité après le mouvement}}.
+    Lève LotInvalide si un élément est refusé.
+    """
+    lus = [_lire_element(element) for element in elements]
+    erreurs = [erreurs for _, erreurs in lus]
+    valeurs = [valeurs for valeurs, _ in lus]
+
+    produit_ids = {v['produit'] for v in valeurs if v and v.get('produit') is not None}
+    lieu_ids = {
+        v[champ] for v in valeurs if v
+        for champ in ('lieu_stockage_source', 'lieu_stockage_destination')
+        if v.get(champ) is not None
+    }
+    produits = Produit.objects.only('id', 'nom').in_bulk(produit_ids)
+    lieux = LieuStockage.objects.only('id').in_bulk(lieu_ids)
+    for v, e in zip(valeurs, erreurs):
+        if not v:
+            continue
+        if v.get('produit') is not None and v['produit'] not in produits:
+            e['produit'] = "Produit introuvable."
+        for champ in ('lieu_stockage_source', 'lieu_stockage_destination'):
+            if v.get(champ) is not None and v[champ] not in lieux:
+                e[champ] = "Lieu de stockage introuvable."
+
+    with transaction.atomic():
+        stocks = {
+            (stock.produit_id, stock.lieu_stockage_id): stock
+            for stock in Stock.objects.select_for_update().filter(
+                produit_id__in=produits, lieu_stockage_id__in=lieux
+            )
+        }
+        # Quantités courantes, mises à jour élément par élément dans l'ordre du lot
+        courantes = {cle: stock.quantite for cle, stock in stocks.items()}
+        deltas = {}
+        resultats = []
+        for v, e in zip(valeurs, erreurs):
+            if e:
+                resultats.append(None)
+                continue
+            produit_id, quantite = v['produit'], v['quantite']
+            source, destination = v['lieu_stockage_source'], v['lieu_stockage_destination']
+            if v['type_mouvement'] == 'ENTREE':
+                source = None
+            elif v['type_mouvement'] == 'SORTIE':
+                destination = None
+            apres = {}
+            if source is not None:
+                disponible = courantes.get((produit_id, source), Decimal('0.00'))
+                if disponible < quantite:
+                    e['quantite'] = (
+                        f"Quantité insuffisante pour le produit {produits[produit_id].nom}. "
+                        f"Stock disponible : {disponible}."
+                    )
+                    resultats.append(None)
+                    continue
+                courantes[(produit_id, source)] = apres[source] = disponible - quantite
+                deltas[(produit_id, source)] = deltas.get((produit_id, source), Decimal('0.00')) - quantite
+            if destination is not None:
+                cle = (produit_id, destination)
+                courantes[cle] = apres[destination] = courantes.get(cle, Decimal('0.00')) + quantite
+                deltas[cle] = deltas.get(cle, Decimal('0.00')) + quantite
+            resultats.append({
+                'mouvement': StockMovement(
+                    produit_id=produit_id,
+                    quantite=quantite,
+                    type_mouvement=v['type_mouvement'],
+                    lieu_stockage_source_id=source,
+                    lieu_stockage_destination_id=destination,
+                    description=v['description'],
+                ),
+                'stocks': apres,
+            })
+        if any(erreurs):
+            raise LotInvalide(erreurs)
+
+        if not appliquer_deltas_stock(deltas, stocks):
+            # Le stock a changé entre la lecture et l'écriture (base sans verrou de ligne)
+            raise LotInvalide([], "Le stock a été modifié pendant l'opération ; veuillez réessayer.")
+        StockMovement.objects.bulk_create([resultat['mouvement'] for resultat in resultats])
+        # Les UPDATE et bulk_create ne déclenchent pas les signaux
+        invalider_alertes()
+        signaler_modification_catalogue(produit_id for produit_id, _ in deltas)
+    return resultats
+
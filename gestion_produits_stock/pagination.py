@@ -0,0 +1,137 @@
+# gestion_produits_stock/pagination.py
+
+import base64
+import binascii
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Nombre de lignes par page des listes (modifiable avec ?taille=, plafonné)
+TAILLE_PAGE = getattr(settings, 'TAILLE_PAGE', 50)
+TAILLE_PAGE_MAX = getattr(settings, 'TAILLE_PAGE_MAX', 500)
+
+
+class PageCurseur:
+    """
+    Page d'une liste paginée par curseur (keyset) : 'objets' contient les lignes,
+    'url_suivante' / 'url_precedente' les liens de navigation (ou None).
+    """
+
+    def __init__(self, objets, url_suivante=None, url_precedente=None):
+        self.objets = objets
+        self.url_suivante = url_suivante
+        self.url_precedente = url_precedente
+
+    def __iter__(self):
+        return iter(self.objets)
+
+    def __len__(self):
+        return len(self.objets)
+
+    @property
+    def a_plusieurs_pages(self):
+        return bool(self.url_suivante or self.url_precedente)
+
+
+def _serialiser(valeur):
+    if hasattr(valeur, 'isoformat'):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    return valeur
+
+
+def _encoder_curseur(objet, noms):
+    valeurs = [_serialiser(getattr(objet, nom)) for nom in noms]
+    return base64.urlsafe_b64encode(json.dumps(valeurs).encode()).decode()
+
+
+def _decoder_curseur(jeton, modele, noms):
+    """
+    Retourne les valeurs du curseur converties dans le type des champs,
+    ou None si le jeton est absent ou invalide (on repart alors de la première page).
+    """
+    if not jeton:
+        return None
+    try:
+        valeurs = json.loads(base64.urlsafe_b64decode(jeton.encode()))
+        if not isinstance(valeurs, list) or len(valeurs) != len(noms):
+            return None
+        return [modele._meta.get_field(nom).to_python(v) for nom, v in zip(noms, valeurs)]
+    except (ValueError, binascii.Error, ValidationError):
+        return None
+
+
+def _condition_curseur(ordre, valeurs, en_avant):
+    # (a, b) > (va, vb)  <=>  a > va  OU  (a = va ET b > vb), en respectant le sens de chaque colonne
+    condition = Q()
+    for i, champ in enumerate(ordre):
+        nom = champ.lstrip('-')
+        descendant = champ.startswith('-')
+        operateur = 'lt' if descendant == en_avant else 'gt'
+        terme = Q(**{f'{nom}__{operateur}': valeurs[i]})
+        for precedent, valeur in zip(ordre[:i], valeurs[:i]):
+            terme &= Q(**{precedent.lstrip('-'): valeur})
+        condition |= terme
+    return condition
+
+
+def parametre_entier(request, nom):
+    """
+    Valeur entière du paramètre GET 'nom' (identifiant d'un filtre de liste),
+    ou None s'il est absent ou invalide : le filtre est alors ignoré.
+    """
+    try:
+        return int(request.GET.get(nom, ''))
+    except ValueError:
+        return None
+
+
+def _url(request, **parametres):
+    query = request.GET.copy()
+    for cle in ('apres', 'avant'):
+        query.pop(cle, None)
+    for cle, valeur in parametres.items():
+        query[cle] = valeur
+    return f"?{query.urlencode()}"
+
+
+def paginer_par_curseur(request, queryset, ordre):
+    """
+    Pagine un queryset par curseur sur les colonnes 'ordre' (ex. ('-date_mouvement', '-id')),
+    qui doivent former une clé unique et être indexées. Le coût d'une page ne
+    dépend pas de sa position dans la liste, contrairement à OFFSET.
+    Paramètres GET : ?apres=<jeton> (page suivante), ?avant=<jeton> (page précédente), ?taille=.
+    """
+    noms = [champ.lstrip('-') for champ in ordre]
+    try:
+        taille = min(max(int(request.GET.get('taille', TAILLE_PAGE)), 1), TAILLE_PAGE_MAX)
+    except ValueError:
+        taille = TAILLE_PAGE
+
+    apres = _decoder_curseur(request.GET.get('apres'), queryset.model, noms)
+    avant = _decoder_curseur(request.GET.get('avant'), queryset.model, noms) if apres is None else None
+
+    if avant is not None:
+        # Page précédente : on parcourt l'ordre inverse puis on remet les lignes dans l'ordre
+        ordre_inverse = [nom if champ.startswith('-') else f'-{nom}' for champ, nom in zip(ordre, noms)]
+        lignes = list(queryset.filter(_condition_curseur(ordre, avant, False)).order_by(*ordre_inverse)[:taille + 1])
+        a_precedente = len(lignes) > taille
+        objets = lignes[:taille][::-1]
+        a_suivante = True
+    else:
+        if apres is not None:
+            queryset = queryset.filter(_condition_curseur(ordre, apres, True))
+        lignes = list(queryset.order_by(*ordre)[:taille + 1])
+        a_suivante = len(lignes) > taille
+        objets = lignes[:taille]
+        a_precedente = apres is not None
+
+    return PageCurseur(
+        objets,
+        url_suivante=_url(request, apres=_encoder_curseur(objets[-1], noms)) if a_suivante and objets else None,
+        url_precedente=_url(request, avant=_encoder_curseur(objets[0], noms)) if a_precedente and objets else None,
+    )
@@ -0,0 +1,95 @@
+# gestion_produits_stock/rapports.py
+
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Facture, LigneFacture
+
+MONTANT = DecimalField(max_digits=14, decimal_places=2)
+
+# Regroupements disponibles pour le rapport de bénéfice : clé -> (libellé, expression)
+REGROUPEMENTS = {
+    'jour': ("Jour", TruncDay('facture__date_facturation')),
+    'semaine': ("Semaine", TruncWeek('facture__date_facturation')),
+    'mois': ("Mois", TruncMonth('facture__date_facturation')),
+    'categorie': ("Catégorie", F('produit__categorie__nom')),
+    'fournisseur': ("Fournisseur", F('produit__fournisseur__nom')),
+    'client': ("Client", F('facture__client__nom')),
+}
+
+REVENU = ExpressionWrapper(F('quantite') * F('prix_unitaire_negocie'), output_field=MONTANT)
+COUT = ExpressionWrapper(
+    F('quantite') * Coalesce(F('produit__prix_achat'), Value(Decimal('0.00'))), output_field=MONTANT
+)
+
+
+def _debut_du_jour(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def _intervalle(date_debut, date_fin):
+    # Intervalle de dates-heures [début, fin + 1 jour[ : reste indexable, contrairement à __date
+    return _debut_du_jour(date_debut), _debut_du_jour(date_fin + datetime.timedelta(days=1))
+
+
+def factures_de_la_periode(date_debut, date_fin):
+    """
+    Factures émises entre date_debut et date_fin incluses.
+    """
+    debut, fin = _intervalle(date_debut, date_fin)
+    return Facture.objects.filter(date_facturation__gte=debut, date_facturation__lt=fin)
+
+
+def lignes_de_la_periode(date_debut, date_fin):
+    """
+    Lignes de facture des factures émises entre date_debut et date_fin incluses.
+    """
+    debut, fin = _intervalle(date_debut, date_fin)
+    return LigneFacture.objects.filter(
+        facture__date_facturation__gte=debut, facture__date_facturation__lt=fin
+    )
+
+
+def rapport_benefice(date_debut, date_fin, regroupement=None):
+    """
+    Calcule revenu, coût et marge d'une période en agrégats SQL : une requête
+    pour les totaux, plus une requête groupée si un regroupement est demandé,
+    quel que soit le nombre de ventes de la période.
+    """
+    lignes = lignes_de_la_periode(date_debut, date_fin)
+    zero = Value(Decimal('0.00'))
+
+    totaux = lignes.aggregate(
+        revenu=Coalesce(Sum(REVENU), zero, output_field=MONTANT),
+        cout=Coalesce(Sum(COUT), zero, output_field=MONTANT),
+        nb_factures=Count('facture', distinct=True),
+    )
+    totaux['marge'] = totaux['revenu'] - totaux['cout']
+
+    groupes = []
+    if regroupement in REGROUPEMENTS:
+        _, expression = REGROUPEMENTS[regroupement]
+        groupes = list(
+            lignes.annotate(groupe=expression)
+            .values('groupe')
+            .annotate(
+                revenu=Coalesce(Sum(REVENU), zero, output_field=MONTANT),
+                cout=Coalesce(Sum(COUT), zero, output_field=MONTANT),
+                nb_factures=Count('facture', distinct=True),
+            )
+            .order_by('groupe')
+        )
+        for groupe in groupes:
+            groupe['marge'] = groupe['revenu'] - groupe['cout']
+
+    return {
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'regroupement': regroupement if regroupement in REGROUPEMENTS else None,
+        'totaux': totaux,
+        'groupes': groupes,
+    }
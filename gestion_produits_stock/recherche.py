@@ -0,0 +1,233 @@
+# gestion_produits_stock/recherche.py
+
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .catalogue import table_codes
+from .models import Produit, Stock
+from .stocks import annoter_stock_principal
+
+# Index plein texte SQLite (FTS5) sur le nom et le code des produits.
+# Table "à contenu externe" : l'index ne stocke que les jetons, les triggers le
+# tiennent à jour à chaque écriture SQL sur la table des produits (save(),
+# update(), bulk_create(), admin...).
+TABLE_PRODUIT = Produit._meta.db_table
+TABLE_FTS = f'{TABLE_PRODUIT}_fts'
+
+# unicode61 + remove_diacritics 2 : insensible à la casse et aux accents ("eleve" trouve "Élève")
+SQL_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_FTS} USING fts5(
+        nom, code_produit,
+        content='{TABLE_PRODUIT}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ai AFTER INSERT ON {TABLE_PRODUIT} BEGIN
+        INSERT INTO {TABLE_FTS}(rowid, nom, code_produit) VALUES (new.id, new.nom, new.code_produit);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ad AFTER DELETE ON {TABLE_PRODUIT} BEGIN
+        INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, nom, code_produit) VALUES ('delete', old.id, old.nom, old.code_produit);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_au AFTER UPDATE OF nom, code_produit ON {TABLE_PRODUIT} BEGIN
+        INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, nom, code_produit) VALUES ('delete', old.id, old.nom, old.code_produit);
+        INSERT INTO {TABLE_FTS}(rowid, nom, code_produit) VALUES (new.id, new.nom, new.code_produit);
+    END""",
+]
+TRIGGERS = {f'{TABLE_FTS}_ai', f'{TABLE_FTS}_ad', f'{TABLE_FTS}_au'}
+
+NB_RESULTATS = 10
+# Nombre maximum de candidats retenus par source (les mieux classés par bm25,
+# les codes contenant la saisie) avant la jointure sur les produits et les stocks
+NB_CANDIDATS = 200
+# Durée de vie des résultats par préfixe ; la version du catalogue fait partie
+# de la clé, donc toute écriture sur un produit ou un stock les périme aussitôt
+RECHERCHE_DUREE_CACHE = getattr(settings, 'RECHERCHE_DUREE_CACHE', 60)
+
+_fts_disponible = None
+
+
+def installer_index_recherche(connexion=None):
+    """
+    Crée l'index plein texte et ses triggers s'ils manquent, puis le reconstruit.
+    Sans effet hors SQLite. Appelée par la migration et après chaque 'migrate' :
+    SQLite recrée la table des produits lors de certaines modifications de
+    schéma, ce qui supprime les triggers.
+    Retourne True si l'index est disponible.
+    """
+    global _fts_disponible
+    connexion = connexion or connection
+    if connexion.vendor != 'sqlite':
+        return False
+    with connexion.cursor() as curseur:
+        curseur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+            [TABLE_PRODUIT],
+        )
+        if TRIGGERS <= {ligne[0] for ligne in curseur.fetchall()}:
+            _fts_disponible = True
+            return True
+        try:
+            for sql in SQL_INDEX:
+                curseur.execute(sql)
+        except DatabaseError:
+            # SQLite compilé sans FTS5 : la recherche retombe sur LIKE
+            _fts_disponible = False
+            return False
+        curseur.execute(f"INSERT INTO {TABLE_FTS}({TABLE_FTS}) VALUES ('rebuild')")
+    _fts_disponible = True
+    return True
+
+
+def supprimer_index_recherche(connexion=None):
+    connexion = connexion or connection
+    if connexion.vendor != 'sqlite':
+        return
+    with connexion.cursor() as curseur:
+        for trigger in sorted(TRIGGERS):
+            curseur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        curseur.execute(f"DROP TABLE IF EXISTS {TABLE_FTS}")
+
+
+def index_disponible():
+    global _fts_disponible
+    if _fts_disponible is None:
+        _fts_disponible = (
+            connection.vendor == 'sqlite'
+            and TABLE_FTS in connection.introspection.table_names()
+        )
+    return _fts_disponible
+
+
+def expression_fts(terme):
+    """
+    Transforme la saisie en requête FTS5 : chaque mot devient un préfixe entre
+    guillemets ("lait" "dem" -> "lait"* AND "dem"*), ce qui neutralise la syntaxe FTS.
+    """
+    mots = re.findall(r'\w+', terme)
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+
+def normaliser_terme(terme):
+    """
+    Forme canonique d'une saisie : minuscules, sans accents ni ponctuation,
+    espaces réduits. "  Crème-Fraîche " et "creme fraiche" donnent la même
+    recherche plein texte, donc la même entrée de cache. Le code exact, lui,
+    se compare à la saisie brute ("ABC-123").
+    """
+    terme = unicodedata.normalize('NFKD', terme.casefold())
+    terme = ''.join(c for c in terme if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', terme))
+
+
+def rechercher_produits(terme, lieu_stockage_id, limite=NB_RESULTATS):
+    """
+    Retourne au plus 'limite' produits correspondant à la saisie, annotés de
+    'stock_principal' (quantité au lieu 'lieu_stockage_id'), en une requête.
+    Le produit dont le code est exactement la saisie (telle quelle ou en
+    majuscules) vient en premier, puis les correspondances de l'index par
+    pertinence (bm25, le nom pesant plus que le code ; à égalité, les plus
+    récents), puis les produits dont le code contient la saisie ailleurs qu'en
+    début de mot ("123" trouve "ABC123", que l'index ne voit pas).
+    """
+    terme = terme.strip()
+    if not terme:
+        return []
+    if not index_disponible():
+        return list(_rechercher_sans_index(terme, lieu_stockage_id, limite))
+    expression = expression_fts(normaliser_terme(terme))
+    if not expression:
+        return []
+    produits = list(Produit.objects.raw(
+        f"""
+        WITH candidats(id, score) AS (
+            SELECT id, -1e300 FROM {TABLE_PRODUIT} WHERE code_produit IN (%s, %s)
+            UNION ALL
+            SELECT * FROM (
+                SELECT rowid, bm25({TABLE_FTS}, 10.0, 1.0) AS score FROM {TABLE_FTS}
+                WHERE {TABLE_FTS} MATCH %s ORDER BY score, rowid DESC LIMIT %s
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT id, 0 FROM {TABLE_PRODUIT} WHERE code_produit LIKE %s ESCAPE '\\' LIMIT %s
+            )
+        )
+        SELECT p.id, p.nom, p.code_produit, p.prix_unitaire,
+               COALESCE(s.quantite, 0) AS stock_principal
+        FROM (SELECT id, MIN(score) AS score FROM candidats GROUP BY id) AS c
+        JOIN {TABLE_PRODUIT} AS p ON p.id = c.id
+        LEFT JOIN {Stock._meta.db_table} AS s
+               ON s.produit_id = p.id AND s.lieu_stockage_id = %s
+        ORDER BY c.score, p.nom
+        LIMIT %s
+        """,
+        [
+            terme, terme.upper(), expression, NB_CANDIDATS,
+            f'%{connection.ops.prep_for_like_query(terme)}%', NB_CANDIDATS,
+            lieu_stockage_id, limite,
+        ],
+    ))
+    # Colonne calculée d'une requête brute : pas de conversion en Decimal par l'ORM
+    for produit in produits:
+        produit.stock_principal = Decimal(str(produit.stock_principal)).quantize(Decimal('0.01'))
+    return produits
+
+
+def _rechercher_sans_index(terme, lieu_stockage_id, limite):
+    # Autres bases (ou SQLite sans FTS5) : recherche LIKE, code exact en premier
+    return annoter_stock_principal(Produit.objects.filter(
+        Q(nom__icontains=terme) | Q(code_produit__icontains=terme)
+    ), lieu_stockage_id).annotate(
+        code_exact=Case(When(code_produit__in=[terme, terme.upper()], then=Value(0)), default=Value(1), output_field=IntegerField()),
+    ).order_by('code_exact', 'nom')[:limite]
+
+
+def _cle_recherche(version, lieu_stockage_id, terme):
+    # Les saisies de même forme normalisée partagent une entrée, sauf si l'une
+    # d'elles est exactement un code produit (classé en premier) : le produit
+    # correspondant, lu dans la table des codes, fait partie de la clé
+    terme = terme.strip()
+    table_codes.synchroniser()
+    code_exact = table_codes.codes.get(terme) or table_codes.codes.get(terme.upper())
+    empreinte = hashlib.md5(normaliser_terme(terme).encode('utf-8')).hexdigest()
+    return f'recherche:{version}:{lieu_stockage_id}:{empreinte}:{code_exact or ""}'
+
+
+def etag_recherche(terme, lieu_stockage_id):
+    """
+    ETag des résultats pour une saisie (brute) : il ne dépend que de la version
+    du catalogue, du lieu et du terme, et se calcule sans requête SQL tant que
+    le catalogue ne change pas (version tenue par la table des codes).
+    """
+    table_codes.synchroniser()
+    version = table_codes.version
+    return f'W/"{_cle_recherche(version, lieu_stockage_id, terme)}"', version
+
+
+def resultats_recherche(terme, lieu_stockage_id, version):
+    """
+    Résultats sérialisables de l'autocomplétion (stock inclus) pour une saisie
+    brute, mis en cache par terme normalisé, lieu et version du catalogue.
+    """
+    cle = _cle_recherche(version, lieu_stockage_id, terme)
+    resultats = cache.get(cle)
+    if resultats is None:
+        resultats = [
+            {
+                'id': produit.id,
+                'nom': produit.nom,
+                'code': produit.code_produit,
+                'label': f"{produit.nom} ({produit.code_produit or 'N/A'}) - Stock: {produit.stock_principal}",
+                'value': produit.nom,
+                'prix_unitaire': float(produit.prix_unitaire),
+                'stock_quantite': float(produit.stock_principal),
+            }
+            for produit in rechercher_produits(terme, lieu_stockage_id)
+        ]
+        cache.set(cle, resultats, RECHERCHE_DUREE_CACHE)
+    return resultats
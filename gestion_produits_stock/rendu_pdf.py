@@ -0,0 +1,160 @@
+# gestion_produits_stock/rendu_pdf.py
+
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Mise en page des documents PDF (factures, relevés de compte), à partir de
+# données déjà extraites de la base (voir factures_pdf.py) : ce module
+# n'importe pas Django, il peut être chargé tel quel par les processus de
+# rendu en parallèle (lots_pdf.py), y compris sous Windows.
+
+# À incrémenter à chaque changement de mise en page : les PDF en cache ne correspondent plus
+VERSION_GABARIT = 1
+
+# Styles construits une fois par processus
+STYLES = getSampleStyleSheet()
+STYLE_NORMAL = STYLES['Normal']
+STYLE_ENTETE = ParagraphStyle(
+    'Header',
+    parent=STYLES['Heading1'],
+    fontSize=18,
+    spaceAfter=12,
+    alignment=1 # Centre
+)
+COMMANDES_TABLEAU = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('BOX', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+]
+# Tableaux terminés par une ligne de total
+STYLE_TABLEAU = TableStyle(COMMANDES_TABLEAU + [
+    ('SPAN', (0, -1), (1, -1)),
+    ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
+])
+STYLE_TABLEAU_RELEVE = TableStyle(COMMANDES_TABLEAU + [
+    ('SPAN', (0, -1), (1, -1)),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+])
+LARGEURS_COLONNES = [2.5*inch, 1*inch, 1.5*inch, 1.5*inch]
+LARGEURS_COLONNES_RELEVE = [1*inch, 1.5*inch, 1.4*inch, 1.4*inch, 1.4*inch]
+
+
+def _bloc_client(client):
+    return [
+        Paragraph(f"Client: {client['nom']}", STYLE_NORMAL),
+        Paragraph(f"Adresse: {client['adresse']}", STYLE_NORMAL),
+        Paragraph(f"Téléphone: {client['telephone']}", STYLE_NORMAL),
+        Spacer(1, 0.2 * inch),
+    ]
+
+
+def histoire_facture(donnees):
+    """
+    Éléments (flowables) d'une facture, voir factures_pdf.donnees_facture().
+    """
+    story = []
+
+    # En-tête du document
+    story.append(Paragraph(f"Facture # {donnees['id']}", STYLE_ENTETE))
+    story.append(Paragraph(f"Date: {donnees['date']}", STYLE_NORMAL))
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Informations client
+    story.extend(_bloc_client(donnees['client']))
+
+    # Tableau des produits, total en dernière ligne
+    data = [['Produit', 'Quantité', 'Prix Unitaire', 'Total']]
+    data.extend(donnees['lignes'])
+    data.append(['', '', 'Montant Total:', f"{donnees['montant_total']} FCFA"])
+    table = Table(data, colWidths=LARGEURS_COLONNES)
+    table.setStyle(STYLE_TABLEAU)
+    story.append(table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Paiements
+    story.append(Paragraph("<b>Historique des paiements :</b>", STYLE_NORMAL))
+    for paiement in donnees['paiements']:
+        story.append(Paragraph(paiement, STYLE_NORMAL))
+
+    story.append(Spacer(1, 0.2 * inch))
+    story.append(Paragraph(f"<b>Total Payé :</b> {donnees['total_paye']} FCFA", STYLE_NORMAL))
+    story.append(Paragraph(f"<b>Solde Dû :</b> {donnees['solde_du']} FCFA", STYLE_NORMAL))
+    return story
+
+
+def histoire_releve(donnees):
+    """
+    Éléments d'un relevé de compte client ("Banque et Caisse"), voir
+    factures_pdf.donnees_releves().
+    """
+    story = [
+        Paragraph(f"Relevé de compte — {donnees['client']['nom']}", STYLE_ENTETE),
+        Paragraph(f"Date: {donnees['date']}", STYLE_NORMAL),
+        Spacer(1, 0.2 * inch),
+    ]
+    story.extend(_bloc_client(donnees['client']))
+
+    data = [['Facture', 'Date', 'Montant', 'Payé', 'Solde']]
+    data.extend(donnees['factures'])
+    data.append(['Totaux', '', f"{donnees['total_factures']} FCFA", f"{donnees['total_paiements']} FCFA", f"{donnees['solde_total']} FCFA"])
+    table = Table(data, colWidths=LARGEURS_COLONNES_RELEVE)
+    table.setStyle(STYLE_TABLEAU_RELEVE)
+    story.append(table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    story.append(Paragraph("<b>Historique des paiements :</b>", STYLE_NORMAL))
+    for paiement in donnees['paiements']:
+        story.append(Paragraph(paiement, STYLE_NORMAL))
+    story.append(Spacer(1, 0.2 * inch))
+    story.append(Paragraph(f"<b>Solde Dû :</b> {donnees['solde_total']} FCFA", STYLE_NORMAL))
+    return story
+
+
+HISTOIRES = {
+    'facture': histoire_facture,
+    'releve': histoire_releve,
+}
+
+
+def rendre_pdf(story):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=72)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def rendre_facture_pdf(donnees):
+    return rendre_pdf(histoire_facture(donnees))
+
+
+def rendre_document(document):
+    """
+    Rend un document (type, données) : 'facture' ou 'releve'. Fonction de
+    module, donc transmissible à un ProcessPoolExecutor.
+    """
+    type_document, donnees = document
+    return rendre_pdf(HISTOIRES[type_document](donnees))
+
+
+def rendre_documents_fusionnes(documents):
+    """
+    Un seul PDF contenant les documents (type, données) à la suite, chacun
+    commençant sur une nouvelle page.
+    """
+    story = []
+    for type_document, donnees in documents:
+        if story:
+            story.append(PageBreak())
+        story.extend(HISTOIRES[type_document](donnees))
+    return rendre_pdf(story)
@@ -0,0 +1,86 @@
+# gestion_produits_stock/revalidation.py
+
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .alertes import obtenir_alertes
+
+# Requêtes conditionnelles (If-None-Match / If-Modified-Since) sur les
+# collections dont les lignes portent 'date_derniere_maj' : une requête
+# agrégée MAX/COUNT suffit à savoir si le client a déjà la bonne version,
+# et une collection inchangée répond 304 sans rien charger ni sérialiser.
+# Le nombre de lignes fait partie de l'ETag pour qu'une suppression (qui ne
+# change pas la date maximale) invalide aussi la copie du client.
+
+
+def etat_collection(queryset):
+    """
+    Retourne (date de dernière mise à jour la plus récente, nombre de lignes)
+    d'un queryset, en une requête.
+    """
+    agregat = queryset.order_by().aggregate(derniere_maj=Max('date_derniere_maj'), nb=Count('pk'))
+    return agregat['derniere_maj'], agregat['nb']
+
+
+def validateurs(etats, variante=''):
+    """
+    ETag (faible) et Last-Modified d'une réponse construite à partir des
+    collections dont on donne les états (voir etat_collection). 'variante'
+    distingue les représentations d'un même contenu (URL, utilisateur...).
+    """
+    empreinte = hashlib.md5(repr((etats, variante)).encode('utf-8')).hexdigest()
+    dates = [derniere_maj for derniere_maj, _ in etats if derniere_maj is not None]
+    return f'W/"{empreinte}"', max(dates) if dates else None
+
+
+def reponse_si_inchange(request, etag, derniere_maj):
+    """
+    Retourne une réponse 304 si la copie du client est à jour, sinon None.
+    """
+    horodatage = timegm(derniere_maj.utctimetuple()) if derniere_maj else None
+    reponse = get_conditional_response(request, etag=etag, last_modified=horodatage)
+    if reponse is not None:
+        poser_validateurs(reponse, etag, derniere_maj)
+    return reponse
+
+
+def poser_validateurs(reponse, etag, derniere_maj):
+    # 'no-cache' : le client garde sa copie mais la fait revalider à chaque fois
+    reponse.headers['ETag'] = etag
+    if derniere_maj is not None:
+        reponse.headers['Last-Modified'] = http_date(timegm(derniere_maj.utctimetuple()))
+    patch_cache_control(reponse, private=True, no_cache=True)
+    return reponse
+
+
+def liste_conditionnelle(*modeles):
+    """
+    Décorateur des vues de liste HTML : la page est revalidée d'après l'état
+    des tables 'modeles' (une requête agrégée par modèle), de l'URL, de
+    l'utilisateur et de l'instantané des alertes affiché dans base.html.
+    Une page avec des messages en attente est toujours rendue.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def vue_conditionnelle(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return vue(request, *args, **kwargs)
+            alertes = obtenir_alertes() if request.user.is_authenticated else None
+            etag, derniere_maj = validateurs(
+                [etat_collection(modele.objects.all()) for modele in modeles],
+                (request.get_full_path(), request.user.pk, alertes),
+            )
+            reponse = reponse_si_inchange(request, etag, derniere_maj)
+            if reponse is None:
+                reponse = vue(request, *args, **kwargs)
+                if reponse.status_code == 200:
+                    poser_validateurs(reponse, etag, derniere_maj)
+            return reponse
+        return vue_conditionnelle
+    return decorateur
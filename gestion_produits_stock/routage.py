@@ -0,0 +1,76 @@
+# gestion_produits_stock/routage.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Lecture sur une réplique PostgreSQL (alias 'replique', configuré par
+# DATABASE_REPLICA_URL) pour les vues lourdes en lecture seule : rapports,
+# historiques, listes de l'API. Seules les lectures des modèles de
+# l'application faites sous lecture_seule() sont routées ; tout le reste
+# (sessions, utilisateurs, instantané des alertes mis en cache) et toutes les
+# écritures (ventes, paiements, stocks) restent sur la base principale. Sans
+# réplique configurée, rien ne change. Une réplique peut avoir quelques
+# instants de retard sur la base principale.
+
+ALIAS_REPLIQUE = 'replique'
+APPLICATION_REPLIQUEE = 'gestion_produits_stock'
+
+_lecture_seule = ContextVar('lecture_seule', default=False)
+
+
+@contextmanager
+def lecture_seule():
+    """
+    Bloc (with lecture_seule():) ou vue (@lecture_seule()) dont les lectures
+    vont sur la réplique. Propre à chaque fil et à chaque tâche asynchrone.
+    """
+    jeton = _lecture_seule.set(True)
+    try:
+        yield
+    finally:
+        _lecture_seule.reset(jeton)
+
+
+@contextmanager
+def lecture_principale():
+    """
+    Bloc dont les lectures restent sur la base principale, même sous
+    lecture_seule() : données mises en cache et partagées par toutes les
+    pages, qu'une réplique en retard figerait jusqu'à leur expiration.
+    """
+    jeton = _lecture_seule.set(False)
+    try:
+        yield
+    finally:
+        _lecture_seule.reset(jeton)
+
+
+class RoutageReplique:
+    def db_for_read(self, model, **hints):
+        if (
+            _lecture_seule.get()
+            and model._meta.app_label == APPLICATION_REPLIQUEE
+            and ALIAS_REPLIQUE in settings.DATABASES
+        ):
+            return ALIAS_REPLIQUE
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Même pour un objet lu sur la réplique
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mêmes données des deux côtés
+        bases = {DEFAULT_DB_ALIAS, ALIAS_REPLIQUE}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplique reçoit le schéma par la réplication
+        if db == ALIAS_REPLIQUE:
+            return False
+        return None
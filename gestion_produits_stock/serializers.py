@@ -2,70 +2,112 @@
 
 from rest_framework import serializers
 from .models import (
-    Produit, Stock, LieuStockage, StockMovement,
+    Categorie, Fournisseur, Produit, Stock, LieuStockage, StockMovement,
     Client, Facture, LigneFacture, Paiement,
 )
 
-class ProduitSerializer(serializers.ModelSerializer):
+
+class ChampsDynamiquesMixin:
+    """
+    Serializers "plats" par défaut (clés étrangères en identifiants), avec :
+    - fields=['id', 'nom'] : ne garder que ces champs (?fields= de l'API) ;
+    - expand=['produit', 'facture.client'] : remplacer une clé étrangère ou
+      ajouter une relation inverse par l'objet imbriqué (?expand= de l'API),
+      parmi celles déclarées dans Meta.expansions {nom: (serializer, options)}.
+    Les viewsets chargent les relations dépliées avec select_related/prefetch_related.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expansions = getattr(self.Meta, 'expansions', {})
+        sous_expansions = {}
+        for chemin in expand or ():
+            nom, _, reste = chemin.partition('.')
+            if nom in expansions:
+                sous_expansions.setdefault(nom, [])
+                if reste:
+                    sous_expansions[nom].append(reste)
+        for nom, reste in sous_expansions.items():
+            nom_classe, options = expansions[nom]
+            self.fields[nom] = globals()[nom_classe](read_only=True, expand=reste, **options)
+        if fields:
+            for nom in set(self.fields) - set(fields):
+                self.fields.pop(nom)
+
+
+class ProduitSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Produit
         fields = '__all__'
+        expansions = {
+            'categorie': ('CategorieSerializer', {}),
+            'fournisseur': ('FournisseurSerializer', {}),
+        }
 
-class LieuStockageSerializer(serializers.ModelSerializer):
+class CategorieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
-        model = LieuStockage
+        model = Categorie
         fields = '__all__'
 
-class StockSerializer(serializers.ModelSerializer):
-    produit = ProduitSerializer(read_only=True)
-    lieu_stockage = LieuStockageSerializer(read_only=True)
+class FournisseurSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Fournisseur
+        fields = '__all__'
 
+class LieuStockageSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
-        model = Stock
+        model = LieuStockage
         fields = '__all__'
 
-class StockMovementSerializer(serializers.ModelSerializer):
-    produit = ProduitSerializer(read_only=True)
-    lieu_stockage = LieuStockageSerializer(read_only=True)
-    produit_id = serializers.PrimaryKeyRelatedField(queryset=Produit.objects.all(), source='produit', write_only=True)
-    lieu_stockage_id = serializers.PrimaryKeyRelatedField(queryset=LieuStockage.objects.all(), source='lieu_stockage', write_only=True)
+class StockSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Stock
+        fields = '__all__'
+        expansions = {
+            'produit': ('ProduitSerializer', {}),
+            'lieu_stockage': ('LieuStockageSerializer', {}),
+        }
 
+class StockMovementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = StockMovement
         fields = '__all__'
-        extra_kwargs = {
-            'produit': {'required': False, 'read_only': True},
-            'lieu_stockage': {'required': False, 'read_only': True}
+        expansions = {
+            'produit': ('ProduitSerializer', {}),
+            'lieu_stockage_source': ('LieuStockageSerializer', {}),
+            'lieu_stockage_destination': ('LieuStockageSerializer', {}),
         }
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Client
         fields = '__all__'
 
-class LigneFactureSerializer(serializers.ModelSerializer):
-    produit_detail = ProduitSerializer(source='produit', read_only=True)
-    produit = serializers.PrimaryKeyRelatedField(queryset=Produit.objects.all(), write_only=True)
-
+class LigneFactureSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = LigneFacture
         fields = '__all__'
-        read_only_fields = ['montant_total_ligne']
-
-class FactureSerializer(serializers.ModelSerializer):
-    lignes = LigneFactureSerializer(many=True, read_only=True)
-    client_detail = ClientSerializer(source='client', read_only=True)
-    client = serializers.PrimaryKeyRelatedField(queryset=Client.objects.all(), write_only=True)
+        read_only_fields = ['total_ligne']
+        expansions = {
+            'produit': ('ProduitSerializer', {}),
+            'facture': ('FactureSerializer', {}),
+        }
 
+class FactureSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Facture
         fields = '__all__'
         read_only_fields = ['montant_total']
+        expansions = {
+            'client': ('ClientSerializer', {}),
+            'lignes': ('LigneFactureSerializer', {'source': 'lignes_facture', 'many': True}),
+            'paiements': ('PaiementSerializer', {'source': 'paiement_set', 'many': True}),
+        }
 
-class PaiementSerializer(serializers.ModelSerializer):
-    facture_detail = FactureSerializer(source='facture', read_only=True)
-    facture = serializers.PrimaryKeyRelatedField(queryset=Facture.objects.all(), write_only=True)
-
+class PaiementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Paiement
         fields = '__all__'
+        expansions = {
+            'facture': ('FactureSerializer', {}),
+        }
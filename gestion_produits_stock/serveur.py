@@ -0,0 +1,149 @@
+# gestion_produits_stock/serveur.py
+
+import multiprocessing
+import os
+import signal
+import sys
+from functools import partial
+
+from django.conf import settings
+
+from .maintenance import demarrer_maintenance_periodique
+
+# Serveur de production commun à run.py et à 'manage.py lancer_serveur' (les
+# postes de caisse) : plusieurs requêtes traitées en même temps, pour qu'une
+# facture PDF ou un rapport lent ne bloque pas les autres caisses.
+#   - WSGI : waitress (pur Python, fonctionne sous Windows) avec SERVEUR_FILS
+#     fils, connexions persistantes (keep-alive) fermées après
+#     SERVEUR_DELAI_INACTIVITE secondes sans activité, et jusqu'à
+#     SERVEUR_DELAI_ARRET secondes laissées aux requêtes en cours à l'arrêt ;
+#   - ASGI (eisf/asgi.py) : uvicorn, sur SERVEUR_PROCESSUS processus, mêmes délais.
+# Sans waitress, retour au serveur wsgiref d'origine (une requête à la fois).
+# Les PDF par lots demandés depuis le web sont produits par un processus à
+# part ('generer_pdf_lot --surveiller'), lancé et arrêté avec le serveur.
+# Hébergement Linux (Procfile) : gunicorn, configuré par gunicorn.conf.py, et
+# l'exécutant des lots en processus 'worker'.
+# Comparaison des serveurs (wsgiref, waitress, uvicorn) sur la base locale :
+#   python manage.py mesurer_serveur --serveur wsgiref|waitress|uvicorn
+
+SERVEUR_HOTE = getattr(settings, 'SERVEUR_HOTE', '0.0.0.0')
+SERVEUR_PORT = getattr(settings, 'SERVEUR_PORT', 8000)
+# Requêtes traitées simultanément (par processus)
+SERVEUR_FILS = getattr(settings, 'SERVEUR_FILS', 8)
+SERVEUR_PROCESSUS = getattr(settings, 'SERVEUR_PROCESSUS', 1)
+# Connexion inactive (keep-alive, ou client qui n'envoie plus rien) fermée après ce délai (s)
+SERVEUR_DELAI_INACTIVITE = getattr(settings, 'SERVEUR_DELAI_INACTIVITE', 30)
+# Au-delà, les nouvelles connexions attendent
+SERVEUR_CONNEXIONS_MAX = getattr(settings, 'SERVEUR_CONNEXIONS_MAX', 100)
+# Temps laissé aux requêtes en cours lors d'un arrêt (s)
+SERVEUR_DELAI_ARRET = getattr(settings, 'SERVEUR_DELAI_ARRET', 30)
+
+
+def _arret_sur_signal():
+    # SIGTERM (arrêt du service) traité comme Ctrl+C : waitress termine
+    # alors les requêtes en cours avant de fermer
+    def arreter(signum, frame):
+        raise KeyboardInterrupt
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, arreter)
+
+
+def servir_wsgi(hote=None, port=None, fils=None, sortie=print):
+    """
+    Sert eisf.wsgi avec waitress, ou avec le serveur wsgiref s'il n'est pas installé.
+    """
+    from eisf.wsgi import application
+
+    hote, port = hote or SERVEUR_HOTE, port or SERVEUR_PORT
+    try:
+        from waitress import create_server
+    except ImportError:
+        from wsgiref.simple_server import make_server
+        sortie("waitress n'est pas installé : serveur simple, une requête à la fois.")
+        sortie(f"Lancement du serveur sur http://{hote}:{port}/")
+        make_server(hote, port, application).serve_forever()
+        return
+
+    serveur = create_server(
+        application, host=hote, port=port,
+        threads=fils or SERVEUR_FILS,
+        channel_timeout=SERVEUR_DELAI_INACTIVITE,
+        connection_limit=SERVEUR_CONNEXIONS_MAX,
+        ident='eisf',
+    )
+    # À l'arrêt, waitress n'attend les requêtes en cours que 5 s par défaut
+    repartiteur = serveur.task_dispatcher
+    repartiteur.shutdown = partial(repartiteur.shutdown, timeout=SERVEUR_DELAI_ARRET)
+    _arret_sur_signal()
+    sortie(f"Lancement du serveur sur http://{hote}:{port}/ ({fils or SERVEUR_FILS} fils)")
+    serveur.run()
+
+
+def servir_asgi(hote=None, port=None, processus=None, sortie=print):
+    """
+    Sert eisf.asgi avec uvicorn (à installer séparément).
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        sortie("Le mode ASGI demande uvicorn (pip install uvicorn).")
+        sys.exit(1)
+
+    hote, port = hote or SERVEUR_HOTE, port or SERVEUR_PORT
+    sortie(f"Lancement du serveur ASGI sur http://{hote}:{port}/ ({processus or SERVEUR_PROCESSUS} processus)")
+    uvicorn.run(
+        'eisf.asgi:application', host=hote, port=port,
+        workers=processus or SERVEUR_PROCESSUS,
+        timeout_keep_alive=SERVEUR_DELAI_INACTIVITE,
+        timeout_graceful_shutdown=SERVEUR_DELAI_ARRET,
+        limit_concurrency=SERVEUR_CONNEXIONS_MAX,
+        lifespan='off',
+    )
+
+
+def _surveiller_lots():
+    # Processus lancé par 'spawn' : ce module y est réimporté avant la
+    # configuration de Django, d'où les imports de l'application différés
+    import django
+    django.setup()
+    from django.core.management import call_command
+
+    # Exécutable sans console : pas de sortie standard
+    sortie = sys.stdout or open(os.devnull, 'w')
+    try:
+        call_command('generer_pdf_lot', surveiller=True, stdout=sortie, stderr=sys.stderr or sortie)
+    except KeyboardInterrupt:
+        pass
+
+
+def demarrer_executant_lots(sortie=print):
+    """
+    Lance l'exécutant des PDF par lots dans un processus séparé, hors des fils
+    qui servent les requêtes. Retourne le processus, ou None si les lots sont
+    exécutés dans le serveur (LOTS_PDF_EN_ARRIERE_PLAN).
+    """
+    from .lots_pdf import LOTS_PDF_EN_ARRIERE_PLAN
+
+    if LOTS_PDF_EN_ARRIERE_PLAN:
+        return None
+    # Pas en démon : il lance lui-même les processus de rendu
+    executant = multiprocessing.get_context('spawn').Process(target=_surveiller_lots, name='lots_pdf')
+    executant.start()
+    sortie(f"Exécutant des PDF par lots démarré (processus {executant.pid})")
+    return executant
+
+
+def servir(hote=None, port=None, fils=None, processus=None, asgi=False, sortie=print):
+    # Point de contrôle WAL et statistiques SQLite, voir maintenance.py
+    demarrer_maintenance_periodique()
+    executant = demarrer_executant_lots(sortie)
+    try:
+        if asgi:
+            servir_asgi(hote, port, processus, sortie)
+        else:
+            servir_wsgi(hote, port, fils, sortie)
+    finally:
+        if executant is not None:
+            # Un lot interrompu est repris au prochain démarrage (lots abandonnés)
+            executant.terminate()
+            executant.join(SERVEUR_DELAI_ARRET)
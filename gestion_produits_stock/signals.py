@@ -0,0 +1,90 @@
+# gestion_produits_stock/signals.py
+
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .alertes import invalider_alertes
+from .catalogue import TYPE_LIEU, journaliser, signaler_modification_catalogue
+from .lieux import invalider_cache_lieux
+from .models import Facture, LieuStockage, Paiement, Produit, Stock
+from .recherche import TABLE_FTS, installer_index_recherche
+
+
+# --- Invalidation de l'instantané des alertes ---
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+@receiver(post_save, sender=Facture)
+@receiver(post_delete, sender=Facture)
+@receiver(post_save, sender=Paiement)
+@receiver(post_delete, sender=Paiement)
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+def invalider_alertes_sur_modification(sender, **kwargs):
+    """
+    Toute écriture sur le stock, les factures, les paiements ou les seuils
+    des produits rend l'instantané des alertes obsolète.
+    """
+    invalider_alertes()
+
+
+# --- Version du catalogue (table des codes, caches de recherche) ---
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+def signaler_produit_modifie(sender, instance, **kwargs):
+    signaler_modification_catalogue([instance.pk])
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def signaler_stock_modifie(sender, instance, **kwargs):
+    # Le signal part avant la mise à jour de _etat_enregistre : ancien produit inclus
+    ancien_produit_id = getattr(instance, '_etat_enregistre', (None, None))[0]
+    signaler_modification_catalogue([instance.produit_id, ancien_produit_id])
+
+
+# --- Cache des clés primaires des lieux de stockage ---
+@receiver(post_save, sender=LieuStockage)
+@receiver(post_delete, sender=LieuStockage)
+def invalider_lieux_sur_modification(sender, instance, **kwargs):
+    """
+    Un lieu renommé ou supprimé ne doit plus être résolu depuis le cache du
+    processus ; il est aussi journalisé pour la synchronisation.
+    """
+    invalider_cache_lieux()
+    invalider_alertes()
+    journaliser(TYPE_LIEU, [instance.pk])
+
+
+# --- Maintien du stock total dénormalisé ---
+@receiver(post_delete, sender=Stock)
+def retirer_stock_du_total(sender, instance, **kwargs):
+    """
+    La suppression d'une ligne de stock (directe ou en cascade) retire sa
+    quantité du stock total du produit.
+    """
+    Stock.reporter_sur_total(instance.produit_id, -instance.quantite)
+
+
+# --- Maintien du montant payé dénormalisé des factures ---
+@receiver(post_delete, sender=Paiement)
+def retirer_paiement_de_facture(sender, instance, **kwargs):
+    """
+    La suppression d'un paiement retire son montant du montant payé de la facture.
+    """
+    Facture.reporter_paiement(instance.facture_id, -instance.montant_paye)
+
+
+# --- Index plein texte des produits ---
+@receiver(post_migrate)
+def reinstaller_index_recherche(sender, app_config=None, using='default', **kwargs):
+    """
+    SQLite recrée la table des produits lors de certaines migrations (ajout de
+    colonne, contrainte...), ce qui supprime les triggers de l'index : on les
+    remet, si l'index existe (migration 0009 appliquée).
+    """
+    if app_config is None or app_config.name != 'gestion_produits_stock':
+        return
+    connexion = connections[using]
+    if TABLE_FTS in connexion.introspection.table_names():
+        installer_index_recherche(connexion)
@@ -0,0 +1,216 @@
+# gestion_produits_stock/stocks.py
+
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .alertes import invalider_alertes
+from .catalogue import signaler_modification_catalogue
+from .lieux import id_lieu_vente
+from .models import Produit, Stock, StockMovement
+
+
+def _upsert_stocks(deltas):
+    """
+    Ajoute chaque delta {(produit_id, lieu_id): delta} à sa ligne de stock ou
+    la crée, en une seule instruction atomique : deux écritures simultanées,
+    même sur une ligne qui n'existe pas encore, ne peuvent pas s'écraser.
+    """
+    if not deltas:
+        return
+    if connection.vendor in ('sqlite', 'postgresql'):
+        table = connection.ops.quote_name(Stock._meta.db_table)
+        with connection.cursor() as curseur:
+            curseur.execute(
+                f"""INSERT INTO {table} (produit_id, lieu_stockage_id, quantite)
+                VALUES {', '.join(['(%s, %s, %s)'] * len(deltas))}
+                ON CONFLICT (produit_id, lieu_stockage_id)
+                DO UPDATE SET quantite = {table}.quantite + excluded.quantite""",
+                [valeur for (produit_id, lieu_id), delta in deltas.items() for valeur in (produit_id, lieu_id, delta)],
+            )
+        return
+    # Autres bases : UPDATE par F(), INSERT sinon, et nouvel UPDATE si un
+    # autre processus a créé la ligne entre-temps
+    for (produit_id, lieu_stockage_id), delta in deltas.items():
+        lignes = Stock.objects.filter(produit_id=produit_id, lieu_stockage_id=lieu_stockage_id)
+        if lignes.update(quantite=F('quantite') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                Stock.objects.bulk_create([Stock(produit_id=produit_id, lieu_stockage_id=lieu_stockage_id, quantite=delta)])
+        except IntegrityError:
+            lignes.update(quantite=F('quantite') + delta)
+
+
+class _StockModifie(Exception):
+    pass
+
+
+def appliquer_deltas_stock(deltas, stocks):
+    """
+    Ajoute les deltas {(produit_id, lieu_id): delta} aux lignes de stock
+    verrouillées 'stocks' (mêmes clés) en un UPDATE, crée les lignes manquantes
+    (deltas positifs) par un upsert, une autre transaction pouvant les créer
+    en même temps, et reporte la somme par produit sur le stock total.
+    Un retrait n'est appliqué que si la ligne couvre encore la quantité : si le
+    stock a changé depuis la lecture des lignes, rien n'est modifié et la
+    fonction retourne False (à l'appelant de relire et de recontrôler).
+    """
+    deltas = {cle: delta for cle, delta in deltas.items() if delta}
+    existants = {cle: delta for cle, delta in deltas.items() if cle in stocks}
+    if existants:
+        condition = Q()
+        for cle, delta in existants.items():
+            if delta < 0:
+                condition |= Q(pk=stocks[cle].pk, quantite__gte=-delta)
+            else:
+                condition |= Q(pk=stocks[cle].pk)
+        try:
+            # Point de sauvegarde : un UPDATE partiel est annulé
+            with transaction.atomic():
+                nb = Stock.objects.filter(condition).update(quantite=Case(
+                    *[When(pk=stocks[cle].pk, then=F('quantite') + delta) for cle, delta in existants.items()],
+                    default=F('quantite'),
+                ))
+                if nb != len(existants):
+                    raise _StockModifie
+        except _StockModifie:
+            return False
+
+    _upsert_stocks({cle: delta for cle, delta in deltas.items() if cle not in stocks})
+
+    totaux = {}
+    for (produit_id, _), delta in deltas.items():
+        totaux[produit_id] = totaux.get(produit_id, Decimal('0.00')) + delta
+    totaux = {produit_id: delta for produit_id, delta in totaux.items() if delta}
+    if totaux:
+        Produit.objects.filter(pk__in=list(totaux)).update(stock_total=Case(
+            *[When(pk=produit_id, then=F('stock_total') + delta) for produit_id, delta in totaux.items()],
+            default=F('stock_total'),
+        ), date_derniere_maj=timezone.now())
+    return True
+
+
+def ajuster_stock(produit_id, lieu_stockage_id, delta, description=None):
+    """
+    Ajoute 'delta' (positif ou négatif) à la quantité d'un produit dans un lieu,
+    en créant la ligne de stock si besoin, par un INSERT ... ON CONFLICT DO UPDATE.
+    Le stock total dénormalisé du produit est mis à jour dans la même
+    transaction, par une expression F(). Avec une 'description', le mouvement
+    correspondant (ENTREE ou SORTIE selon le signe) est enregistré aussi ;
+    il est retourné.
+    """
+    delta = Decimal(delta)
+    if not delta:
+        return None
+    with transaction.atomic():
+        _upsert_stocks({(produit_id, lieu_stockage_id): delta})
+        Stock.reporter_sur_total(produit_id, delta)
+        mouvement = None
+        if description is not None:
+            mouvement = StockMovement.objects.create(
+                produit_id=produit_id,
+                quantite=abs(delta),
+                type_mouvement='ENTREE' if delta > 0 else 'SORTIE',
+                lieu_stockage_destination_id=lieu_stockage_id if delta > 0 else None,
+                lieu_stockage_source_id=lieu_stockage_id if delta < 0 else None,
+                description=description,
+            )
+        # L'upsert ne déclenche pas les signaux
+        invalider_alertes()
+        signaler_modification_catalogue([produit_id])
+    return mouvement
+
+
+def annoter_stock_principal(queryset, lieu_stockage_id=None):
+    """
+    Ajoute 'stock_principal' (quantité au lieu de vente, par défaut "Principal")
+    à un queryset de Produit, en une seule requête quel que soit le nombre de produits.
+    """
+    if lieu_stockage_id is None:
+        lieu_stockage_id = id_lieu_vente()
+    quantite_principal = Stock.objects.filter(
+        produit=OuterRef('pk'), lieu_stockage_id=lieu_stockage_id
+    ).values('quantite')[:1]
+    return queryset.annotate(
+        stock_principal=Coalesce(
+            Subquery(quantite_principal), Decimal('0.00'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+# Nombre maximum de produits par appel aux points d'accès de stock groupés
+NB_PRODUITS_MAX_PAR_LOT = 500
+
+
+def lire_ids(params, nom):
+    """
+    Lit une liste d'identifiants passée en '?ids=1,2,3' ou '?ids=1&ids=2'
+    (QueryDict de Django ou query_params de DRF), sans doublons.
+    Lève ValueError si une valeur n'est pas un entier.
+    """
+    ids = []
+    for valeur in params.getlist(nom):
+        ids.extend(int(morceau) for morceau in valeur.split(',') if morceau.strip())
+    return list(dict.fromkeys(ids))
+
+
+def quantites_par_lieu(produit_ids, lieu_stockage_ids=None):
+    """
+    Retourne {produit_id: {lieu_id: quantité}} pour tous les produits demandés,
+    en une seule requête IN. Avec une liste de lieux, chaque couple demandé est
+    présent (0 s'il n'a pas de ligne de stock) ; sans liste, seuls les lieux où
+    le produit a une ligne de stock apparaissent.
+    """
+    stocks = Stock.objects.filter(produit_id__in=produit_ids)
+    if lieu_stockage_ids is None:
+        resultat = {produit_id: {} for produit_id in produit_ids}
+    else:
+        stocks = stocks.filter(lieu_stockage_id__in=lieu_stockage_ids)
+        resultat = {
+            produit_id: {lieu_id: Decimal('0.00') for lieu_id in lieu_stockage_ids}
+            for produit_id in produit_ids
+        }
+    for produit_id, lieu_id, quantite in stocks.values_list('produit_id', 'lieu_stockage_id', 'quantite'):
+        resultat[produit_id][lieu_id] = quantite
+    return resultat
+
+
+def _total_reel():
+    return Coalesce(
+        Subquery(
+            Stock.objects.filter(produit=OuterRef('pk'))
+            .values('produit')
+            .annotate(total=Sum('quantite'))
+            .values('total')
+        ),
+        Decimal('0.00'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def produits_en_ecart():
+    """
+    Retourne les produits dont le stock total dénormalisé diffère de la somme
+    réelle des lignes de Stock, annotés avec 'stock_total_reel'.
+    """
+    return Produit.objects.annotate(stock_total_reel=_total_reel()).exclude(
+        stock_total=F('stock_total_reel')
+    )
+
+
+def recalculer_stocks_totaux():
+    """
+    Reconstruit Produit.stock_total à partir de la table Stock en une requête.
+    Retourne le nombre de produits mis à jour.
+    """
+    with transaction.atomic():
+        # Seuls les produits corrigés changent de date de mise à jour
+        Produit.objects.filter(pk__in=produits_en_ecart().values('pk')).update(date_derniere_maj=timezone.now())
+        nb = Produit.objects.update(stock_total=_total_reel())
+    invalider_alertes()
+    return nb
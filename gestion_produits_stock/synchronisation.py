@@ -0,0 +1,80 @@
+# gestion_produits_stock/synchronisation.py
+
+from django.conf import settings
+from django.db.models import Max
+
+from .catalogue import TYPE_LIEU, TYPE_PRODUIT
+from .models import JournalModification, LieuStockage, Produit
+from .stocks import quantites_par_lieu
+
+# Synchronisation incrémentale du catalogue (caisses distantes, application de
+# bureau). Chaque écriture sur un produit, ses prix ou ses stocks, ou sur un
+# lieu de stockage, ajoute une ligne au journal dans la transaction de
+# l'écriture (catalogue.journaliser) ; le client garde le plus grand
+# identifiant reçu (le jeton) et ne redemande que les objets modifiés depuis.
+# Un objet journalisé qui n'existe plus est renvoyé comme supprimé.
+# Les identifiants du journal sont validés dans l'ordre (voir journaliser) :
+# une transaction encore ouverte ne peut pas valider plus tard un identifiant
+# inférieur à un jeton déjà remis à un client.
+
+# Nombre maximum d'objets par réponse ; au-delà, 'suite' invite à rappeler
+SYNC_NB_OBJETS_MAX = getattr(settings, 'SYNC_NB_OBJETS_MAX', 1000)
+
+CHAMPS_PRODUIT = (
+    'id', 'nom', 'code_produit', 'categorie_id', 'fournisseur_id',
+    'prix_achat', 'prix_unitaire', 'seuil_alerte',
+)
+
+
+def changements_depuis(jeton, limite=SYNC_NB_OBJETS_MAX):
+    """
+    Objets modifiés depuis 'jeton' (0 : tout le catalogue), au plus 'limite',
+    dans l'ordre de leur dernière modification :
+    {'jeton', 'suite', 'produits', 'produits_supprimes', 'lieux', 'lieux_supprimes'}.
+    Chaque produit porte ses prix et ses quantités par lieu ('stocks'), qui
+    remplacent entièrement celles de la copie locale.
+    """
+    objets = list(
+        JournalModification.objects.filter(pk__gt=jeton)
+        .values('type_objet', 'objet_id')
+        .annotate(dernier=Max('pk'))
+        .order_by('dernier')[:limite + 1]
+    )
+    suite = len(objets) > limite
+    objets = objets[:limite]
+    nouveau_jeton = objets[-1]['dernier'] if objets else jeton
+
+    produit_ids = [o['objet_id'] for o in objets if o['type_objet'] == TYPE_PRODUIT]
+    lieu_ids = [o['objet_id'] for o in objets if o['type_objet'] == TYPE_LIEU]
+
+    produits = []
+    if produit_ids:
+        stocks = quantites_par_lieu(produit_ids)
+        for produit in Produit.objects.filter(pk__in=produit_ids).order_by('pk').values(*CHAMPS_PRODUIT):
+            for champ in ('prix_achat', 'prix_unitaire'):
+                produit[champ] = str(produit[champ])
+            produit['stocks'] = {lieu_id: str(quantite) for lieu_id, quantite in stocks[produit['id']].items()}
+            produits.append(produit)
+    lieux = list(LieuStockage.objects.filter(pk__in=lieu_ids).order_by('pk').values('id', 'nom'))
+
+    presents = {p['id'] for p in produits}
+    lieux_presents = {l['id'] for l in lieux}
+    return {
+        'jeton': str(nouveau_jeton),
+        'suite': suite,
+        'produits': produits,
+        'produits_supprimes': [pk for pk in produit_ids if pk not in presents],
+        'lieux': lieux,
+        'lieux_supprimes': [pk for pk in lieu_ids if pk not in lieux_presents],
+    }
+
+
+def compacter_journal():
+    """
+    Supprime les entrées remplacées par une entrée plus récente du même objet :
+    aucun client ne perd d'information, le journal garde une ligne par objet
+    (suppressions comprises). Retourne le nombre d'entrées supprimées.
+    """
+    dernieres = JournalModification.objects.values('type_objet', 'objet_id').annotate(dernier=Max('pk')).values('dernier')
+    nb, _ = JournalModification.objects.exclude(pk__in=dernieres).delete()
+    return nb
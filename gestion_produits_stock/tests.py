@@ -1,3 +1,666 @@
-from django.test import TestCase
+import datetime
+import re
+import threading
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .catalogue import TYPE_PRODUIT, TableCodes, journaliser, signaler_modification_catalogue
+from .comptes import factures_en_ecart, imputer_paiement, reconcilier_factures
+from .forms import StockForm
+from .lots_pdf import remettre_en_attente_abandonnes, signaler_executant
+from .models import (
+    Client, Facture, JournalModification, LieuStockage, LigneFacture, Paiement, Produit, Stock, StockMovement,
+    TravailPDF,
+)
+from .mouvements import enregistrer_mouvements
+from .pagination import parametre_entier
+from .rapports import factures_de_la_periode
+from .recherche import NB_CANDIDATS, index_disponible, rechercher_produits
+from .routage import ALIAS_REPLIQUE, RoutageReplique, lecture_principale, lecture_seule
+from .stocks import ajuster_stock, produits_en_ecart, recalculer_stocks_totaux
+from .synchronisation import changements_depuis
+from .ventes import StockInsuffisant, enregistrer_vente, lieu_de_la_vente, modifier_lignes_vente
+from .views import LigneFactureFormSet
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN est propre à SQLite")
+class PlanRequetesTests(TestCase):
+    """
+    Vérifie que les requêtes fréquentes utilisent un index (pas de parcours complet de table).
+    """
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [ligne[-1] for ligne in cursor.fetchall()]
+
+    def assertUtiliseIndex(self, queryset, index=None):
+        plan = self.plan(queryset)
+        for etape in plan:
+            if etape.startswith('SCAN') and 'USING' not in etape:
+                self.fail(f"Parcours complet de table : {plan}")
+        self.assertTrue(any('USING' in etape for etape in plan), plan)
+        if index:
+            self.assertTrue(any(index in etape for etape in plan), plan)
+
+    def test_alertes_dettes_impayees(self):
+        self.assertUtiliseIndex(
+            Facture.objects.filter(est_payee=False, date_echeance__lt=timezone.localdate()).order_by('date_echeance'),
+            'facture_impayee_echeance_idx',
+        )
+
+    def test_factures_par_periode(self):
+        aujourdhui = timezone.localdate()
+        self.assertUtiliseIndex(
+            factures_de_la_periode(aujourdhui - datetime.timedelta(days=30), aujourdhui),
+            'facture_date_id_idx',
+        )
+
+    def test_liste_factures_paginee(self):
+        self.assertUtiliseIndex(Facture.objects.order_by('-date_facturation', '-id')[:51], 'facture_date_id_idx')
+
+    def test_factures_impayees_du_client(self):
+        self.assertUtiliseIndex(
+            Facture.objects.filter(client_id=1, est_payee=False).order_by('date_facturation'),
+            'facture_client_impayee_idx',
+        )
+
+    def test_paiements_d_une_facture(self):
+        self.assertUtiliseIndex(Paiement.objects.filter(facture_id=1))
+
+    def test_historique_mouvements(self):
+        self.assertUtiliseIndex(StockMovement.objects.order_by('-date_mouvement', '-id')[:51], 'mouvement_date_id_idx')
+
+    def test_mouvements_d_une_facture(self):
+        self.assertUtiliseIndex(StockMovement.objects.filter(facture_id=1, type_mouvement='SORTIE'))
+
+    def test_stock_par_produit_et_lieu(self):
+        self.assertUtiliseIndex(Stock.objects.filter(produit_id=1, lieu_stockage_id=1))
+
+    def test_stock_au_lieu_principal(self):
+        self.assertUtiliseIndex(Stock.objects.filter(produit_id=1, lieu_stockage__nom="Principal"))
+
+    def test_produit_par_code(self):
+        self.assertUtiliseIndex(Produit.objects.filter(code_produit='ABC123'))
+
+    def test_liste_produits_paginee(self):
+        self.assertUtiliseIndex(Produit.objects.order_by('nom', 'id')[:51], 'produit_nom_id_idx')
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "Base SQLite en mémoire : les connexions concurrentes s'y verrouillent par table",
+)
+class AjusterStockConcurrentTests(TransactionTestCase):
+    """
+    Des entrées simultanées sur une même ligne de stock ne doivent perdre
+    aucune mise à jour (upsert atomique de stocks.ajuster_stock).
+    """
+    NB_FILS = 8
+    NB_ENTREES = 25
+
+    def setUp(self):
+        self.produit = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        self.lieu = LieuStockage.objects.create(nom="Principal")
+
+    def test_entrees_paralleles(self):
+        depart = threading.Barrier(self.NB_FILS)
+        erreurs = []
+
+        def livrer():
+            try:
+                depart.wait()
+                for _ in range(self.NB_ENTREES):
+                    ajuster_stock(self.produit.pk, self.lieu.pk, 1, description="Livraison")
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        fils = [threading.Thread(target=livrer) for _ in range(self.NB_FILS)]
+        for f in fils:
+            f.start()
+        for f in fils:
+            f.join()
+
+        self.assertEqual(erreurs, [])
+        attendu = self.NB_FILS * self.NB_ENTREES
+        self.assertEqual(Stock.objects.get(produit=self.produit, lieu_stockage=self.lieu).quantite, attendu)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.stock_total, attendu)
+        self.assertEqual(StockMovement.objects.filter(produit=self.produit, type_mouvement='ENTREE').count(), attendu)
+
+
+class FiltresListesTests(TestCase):
+    def test_identifiant_invalide_ignore(self):
+        requete = RequestFactory().get('/stocks/', {'produit': 'abc', 'lieu_stockage': '3', 'client': ''})
+        self.assertIsNone(parametre_entier(requete, 'produit'))
+        self.assertEqual(parametre_entier(requete, 'lieu_stockage'), 3)
+        self.assertIsNone(parametre_entier(requete, 'client'))
+        self.assertIsNone(parametre_entier(requete, 'categorie'))
+
+
+class EnregistrementVenteTests(TestCase):
+    def setUp(self):
+        self.lieu = LieuStockage.objects.create(nom="Principal")
+        self.client_vente = Client.objects.create(nom="Awa")
+        self.produits = [
+            Produit.objects.create(nom=f"Produit {i}", code_produit=f"P{i}", prix_unitaire=Decimal('100.00'))
+            for i in range(6)
+        ]
+        for produit in self.produits:
+            ajuster_stock(produit.pk, self.lieu.pk, 5)
+
+    def _ligne(self, produit, quantite):
+        return LigneFacture(produit=produit, quantite=Decimal(quantite), prix_unitaire_negocie=Decimal('100'))
+
+    def _vendre(self, lignes):
+        return enregistrer_vente(Facture(client=self.client_vente), lignes, self.lieu.pk)
+
+    def _quantite(self, produit):
+        return Stock.objects.get(produit=produit, lieu_stockage=self.lieu).quantite
+
+    def test_nombre_de_requetes_constant(self):
+        with CaptureQueriesContext(connection) as une_ligne:
+            self._vendre([self._ligne(self.produits[0], '1')])
+        with self.assertNumQueries(len(une_ligne)):
+            self._vendre([self._ligne(produit, '1') for produit in self.produits[1:]])
+
+    def test_stock_insuffisant_rien_n_est_ecrit(self):
+        lignes = [self._ligne(self.produits[0], '2'), self._ligne(self.produits[1], '6')]
+        with self.assertRaises(StockInsuffisant) as contexte:
+            self._vendre(lignes)
+        self.assertEqual(contexte.exception.produit, self.produits[1])
+        self.assertFalse(Facture.objects.exists())
+        self.assertFalse(LigneFacture.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(type_mouvement='SORTIE').exists())
+        self.assertEqual([self._quantite(p) for p in self.produits[:2]], [5, 5])
+        self.produits[1].refresh_from_db()
+        self.assertEqual(self.produits[1].stock_total, 5)
+
+    def test_meme_produit_sur_plusieurs_lignes(self):
+        riz = self.produits[0]
+        # 3 + 3 dépasse le stock de 5, même si chaque ligne seule passerait
+        with self.assertRaises(StockInsuffisant):
+            self._vendre([self._ligne(riz, '3'), self._ligne(riz, '3')])
+        self.assertEqual(self._quantite(riz), 5)
+
+        facture = self._vendre([self._ligne(riz, '2'), self._ligne(riz, '1.5')])
+        self.assertEqual(self._quantite(riz), Decimal('1.5'))
+        riz.refresh_from_db()
+        self.assertEqual(riz.stock_total, Decimal('1.5'))
+        self.assertEqual(facture.montant_total, Decimal('350.00'))
+        self.assertEqual(facture.lignes_facture.count(), 2)
+
+    def test_mouvements_relies_a_la_facture(self):
+        facture = self._vendre([self._ligne(self.produits[0], '2'), self._ligne(self.produits[1], '1')])
+        mouvements = StockMovement.objects.filter(facture=facture).order_by('produit_id')
+        self.assertEqual(
+            [(m.produit_id, m.quantite, m.type_mouvement, m.lieu_stockage_source_id) for m in mouvements],
+            [(self.produits[0].pk, 2, 'SORTIE', self.lieu.pk), (self.produits[1].pk, 1, 'SORTIE', self.lieu.pk)],
+        )
+        self.assertEqual(lieu_de_la_vente(facture), self.lieu.pk)
+
+
+class ModificationVenteTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        self.principal = LieuStockage.objects.create(nom="Principal")
+        self.annexe = LieuStockage.objects.create(nom="Annexe")
+        ajuster_stock(self.produit.pk, self.annexe.pk, 10)
+        self.facture = enregistrer_vente(
+            Facture(client=Client.objects.create(nom="Awa")),
+            [LigneFacture(produit=self.produit, quantite=Decimal('3'), prix_unitaire_negocie=Decimal('500'))],
+            self.annexe.pk,
+        )
+
+    def test_suppression_des_lignes_remise_au_lieu_de_la_vente(self):
+        ligne = self.facture.lignes_facture.get()
+        formset = LigneFactureFormSet({
+            'lignes-TOTAL_FORMS': '1', 'lignes-INITIAL_FORMS': '1',
+            'lignes-0-id': str(ligne.pk), 'lignes-0-produit': str(self.produit.pk),
+            'lignes-0-quantite': '3', 'lignes-0-prix_unitaire_negocie': '500', 'lignes-0-DELETE': 'on',
+        }, instance=self.facture, prefix='lignes')
+        self.assertTrue(formset.is_valid(), formset.errors)
+        # Modifiée depuis une caisse rattachée au lieu principal
+        modifier_lignes_vente(self.facture, formset, self.principal.pk)
+
+        self.assertEqual(Stock.objects.get(produit=self.produit, lieu_stockage=self.annexe).quantite, 10)
+        self.assertFalse(Stock.objects.filter(lieu_stockage=self.principal).exists())
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.stock_total, 10)
+
+    def test_formulaire_perime_decompte_une_seule_fois(self):
+        ligne = self.facture.lignes_facture.get()
+        donnees = {
+            'lignes-TOTAL_FORMS': '1', 'lignes-INITIAL_FORMS': '1',
+            'lignes-0-id': str(ligne.pk), 'lignes-0-produit': str(self.produit.pk),
+            'lignes-0-quantite': '5', 'lignes-0-prix_unitaire_negocie': '500',
+        }
+        # Même facture ouverte sur deux caisses, enregistrée deux fois (3 -> 5)
+        formsets = [
+            LigneFactureFormSet(donnees, instance=self.facture, prefix='lignes') for _ in range(2)
+        ]
+        for formset in formsets:
+            self.assertTrue(formset.is_valid(), formset.errors)
+        for formset in formsets:
+            modifier_lignes_vente(self.facture, formset, self.principal.pk)
+
+        self.assertEqual(Stock.objects.get(produit=self.produit, lieu_stockage=self.annexe).quantite, 5)
+        self.assertEqual(
+            list(StockMovement.objects.filter(facture=self.facture).values_list('type_mouvement', 'quantite')),
+            [('SORTIE', 3), ('SORTIE', 2)],
+        )
+        self.facture.refresh_from_db()
+        self.assertEqual(self.facture.montant_total, Decimal('2500.00'))
+
+
+class RechercheProduitsTests(TestCase):
+    def setUp(self):
+        if not index_disponible():
+            self.skipTest("Index plein texte FTS5 indisponible")
+        cache.clear()
+        lieu = LieuStockage.objects.create(nom="Principal")
+        self.lieu_id = lieu.pk
+        Produit.objects.bulk_create([
+            Produit(nom=f"Riz parfumé long grain sac {i}", code_produit=f"RP{i}", prix_unitaire=Decimal('500.00'))
+            for i in range(NB_CANDIDATS + 50)
+        ])
+
+    def test_meilleure_correspondance_au_dela_des_candidats(self):
+        riz = Produit.objects.create(nom="Riz", code_produit="RIZ-1", prix_unitaire=Decimal('400.00'))
+        self.assertEqual(rechercher_produits("ri", self.lieu_id)[0], riz)
+
+    def test_code_contenant_la_saisie(self):
+        produit = Produit.objects.create(nom="Savon", code_produit="ABC123", prix_unitaire=Decimal('250.00'))
+        self.assertIn(produit, rechercher_produits("123", self.lieu_id))
+
+    def test_code_exact_avec_ponctuation_en_premier(self):
+        produit = Produit.objects.create(nom="Riz brisé", code_produit="RIZ-25", prix_unitaire=Decimal('300.00'))
+        Produit.objects.create(nom="Riz 25 kg", code_produit="R25", prix_unitaire=Decimal('9000.00'))
+        for saisie in ("RIZ-25", "riz-25"):
+            with self.subTest(saisie=saisie):
+                reponse = self.client.get('/recherche-produit-ajax/', {'term': saisie})
+                self.assertEqual(reponse.json()[0]['id'], produit.pk)
+
+    def test_code_exact_depuis_l_ecran_de_vente(self):
+        # L'écran de vente doit envoyer la saisie telle quelle (request.term de
+        # jQuery UI), pas sa forme normalisée qui ne sert qu'au cache local
+        produit = Produit.objects.create(nom="Riz brisé", code_produit="RIZ-25", prix_unitaire=Decimal('300.00'))
+        Produit.objects.create(nom="Riz 25 kg", code_produit="R25", prix_unitaire=Decimal('9000.00'))
+        self.client.force_login(User.objects.create_superuser('caissier'))
+        page = self.client.get('/vente/').content.decode()
+        envoye = re.search(r"data:\s*\{\s*term:\s*([\w.]+)", page).group(1)
+        self.assertEqual(envoye, 'request.term')
+        saisie = "RIZ-25"
+        reponse = self.client.get('/recherche-produit-ajax/', {'term': saisie}, HTTP_X_SEQUENCE='1')
+        self.assertEqual(reponse.json()[0]['id'], produit.pk)
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "Base SQLite en mémoire : les connexions concurrentes s'y verrouillent par table",
+)
+class MouvementsConcurrentsTests(TransactionTestCase):
+    """
+    Des lots simultanés qui créent la même ligne de stock ne doivent ni
+    échouer sur la contrainte d'unicité ni perdre de quantité.
+    """
+    NB_FILS = 6
+
+    def setUp(self):
+        self.produit = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        self.lieu = LieuStockage.objects.create(nom="Dépôt")
+
+    def test_entrees_paralleles_sur_une_nouvelle_ligne(self):
+        depart = threading.Barrier(self.NB_FILS)
+        erreurs = []
+
+        def livrer():
+            try:
+                depart.wait()
+                enregistrer_mouvements([{
+                    'produit': self.produit.pk, 'type_mouvement': 'ENTREE', 'quantite': '2',
+                    'lieu_stockage_destination': self.lieu.pk,
+                }])
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        fils = [threading.Thread(target=livrer) for _ in range(self.NB_FILS)]
+        for f in fils:
+            f.start()
+        for f in fils:
+            f.join()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(Stock.objects.get(produit=self.produit, lieu_stockage=self.lieu).quantite, 2 * self.NB_FILS)
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.stock_total, 2 * self.NB_FILS)
+
+
+class EntreeStockFormTests(TestCase):
+    def test_quantite_negative_refusee(self):
+        produit = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        lieu = LieuStockage.objects.create(nom="Principal")
+        for quantite, valide in (('-5', False), ('0', False), ('3', True)):
+            with self.subTest(quantite=quantite):
+                form = StockForm({'produit': produit.pk, 'lieu_stockage': lieu.pk, 'quantite': quantite})
+                self.assertEqual(form.is_valid(), valide, form.errors)
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    "Base SQLite en mémoire : les connexions concurrentes s'y verrouillent par table",
+)
+class JournalConcurrentTests(TransactionTestCase):
+    """
+    Un jeton de synchronisation remis à un client ne doit jamais dépasser
+    une entrée du journal encore en cours de validation.
+    """
+
+    def test_entrees_validees_dans_l_ordre(self):
+        ouverte, valider = threading.Event(), threading.Event()
+        ids = {}
+
+        def ecrire(nom, attendre):
+            try:
+                with transaction.atomic():
+                    journaliser(TYPE_PRODUIT, [1])
+                    ids[nom] = JournalModification.objects.latest('pk').pk
+                    ouverte.set()
+                    if attendre:
+                        valider.wait(5)
+            finally:
+                connections.close_all()
+
+        lente = threading.Thread(target=ecrire, args=('lente', True))
+        lente.start()
+        ouverte.wait(5)
+        rapide = threading.Thread(target=ecrire, args=('rapide', False))
+        rapide.start()
+        rapide.join(0.5)
+        # Tant que la première transaction est ouverte, le jeton reste en deçà
+        self.assertEqual(changements_depuis(0)['jeton'], '0')
+        valider.set()
+        lente.join()
+        rapide.join()
+        self.assertGreater(ids['rapide'], ids['lente'])
+        self.assertEqual(changements_depuis(0)['jeton'], str(ids['rapide']))
+
+
+class TravauxPDFAbandonnesTests(TestCase):
+    def test_travail_sans_signe_de_vie_remis_en_attente(self):
+        maintenant = timezone.now()
+        abandonne = TravailPDF.objects.create(
+            type_document='releves', statut='EN_COURS', nb_faits=40,
+            date_activite=maintenant - datetime.timedelta(hours=1),
+        )
+        actif = TravailPDF.objects.create(type_document='releves', statut='EN_COURS', date_activite=maintenant)
+        self.assertEqual(remettre_en_attente_abandonnes(delai=600), 1)
+        abandonne.refresh_from_db()
+        actif.refresh_from_db()
+        self.assertEqual((abandonne.statut, abandonne.nb_faits), ('EN_ATTENTE', 0))
+        self.assertEqual(actif.statut, 'EN_COURS')
+
+
+class DemandeLotPDFTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_refusee_sans_executant(self):
+        reponse = self.client.post('/factures/lots-pdf/', {'type_document': 'releves'})
+        self.assertEqual(reponse.status_code, 503)
+        self.assertIn('generer_pdf_lot --surveiller', reponse.json()['error'])
+        self.assertFalse(TravailPDF.objects.exists())
+
+    def test_acceptee_avec_un_executant_actif(self):
+        signaler_executant(60)
+        reponse = self.client.post('/factures/lots-pdf/', {'type_document': 'releves'})
+        self.assertEqual(reponse.status_code, 202)
+        self.assertEqual(TravailPDF.objects.get().statut, 'EN_ATTENTE')
+
+
+class TableCodesTests(TestCase):
+    """
+    Chaque processus serveur a sa table des codes ; elle suit les écritures
+    faites ailleurs par la version lue dans la base, sans dépendre du cache.
+    """
+
+    def test_modification_vue_par_une_autre_table(self):
+        riz = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        lieu = LieuStockage.objects.create(nom="Principal")
+        table = TableCodes()
+        self.assertEqual(table.scanner("RIZ", lieu.pk)['prix_unitaire'], Decimal('500.00'))
+        version = table.version
+
+        Produit.objects.filter(pk=riz.pk).update(code_produit="RIZ-5", prix_unitaire=Decimal('550.00'))
+        signaler_modification_catalogue([riz.pk])
+        cache.clear()
+        self.assertIsNone(table.scanner("RIZ", lieu.pk))
+        self.assertEqual(table.scanner("RIZ-5", lieu.pk)['prix_unitaire'], Decimal('550.00'))
+        self.assertGreater(table.version, version)
+
+    def test_scan_sans_requete_puis_jeton_renouvele_au_commit(self):
+        riz = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        lieu = LieuStockage.objects.create(nom="Principal")
+        table = TableCodes()
+        table.scanner("RIZ", lieu.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(table.scanner("RIZ", lieu.pk)['id'], riz.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ajuster_stock(riz.pk, lieu.pk, 7)
+        self.assertEqual(table.scanner("RIZ", lieu.pk)['stock_quantite'], 7)
+        with self.assertNumQueries(0):
+            table.scanner("RIZ", lieu.pk)
+
+
+class RoutageRepliqueTests(unittest.TestCase):
+    @mock.patch('gestion_produits_stock.routage.settings', SimpleNamespace(DATABASES={'default': {}, ALIAS_REPLIQUE: {}}))
+    def test_seuls_les_modeles_de_l_application_vont_sur_la_replique(self):
+        routeur = RoutageReplique()
+        self.assertIsNone(routeur.db_for_read(Produit))
+        with lecture_seule():
+            self.assertEqual(routeur.db_for_read(Produit), ALIAS_REPLIQUE)
+            self.assertIsNone(routeur.db_for_read(User))
+            with lecture_principale():
+                self.assertIsNone(routeur.db_for_read(Stock))
+
+
+class AuthentificationAPITests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        self.lieu = LieuStockage.objects.create(nom="Principal")
+        self.mouvement = {
+            'produit': self.produit.pk, 'lieu_stockage_destination': self.lieu.pk,
+            'quantite': '5', 'type_mouvement': 'ENTREE',
+        }
+
+    def test_ecriture_anonyme_refusee(self):
+        reponse = self.client.post('/api/mouvements-stock/', self.mouvement, content_type='application/json')
+        self.assertEqual(reponse.status_code, 401)
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(self.client.get('/api/changes/').status_code, 401)
+
+    def test_jeton_de_l_application_de_bureau(self):
+        jeton = Token.objects.create(user=User.objects.create_user('caisse'))
+        entetes = {'HTTP_AUTHORIZATION': f'Token {jeton.key}'}
+        reponse = self.client.post('/api/mouvements-stock/', self.mouvement, content_type='application/json', **entetes)
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(self.client.get('/api/changes/', **entetes).status_code, 200)
+
+
+class TotauxPaiementsTests(TestCase):
+    """
+    Montant payé, solde et statut dénormalisés sur Facture, tenus à jour par
+    Paiement.save() et la suppression des paiements.
+    """
+
+    def setUp(self):
+        client = Client.objects.create(nom="Awa")
+        self.facture = Facture.objects.create(client=client, montant_total=Decimal('1000.00'))
+        self.autre = Facture.objects.create(client=client, montant_total=Decimal('500.00'))
+
+    def _totaux(self, facture):
+        facture.refresh_from_db()
+        return facture.montant_paye, facture.solde, facture.est_payee
+
+    def test_creation_modification_et_changement_de_facture(self):
+        paiement = Paiement.objects.create(facture=self.facture, montant_paye=Decimal('300.00'))
+        self.assertEqual(self._totaux(self.facture), (Decimal('300.00'), Decimal('700.00'), False))
+
+        paiement = Paiement.objects.get(pk=paiement.pk)
+        paiement.montant_paye = Decimal('1000.00')
+        paiement.save()
+        self.assertEqual(self._totaux(self.facture), (Decimal('1000.00'), Decimal('0.00'), True))
+
+        paiement.facture = self.autre
+        paiement.montant_paye = Decimal('500.00')
+        paiement.save()
+        self.assertEqual(self._totaux(self.facture), (Decimal('0.00'), Decimal('1000.00'), False))
+        self.assertEqual(self._totaux(self.autre), (Decimal('500.00'), Decimal('0.00'), True))
+
+    def test_suppression(self):
+        Paiement.objects.create(facture=self.facture, montant_paye=Decimal('200.00'))
+        Paiement.objects.create(facture=self.facture, montant_paye=Decimal('800.00')).delete()
+        self.assertEqual(self._totaux(self.facture), (Decimal('200.00'), Decimal('800.00'), False))
+
+    def test_enregistrement_de_facture_sans_ecraser_un_paiement_concurrent(self):
+        en_memoire = Facture.objects.get(pk=self.facture.pk)
+        # Paiement enregistré par une autre requête après la lecture de la facture
+        Paiement.objects.create(facture=Facture.objects.get(pk=self.facture.pk), montant_paye=Decimal('400.00'))
+        en_memoire.montant_total = Decimal('1200.00')
+        en_memoire.save()
+        self.assertEqual(self._totaux(self.facture), (Decimal('400.00'), Decimal('800.00'), False))
+        self.assertEqual((en_memoire.montant_paye, en_memoire.solde), (Decimal('400.00'), Decimal('800.00')))
+
+    def test_reconciliation(self):
+        Paiement.objects.create(facture=self.facture, montant_paye=Decimal('600.00'))
+        Facture.objects.filter(pk=self.facture.pk).update(montant_paye=Decimal('0.00'), solde=Decimal('1000.00'))
+        Facture.objects.filter(pk=self.autre.pk).update(est_payee=True)
+        self.assertEqual(reconcilier_factures(), 2)
+        self.assertEqual(self._totaux(self.facture), (Decimal('600.00'), Decimal('400.00'), False))
+        self.assertEqual(self._totaux(self.autre), (Decimal('0.00'), Decimal('500.00'), False))
+        self.assertFalse(factures_en_ecart().exists())
+
+
+class ImputationPaiementTests(TestCase):
+    """
+    Paiement d'un client réparti sur ses factures impayées, de la plus ancienne
+    à la plus récente (comptes.imputer_paiement, hors de Paiement.save()).
+    """
+
+    def setUp(self):
+        self.client_compte = Client.objects.create(nom="Awa")
+        maintenant = timezone.now()
+        self.factures = []
+        # Créées dans le désordre : l'ordre d'imputation suit la date de facturation
+        for jours, montant in ((1, '300.00'), (3, '100.00'), (2, '200.00')):
+            facture = Facture.objects.create(client=self.client_compte, montant_total=Decimal(montant))
+            Facture.objects.filter(pk=facture.pk).update(date_facturation=maintenant - datetime.timedelta(days=jours))
+            self.factures.append(facture)
+        self.recente, self.ancienne, self.moyenne = self.factures
+
+    def _totaux(self, facture):
+        facture.refresh_from_db()
+        return facture.montant_paye, facture.solde, facture.est_payee
+
+    def test_paiement_superieur_au_du_refuse(self):
+        with self.assertRaises(ValidationError):
+            imputer_paiement(self.client_compte, Decimal('600.01'), 'ESPECES')
+        self.assertFalse(Paiement.objects.exists())
+        for facture in self.factures:
+            self.assertEqual(self._totaux(facture), (Decimal('0.00'), facture.montant_total, False))
+
+    def test_repartition_de_la_plus_ancienne_a_la_plus_recente(self):
+        paiements = imputer_paiement(self.client_compte, Decimal('250.00'), 'MOBILE_MONEY')
+        self.assertEqual(
+            [(p.facture_id, p.montant_paye) for p in paiements],
+            [(self.ancienne.pk, Decimal('100.00')), (self.moyenne.pk, Decimal('150.00'))],
+        )
+        self.assertEqual(self._totaux(self.ancienne), (Decimal('100.00'), Decimal('0.00'), True))
+        self.assertEqual(self._totaux(self.moyenne), (Decimal('150.00'), Decimal('50.00'), False))
+        self.assertEqual(self._totaux(self.recente), (Decimal('0.00'), Decimal('300.00'), False))
+        self.assertFalse(factures_en_ecart().exists())
+
+    def test_solde_complet_puis_reconciliation(self):
+        imputer_paiement(self.client_compte, Decimal('250.00'), 'ESPECES')
+        # La facture déjà réglée est ignorée ; le reste dû est exactement 350
+        imputer_paiement(self.client_compte, Decimal('350.00'), 'ESPECES')
+        for facture in self.factures:
+            self.assertEqual(self._totaux(facture), (facture.montant_total, Decimal('0.00'), True))
+        self.assertEqual(Paiement.objects.filter(facture=self.ancienne).count(), 1)
+        self.assertEqual(reconcilier_factures(), 0)
+
+
+class StockTotalTests(TestCase):
+    """
+    Produit.stock_total, somme dénormalisée des lignes de Stock, tenue à jour
+    par Stock.save() et la suppression des lignes.
+    """
+
+    def setUp(self):
+        self.riz = Produit.objects.create(nom="Riz", code_produit="RIZ", prix_unitaire=Decimal('500.00'))
+        self.mil = Produit.objects.create(nom="Mil", code_produit="MIL", prix_unitaire=Decimal('400.00'))
+        self.principal = LieuStockage.objects.create(nom="Principal")
+        self.annexe = LieuStockage.objects.create(nom="Annexe")
+        self.stock = Stock.objects.create(produit=self.riz, lieu_stockage=self.principal, quantite=Decimal('10'))
+        Stock.objects.create(produit=self.riz, lieu_stockage=self.annexe, quantite=Decimal('4'))
+
+    def _total(self, produit):
+        produit.refresh_from_db()
+        return produit.stock_total
+
+    def test_changement_de_quantite(self):
+        stock = Stock.objects.get(pk=self.stock.pk)
+        stock.quantite = Decimal('7.5')
+        stock.save()
+        self.assertEqual(self._total(self.riz), Decimal('11.5'))
+
+    def test_quantite_en_expression_f(self):
+        self.stock.quantite = F('quantite') - 3
+        self.stock.save()
+        self.assertEqual(self.stock.quantite, Decimal('7'))
+        self.assertEqual(self._total(self.riz), Decimal('11'))
+
+    def test_ligne_deplacee_vers_un_autre_produit(self):
+        stock = Stock.objects.get(pk=self.stock.pk)
+        stock.produit = self.mil
+        stock.save()
+        self.assertEqual(self._total(self.riz), Decimal('4'))
+        self.assertEqual(self._total(self.mil), Decimal('10'))
+
+    def test_suppression(self):
+        Stock.objects.get(pk=self.stock.pk).delete()
+        self.assertEqual(self._total(self.riz), Decimal('4'))
+
+    def test_recalcul_corrige_l_ecart(self):
+        Produit.objects.filter(pk=self.riz.pk).update(stock_total=Decimal('99'))
+        Stock.objects.filter(pk=self.stock.pk).update(quantite=Decimal('1'))
+        recalculer_stocks_totaux()
+        self.assertEqual(self._total(self.riz), Decimal('5'))
+        self.assertEqual(self._total(self.mil), Decimal('0'))
+        self.assertFalse(produits_en_ecart().exists())
+
+    def test_total_de_l_api_sans_agregat(self):
+        self.client.force_login(User.objects.create_user('gestion'))
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get('/api/stocks/total_par_produit/', {'produit_id': self.riz.pk})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['total_quantite_globale'], 14)
+        self.assertFalse([q for q in requetes if Stock._meta.db_table in q['sql']])
@@ -52,6 +52,9 @@ urlpatterns = [
     path('factures/', views.liste_factures, name='liste_factures'),
     path('factures/detail/<int:pk>/', views.detail_facture, name='detail_facture'),
     path('factures/generer-pdf/<int:pk>/', views.generer_facture_pdf, name='generer_facture_pdf'),
+    path('factures/lots-pdf/', views.lancer_lot_pdf, name='lancer_lot_pdf'),
+    path('factures/lots-pdf/<int:pk>/', views.statut_lot_pdf, name='statut_lot_pdf'),
+    path('factures/lots-pdf/<int:pk>/fichier/', views.fichier_lot_pdf, name='fichier_lot_pdf'),
     path('factures/<int:facture_pk>/ajouter_paiement/', views.ajouter_paiement, name='ajouter_paiement'),
 
     # URLs pour l'interface de vente
@@ -62,4 +65,6 @@ urlpatterns = [
     # URLs pour l'API (recherche AJAX)
     path('recherche-produit-ajax/', views.recherche_produit_ajax, name='recherche_produit_ajax'),
     path('get-product-stock-ajax/', views.get_product_stock_ajax, name='get_product_stock_ajax'),
+    path('stocks-produits-ajax/', views.stocks_produits_ajax, name='stocks_produits_ajax'),
+    path('scanner-code-ajax/', views.scanner_code_ajax, name='scanner_code_ajax'),
 ]
\ No newline at end of file
@@ -0,0 +1,199 @@
+# gestion_produits_stock/ventes.py
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .alertes import invalider_alertes
+from .catalogue import signaler_modification_catalogue
+from .models import LigneFacture, Stock, StockMovement
+from .stocks import appliquer_deltas_stock
+
+
+class StockInsuffisant(ValidationError):
+    """
+    Levée quand une vente demande plus que le stock disponible au lieu de vente.
+    """
+
+    def __init__(self, produit, disponible):
+        self.produit = produit
+        self.disponible = disponible
+        super().__init__(
+            f"Quantité insuffisante pour le produit {produit.nom}. Stock disponible : {disponible}."
+        )
+
+
+def _quantites_par_produit(lignes):
+    # Un même produit peut figurer sur plusieurs lignes : on cumule les quantités
+    quantites = OrderedDict()
+    produits = {}
+    for ligne in lignes:
+        quantites[ligne.produit_id] = quantites.get(ligne.produit_id, Decimal('0.00')) + ligne.quantite
+        produits[ligne.produit_id] = ligne.produit
+    return quantites, produits
+
+
+def _stocks_verrouilles(lieu_stockage_id, produit_ids):
+    return {
+        (stock.produit_id, stock.lieu_stockage_id): stock
+        for stock in Stock.objects.select_for_update().filter(
+            lieu_stockage_id=lieu_stockage_id, produit_id__in=list(produit_ids)
+        )
+    }
+
+
+def decrementer_stocks(quantites, produits, lieu_stockage_id):
+    """
+    Retire les quantités {produit_id: quantité} du lieu de stockage (une quantité
+    négative remet du stock), sans jamais rendre un stock négatif. Les lignes de
+    stock sont verrouillées et contrôlées en une requête, puis modifiées par un
+    seul UPDATE conditionnel ; le stock total des produits suit par un second UPDATE.
+    Lève StockInsuffisant si un produit manque.
+    """
+    quantites = {produit_id: quantite for produit_id, quantite in quantites.items() if quantite}
+    if not quantites:
+        return
+    stocks = _stocks_verrouilles(lieu_stockage_id, quantites)
+    while True:
+        for produit_id, quantite in quantites.items():
+            stock = stocks.get((produit_id, lieu_stockage_id))
+            if quantite > 0 and (stock is None or stock.quantite < quantite):
+                raise StockInsuffisant(produits[produit_id], stock.quantite if stock else 0)
+        deltas = {(produit_id, lieu_stockage_id): -quantite for produit_id, quantite in quantites.items()}
+        if appliquer_deltas_stock(deltas, stocks):
+            break
+        # Le stock a changé entre la lecture et l'écriture (base sans verrou de
+        # ligne) : rien n'a été modifié, on relit les lignes et on recontrôle
+        stocks = _stocks_verrouilles(lieu_stockage_id, quantites)
+    signaler_modification_catalogue(quantites)
+
+
+def enregistrer_vente(facture, lignes, lieu_stockage_id):
+    """
+    Enregistre une nouvelle facture et ses lignes (instances de LigneFacture non
+    sauvegardées) en décomptant le stock du lieu de vente, dans une transaction.
+    Le nombre de requêtes est constant, quel que soit le nombre de lignes.
+    """
+    quantites, produits = _quantites_par_produit(lignes)
+    with transaction.atomic():
+        decrementer_stocks(quantites, produits, lieu_stockage_id)
+
+        montant_total = Decimal('0.00')
+        for ligne in lignes:
+            ligne.total_ligne = ligne.quantite * ligne.prix_unitaire_negocie
+            montant_total += ligne.total_ligne
+        facture.montant_total = montant_total
+        facture.save()
+
+        for ligne in lignes:
+            ligne.facture = facture
+        LigneFacture.objects.bulk_create(lignes)
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                produit_id=ligne.produit_id,
+                lieu_stockage_source_id=lieu_stockage_id,
+                quantite=ligne.quantite,
+                type_mouvement='SORTIE',
+                description=f"Vente (Facture #{facture.id})",
+                facture=facture,
+            )
+            for ligne in lignes
+        ])
+        # Les UPDATE et bulk_create ne déclenchent pas les signaux
+        invalider_alertes()
+    return facture
+
+
+def lieu_de_la_vente(facture, defaut=None):
+    """
+    Lieu de stockage d'où la vente a été décomptée (source de son premier
+    mouvement de sortie), ou 'defaut' pour une facture sans mouvement relié.
+    """
+    lieu_id = (
+        StockMovement.objects
+        .filter(facture=facture, type_mouvement='SORTIE', lieu_stockage_source__isnull=False)
+        .order_by('id')
+        .values_list('lieu_stockage_source_id', flat=True)
+        .first()
+    )
+    return defaut if lieu_id is None else lieu_id
+
+
+def _lignes_enregistrees(lignes):
+    """
+    Quantités {produit_id: quantité} et montant total des lignes de facture données.
+    """
+    quantites = {}
+    montant_total = Decimal('0.00')
+    for produit_id, quantite, total_ligne in lignes.values_list('produit_id', 'quantite', 'total_ligne'):
+        if produit_id is not None:
+            quantites[produit_id] = quantites.get(produit_id, Decimal('0.00')) + quantite
+        montant_total += total_ligne
+    return quantites, montant_total
+
+
+def modifier_lignes_vente(facture, formset, lieu_par_defaut):
+    """
+    Applique un formset de lignes (validé) à une facture existante. Seule la
+    différence nette par produit entre anciennes et nouvelles lignes touche le
+    stock, et chaque différence est tracée par un mouvement compensatoire :
+    l'historique des mouvements n'est jamais supprimé.
+    Le stock est corrigé au lieu d'où la vente a été décomptée, quelle que soit
+    la caisse qui modifie ; 'lieu_par_defaut' sert aux factures sans mouvement relié.
+    """
+    produits = {
+        form.cleaned_data['produit'].pk: form.cleaned_data['produit']
+        for form in formset.forms
+        if form.cleaned_data and not form.cleaned_data.get('DELETE')
+    }
+
+    with transaction.atomic():
+        # État enregistré relu sous verrou, et non les valeurs initiales du
+        # formulaire : une modification concurrente de la même facture
+        # (formulaire ouvert deux fois) serait sinon décomptée deux fois
+        anciennes, _ = _lignes_enregistrees(
+            LigneFacture.objects.select_for_update().filter(facture=facture)
+        )
+        lieu_stockage_id = lieu_de_la_vente(facture, lieu_par_defaut)
+
+        modifiees = formset.save(commit=False)
+        for ligne in modifiees:
+            ligne.total_ligne = ligne.quantite * ligne.prix_unitaire_negocie
+        if formset.deleted_objects:
+            LigneFacture.objects.filter(pk__in=[ligne.pk for ligne in formset.deleted_objects]).delete()
+        if formset.new_objects:
+            LigneFacture.objects.bulk_create(formset.new_objects)
+        existantes = [ligne for ligne, _ in formset.changed_objects]
+        if existantes:
+            LigneFacture.objects.bulk_update(
+                existantes, ['produit', 'quantite', 'prix_unitaire_negocie', 'total_ligne']
+            )
+
+        nouvelles, montant_total = _lignes_enregistrees(LigneFacture.objects.filter(facture=facture))
+        deltas = {
+            produit_id: nouvelles.get(produit_id, Decimal('0.00')) - anciennes.get(produit_id, Decimal('0.00'))
+            for produit_id in set(anciennes) | set(nouvelles)
+        }
+        deltas = {produit_id: delta for produit_id, delta in deltas.items() if delta}
+        decrementer_stocks(deltas, produits, lieu_stockage_id)
+
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                produit_id=produit_id,
+                lieu_stockage_source_id=lieu_stockage_id if delta > 0 else None,
+                lieu_stockage_destination_id=lieu_stockage_id if delta < 0 else None,
+                quantite=abs(delta),
+                type_mouvement='SORTIE' if delta > 0 else 'ENTREE',
+                description=f"Modification vente (Facture #{facture.id})",
+                facture=facture,
+            )
+            for produit_id, delta in deltas.items()
+        ])
+
+        facture.montant_total = montant_total
+        facture.save()
+        if deltas:
+            invalider_alertes()
+    return facture
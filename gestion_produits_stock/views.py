@@ -5,18 +5,16 @@ from django.forms import inlineformset_factory
 from django.contrib import messages
 from django.db import transaction
 from django.core.exceptions import ValidationError
-from django.http import HttpResponse, JsonResponse
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
 from decimal import Decimal
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from django.db.models import Sum, Q, F
 from django.db.models.functions import Coalesce
 from django.contrib.auth.decorators import permission_required
+from django.views.decorators.http import require_POST
 from django.contrib.auth import logout
 from django.urls import reverse
 
@@ -24,16 +22,31 @@ import traceback
 
 from .models import (
     Facture, LigneFacture, Produit, Client, StockMovement,
-    Stock, LieuStockage, Paiement, Categorie, Fournisseur
+    Stock, LieuStockage, Paiement, Categorie, Fournisseur, TravailPDF
 )
+from .catalogue import table_codes
+from .comptes import imputer_paiement, releve_client
+from .factures_pdf import donnees_facture, empreinte_facture, ouvrir_pdf_facture
+from .lieux import CAISSE_COOKIE, id_lieu_vente
+from .lots_pdf import chemin_fichier, creer_travail, executant_disponible, lancer_travail
+from .pagination import paginer_par_curseur, parametre_entier
+from .rapports import REGROUPEMENTS, factures_de_la_periode, rapport_benefice
+from .recherche import etag_recherche, normaliser_terme, resultats_recherche
+from .revalidation import liste_conditionnelle
+from .routage import lecture_seule
+from .stocks import (
+    NB_PRODUITS_MAX_PAR_LOT, ajuster_stock, annoter_stock_principal, lire_ids, quantites_par_lieu
+)
+from .ventes import StockInsuffisant, enregistrer_vente, modifier_lignes_vente
 from .forms import (
-    FactureForm, LigneFactureForm, ProduitForm, ClientForm,
+    FactureForm, LigneFactureForm, BaseLigneFactureFormSet, ProduitForm, ClientForm,
     LieuStockageForm, StockForm, StockMovementForm, CategorieForm,
     FournisseurForm, PaiementForm
 )
 
 LigneFactureFormSet = inlineformset_factory(
-    Facture, LigneFacture, form=LigneFactureForm, extra=1, can_delete=True
+    Facture, LigneFacture, form=LigneFactureForm, formset=BaseLigneFactureFormSet,
+    extra=1, can_delete=True
 )
 
 # --- Vue du Tableau de Bord (Home) ---
@@ -53,39 +66,47 @@ def home(request):
         'total_produits': Produit.objects.count(),
         'total_factures': Facture.objects.count(),
         'solde_total': Facture.objects.filter(est_payee=False).aggregate(
-            solde=Coalesce(Sum('montant_total'), Decimal('0.00')) - Coalesce(Sum('paiement__montant_paye'), Decimal('0.00'))
-        )['solde'] or Decimal('0.00'),
+            solde=Coalesce(Sum('solde'), Decimal('0.00'))
+        )['solde'],
     }
     
     return render(request, 'gestion_produits_stock/home.html', context)
 
 
 # --- Nouvelle vue pour le bénéfice journalier ---
+@lecture_seule()
 def inventaire_benefice_journee(request):
     """
-    Calcule et affiche le bénéfice réalisé sur les ventes de la journée.
+    Calcule et affiche le bénéfice réalisé sur les ventes de la journée,
+    ou sur une période (?date_debut=&date_fin=) regroupée par jour, semaine,
+    mois, catégorie, fournisseur ou client (?regroupement=).
     """
-    aujourdhui = timezone.now().date()
-    factures_jour = Facture.objects.filter(date_facturation__date=aujourdhui)
-
-    revenu_total = Decimal('0.00')
-    cout_total = Decimal('0.00')
-
-    for facture in factures_jour:
-        lignes_facture = LigneFacture.objects.filter(facture=facture).select_related('produit')
-        for ligne in lignes_facture:
-            revenu_total += ligne.quantite * ligne.prix_unitaire_negocie
-            if ligne.produit and ligne.produit.prix_achat:
-                cout_total += ligne.quantite * ligne.produit.prix_achat
-    
-    benefice_journee = revenu_total - cout_total
+    aujourdhui = timezone.localdate()
+    try:
+        date_debut = parse_date(request.GET.get('date_debut') or '') or aujourdhui
+        date_fin = parse_date(request.GET.get('date_fin') or '') or date_debut
+    except ValueError:
+        messages.error(request, "Date invalide : rapport affiché pour aujourd'hui.")
+        date_debut = date_fin = aujourdhui
+    if date_fin < date_debut:
+        date_debut, date_fin = date_fin, date_debut
+
+    rapport = rapport_benefice(date_debut, date_fin, request.GET.get('regroupement'))
+    totaux = rapport['totaux']
+
+    factures_jour = factures_de_la_periode(date_debut, date_fin).select_related('client').order_by('date_facturation')
     
     context = {
-        'date_jour': aujourdhui,
-        'revenu_total': revenu_total,
-        'cout_total': cout_total,
-        'benefice_journee': benefice_journee,
+        'date_jour': date_debut,
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'revenu_total': totaux['revenu'],
+        'cout_total': totaux['cout'],
+        'benefice_journee': totaux['marge'],
         'factures_jour': factures_jour,
+        'regroupement': rapport['regroupement'],
+        'regroupements': [(cle, libelle) for cle, (libelle, _) in REGROUPEMENTS.items()],
+        'groupes': rapport['groupes'],
     }
     
     return render(request, 'gestion_produits_stock/inventaire_benefice_journee.html', context)
@@ -101,9 +122,14 @@ def deconnexion_vente(request):
 
 
 # --- Vues pour les Clients ---
+@liste_conditionnelle(Client)
 def liste_clients(request):
     clients = Client.objects.all()
-    return render(request, 'gestion_produits_stock/liste_clients.html', {'clients': clients})
+    recherche = request.GET.get('q', '').strip()
+    if recherche:
+        clients = clients.filter(Q(nom__icontains=recherche) | Q(telephone__icontains=recherche))
+    page = paginer_par_curseur(request, clients, ('nom', 'id'))
+    return render(request, 'gestion_produits_stock/liste_clients.html', {'clients': page, 'page': page, 'recherche': recherche})
 
 def ajouter_client(request):
     if request.method == 'POST':
@@ -136,6 +162,7 @@ def supprimer_client(request, pk):
         return redirect('liste_clients')
     return render(request, 'gestion_produits_stock/confirmer_suppression.html', {'objet': client, 'type': 'Client'})
 
+@lecture_seule()
 def historique_client(request, pk):
     """
     Vue pour afficher l'historique des factures d'un client.
@@ -156,36 +183,6 @@ def banque_caisse_client(request, pk):
     Permet de faire un paiement partiel.
     """
     client = get_object_or_404(Client, pk=pk)
-    factures = Facture.objects.filter(client=client).order_by('-date_facturation')
-    
-    # Calcul du montant total dû et du solde total
-    total_factures = factures.aggregate(
-        total_du=Coalesce(Sum('montant_total'), Decimal('0.00'))
-    )['total_du']
-
-    total_paiements = Paiement.objects.filter(
-        facture__client=client
-    ).aggregate(
-        total_paye=Coalesce(Sum('montant_paye'), Decimal('0.00'))
-    )['total_paye']
-    
-    solde_total = total_factures - total_paiements
-
-    # Préparation des factures avec leur solde individuel
-    factures_avec_solde = []
-    for facture in factures:
-        total_paye_facture = Paiement.objects.filter(
-            facture=facture
-        ).aggregate(
-            total_paye=Coalesce(Sum('montant_paye'), Decimal('0.00'))
-        )['total_paye']
-        facture.solde_restant = facture.montant_total - total_paye_facture
-        factures_avec_solde.append(facture)
-
-    # Historique des paiements du client
-    historique_paiements = Paiement.objects.filter(
-        facture__client=client
-    ).order_by('-date_paiement')
     
     # Gérer le formulaire de paiement
     if request.method == 'POST':
@@ -194,61 +191,29 @@ def banque_caisse_client(request, pk):
             montant_paye = form.cleaned_data['montant_paye']
             methode_paiement = form.cleaned_data['methode_paiement']
             
-            # Vérifier si le paiement est supérieur au solde total
-            if montant_paye > solde_total:
-                messages.error(request, f"Le montant du paiement ({montant_paye} FCFA) dépasse le solde total dû ({solde_total} FCFA).")
+            # Appliquer le paiement aux factures non payées les plus anciennes
+            try:
+                imputer_paiement(client, montant_paye, methode_paiement)
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
             else:
-                # Appliquer le paiement aux factures non payées les plus anciennes
-                montant_restant_a_imputer = montant_paye
-                factures_non_payees = Facture.objects.filter(
-                    client=client, est_payee=False
-                ).order_by('date_facturation')
-
-                for facture_a_payer in factures_non_payees:
-                    total_paye_facture = Paiement.objects.filter(
-                        facture=facture_a_payer
-                    ).aggregate(
-                        total_paye=Coalesce(Sum('montant_paye'), Decimal('0.00'))
-                    )['total_paye']
-                    
-                    solde_facture = facture_a_payer.montant_total - total_paye_facture
-                    
-                    if montant_restant_a_imputer > Decimal('0.00'):
-                        montant_impute = min(montant_restant_a_imputer, solde_facture)
-                        
-                        # Créer le paiement
-                        Paiement.objects.create(
-                            facture=facture_a_payer,
-                            montant_paye=montant_impute,
-                            methode_paiement=methode_paiement
-                        )
-                        
-                        montant_restant_a_imputer -= montant_impute
-                        
-                        # Mettre à jour le statut de la facture si elle est entièrement payée
-                        if solde_facture - montant_impute <= Decimal('0.00'):
-                            facture_a_payer.est_payee = True
-                            facture_a_payer.save()
-
                 messages.success(request, f"Paiement de {montant_paye} FCFA enregistré avec succès.")
             
             return redirect('banque_caisse_client', pk=client.pk)
     else:
         form = PaiementForm()
 
-    context = {
+    # Factures, totaux et historique des paiements en un nombre constant de requêtes
+    context = releve_client(client)
+    context.update({
         'client': client,
-        'factures': factures_avec_solde,
-        'total_factures': total_factures,
-        'total_paiements': total_paiements,
-        'solde_total': solde_total,
-        'historique_paiements': historique_paiements,
         'form': form,
-    }
+    })
     return render(request, 'gestion_produits_stock/banque_caisse_client.html', context)
 
 
 # --- Vues pour les Catégories ---
+@liste_conditionnelle(Categorie)
 def liste_categories(request):
     categories = Categorie.objects.all()
     return render(request, 'gestion_produits_stock/liste_categories.html', {'categories': categories})
@@ -286,9 +251,14 @@ def supprimer_categorie(request, pk):
 
 
 # --- Vues pour les Fournisseurs ---
+@liste_conditionnelle(Fournisseur)
 def liste_fournisseurs(request):
     fournisseurs = Fournisseur.objects.all()
-    return render(request, 'gestion_produits_stock/liste_fournisseurs.html', {'fournisseurs': fournisseurs})
+    recherche = request.GET.get('q', '').strip()
+    if recherche:
+        fournisseurs = fournisseurs.filter(nom__icontains=recherche)
+    page = paginer_par_curseur(request, fournisseurs, ('nom', 'id'))
+    return render(request, 'gestion_produits_stock/liste_fournisseurs.html', {'fournisseurs': page, 'page': page, 'recherche': recherche})
 
 def ajouter_fournisseur(request):
     if request.method == 'POST':
@@ -323,9 +293,20 @@ def supprimer_fournisseur(request, pk):
 
 
 # --- Vues pour les Produits ---
+@liste_conditionnelle(Produit, Categorie, Fournisseur)
 def liste_produits(request):
-    produits = Produit.objects.all()
-    return render(request, 'gestion_produits_stock/liste_produits.html', {'produits': produits})
+    produits = Produit.objects.select_related('categorie', 'fournisseur')
+    recherche = request.GET.get('q', '').strip()
+    if recherche:
+        produits = produits.filter(Q(nom__icontains=recherche) | Q(code_produit__icontains=recherche))
+    categorie_id = parametre_entier(request, 'categorie')
+    if categorie_id is not None:
+        produits = produits.filter(categorie_id=categorie_id)
+    fournisseur_id = parametre_entier(request, 'fournisseur')
+    if fournisseur_id is not None:
+        produits = produits.filter(fournisseur_id=fournisseur_id)
+    page = paginer_par_curseur(request, produits, ('nom', 'id'))
+    return render(request, 'gestion_produits_stock/liste_produits.html', {'produits': page, 'page': page, 'recherche': recherche})
 
 def ajouter_produit(request):
     if request.method == 'POST':
@@ -360,6 +341,7 @@ def supprimer_produit(request, pk):
 
 
 # --- Vues pour les Lieux de Stockage ---
+@liste_conditionnelle(LieuStockage)
 def liste_lieux_stockage(request):
     lieux_stockage = LieuStockage.objects.all()
     return render(request, 'gestion_produits_stock/liste_lieux_stockage.html', {'lieux_stockage': lieux_stockage})
@@ -398,8 +380,16 @@ def supprimer_lieu_stockage(request, pk):
 
 # --- Vues pour les Stocks ---
 def liste_stocks(request):
-    stocks = Stock.objects.all()
-    return render(request, 'gestion_produits_stock/liste_stocks.html', {'stocks': stocks})
+    stocks = Stock.objects.select_related('produit', 'lieu_stockage')
+    produit_id = parametre_entier(request, 'produit')
+    if produit_id is not None:
+        stocks = stocks.filter(produit_id=produit_id)
+    lieu_stockage_id = parametre_entier(request, 'lieu_stockage')
+    if lieu_stockage_id is not None:
+        stocks = stocks.filter(lieu_stockage_id=lieu_stockage_id)
+    # (produit, lieu_stockage) est la clé unique de Stock : l'ordre suit son index
+    page = paginer_par_curseur(request, stocks, ('produit_id', 'lieu_stockage_id'))
+    return render(request, 'gestion_produits_stock/liste_stocks.html', {'stocks': page, 'page': page})
 
 def detail_stock(request, pk):
     stock = get_object_or_404(Stock, pk=pk)
@@ -409,25 +399,13 @@ def entree_stock(request):
     if request.method == 'POST':
         form = StockForm(request.POST)
         if form.is_valid():
-            stock = form.save(commit=False)
-            
-            # Créer un mouvement de stock
-            StockMovement.objects.create(
-                produit=stock.produit,
-                lieu_stockage_destination=stock.lieu_stockage,
-                quantite=stock.quantite,
-                type_mouvement='ENTREE',
-                description=f"Entrée de stock via le formulaire."
-            )
-            
-            # Mettre à jour le stock existant ou en créer un nouveau
-            existing_stock, created = Stock.objects.get_or_create(
-                produit=stock.produit, 
-                lieu_stockage=stock.lieu_stockage,
-                defaults={'quantite': 0}
+            # Ajout à la ligne de stock (créée si besoin) et mouvement, dans une transaction
+            ajuster_stock(
+                form.cleaned_data['produit'].pk,
+                form.cleaned_data['lieu_stockage'].pk,
+                form.cleaned_data['quantite'],
+                description="Entrée de stock via le formulaire.",
             )
-            existing_stock.quantite += stock.quantite
-            existing_stock.save()
 
             messages.success(request, "Entrée de stock enregistrée avec succès.")
             return redirect('liste_stocks')
@@ -435,25 +413,44 @@ def entree_stock(request):
         form = StockForm()
     return render(request, 'gestion_produits_stock/entree_stock.html', {'form': form})
 
+@lecture_seule()
 def liste_mouvements_stock(request):
-    mouvements = StockMovement.objects.all().order_by('-date_mouvement')
-    return render(request, 'gestion_produits_stock/liste_mouvements_stock.html', {'mouvements': mouvements})
+    mouvements = StockMovement.objects.select_related(
+        'produit', 'lieu_stockage_source', 'lieu_stockage_destination'
+    )
+    if request.GET.get('type_mouvement'):
+        mouvements = mouvements.filter(type_mouvement=request.GET['type_mouvement'])
+    produit_id = parametre_entier(request, 'produit')
+    if produit_id is not None:
+        mouvements = mouvements.filter(produit_id=produit_id)
+    page = paginer_par_curseur(request, mouvements, ('-date_mouvement', '-id'))
+    context = {
+        'mouvements': page,
+        'page': page,
+        'types_mouvement': StockMovement.TYPE_CHOICES,
+        'type_selectionne': request.GET.get('type_mouvement', ''),
+    }
+    return render(request, 'gestion_produits_stock/liste_mouvements_stock.html', context)
 
 
 # --- Vues pour les Factures et Paiements ---
 def liste_factures(request):
-    client_id = request.GET.get('client')
-    if client_id:
-        factures = Facture.objects.filter(client__id=client_id).order_by('-date_facturation')
+    client_id = parametre_entier(request, 'client')
+    factures = Facture.objects.select_related('client')
+    if client_id is not None:
+        factures = factures.filter(client__id=client_id)
         client_selectionne = get_object_or_404(Client, pk=client_id)
     else:
-        factures = Facture.objects.all().order_by('-date_facturation')
         client_selectionne = None
+    if request.GET.get('est_payee') in ('0', '1'):
+        factures = factures.filter(est_payee=request.GET['est_payee'] == '1')
         
     clients = Client.objects.all().order_by('nom')
+    page = paginer_par_curseur(request, factures, ('-date_facturation', '-id'))
     
     context = {
-        'factures': factures,
+        'factures': page,
+        'page': page,
         'clients': clients,
         'client_selectionne': client_selectionne,
     }
@@ -465,8 +462,7 @@ def detail_facture(request, pk):
     lignes_facture = LigneFacture.objects.filter(facture=facture)
     paiements = Paiement.objects.filter(facture=facture).order_by('date_paiement')
 
-    total_paye = paiements.aggregate(Sum('montant_paye'))['montant_paye__sum'] or Decimal('0.00')
-    solde_du = facture.montant_total - total_paye
+    solde_du = facture.solde
     
     context = {
         'facture': facture,
@@ -477,101 +473,89 @@ def detail_facture(request, pk):
     return render(request, 'gestion_produits_stock/detail_facture.html', context)
 
 def generer_facture_pdf(request, pk):
-    facture = get_object_or_404(Facture, pk=pk)
-    lignes_facture = LigneFacture.objects.filter(facture=facture)
-    paiements = Paiement.objects.filter(facture=facture)
-
-    # Calcul du total payé et du solde dû
-    total_paye = sum(p.montant_paye for p in paiements)
-    solde_du = facture.montant_total - total_paye
-    
-    # Création du document PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter,
-                            rightMargin=72, leftMargin=72,
-                            topMargin=72, bottomMargin=72)
-    
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Style personnalisé pour l'en-tête
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=12,
-        alignment=1 # Centre
-    )
-
-    # En-tête du document
-    story.append(Paragraph(f"Facture # {facture.id}", header_style))
-    story.append(Paragraph(f"Date: {facture.date_facturation.strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Informations client
-    story.append(Paragraph(f"Client: {facture.client.nom}", styles['Normal']))
-    story.append(Paragraph(f"Adresse: {facture.client.adresse or 'N/A'}", styles['Normal']))
-    story.append(Paragraph(f"Téléphone: {facture.client.telephone or 'N/A'}", styles['Normal']))
-    story.append(Spacer(1, 0.2 * inch))
-    
-    # Tableau des produits
-    data = [['Produit', 'Quantité', 'Prix Unitaire', 'Total']]
-    for ligne in lignes_facture:
-        data.append([
-            ligne.produit.nom,
-            str(ligne.quantite),
-            f"{ligne.prix_unitaire_negocie} FCFA",
-            f"{ligne.total_ligne} FCFA"
-        ])
-
-    table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-    ])
-
-    # Ajouter le total à la table
-    data.append(['', '', 'Montant Total:', f"{facture.montant_total} FCFA"])
-    table_style.add('SPAN', (0, -1), (1, -1))
-    table_style.add('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold')
-
-    table = Table(data, colWidths=[2.5*inch, 1*inch, 1.5*inch, 1.5*inch])
-    table.setStyle(table_style)
-    story.append(table)
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Paiements
-    story.append(Paragraph("<b>Historique des paiements :</b>", styles['Normal']))
-    for paiement in paiements:
-        story.append(Paragraph(
-            f"- {paiement.date_paiement.strftime('%d/%m/%Y')} : {paiement.montant_paye} FCFA ({paiement.get_methode_paiement_display()})",
-            styles['Normal']
-        ))
-    
-    story.append(Spacer(1, 0.2 * inch))
-    story.append(Paragraph(f"<b>Total Payé :</b> {total_paye} FCFA", styles['Normal']))
-    story.append(Paragraph(f"<b>Solde Dû :</b> {solde_du} FCFA", styles['Normal']))
-    
-    # Génération du PDF
-    doc.build(story)
-    
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="facture_{facture.id}.pdf"'
-    response.write(pdf)
-    return response
+    """
+    PDF de la facture, servi depuis le cache disque (factures_pdf.py). L'ETag
+    est l'empreinte du contenu : un client qui a déjà cette version reçoit 304.
+    """
+    try:
+        donnees = donnees_facture(pk)
+    except Facture.DoesNotExist:
+        raise Http404("Facture introuvable.")
+    empreinte = empreinte_facture(donnees)
+    etag = f'"{empreinte}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        reponse = HttpResponseNotModified()
+    else:
+        reponse = FileResponse(
+            ouvrir_pdf_facture(donnees, empreinte), as_attachment=True,
+            filename=f"facture_{pk}.pdf", content_type='application/pdf',
+        )
+    reponse['ETag'] = etag
+    patch_cache_control(reponse, private=True, no_cache=True)
+    return reponse
+
+# --- PDF par lots (fin de mois) ---
+@require_POST
+def lancer_lot_pdf(request):
+    """
+    Demande la génération des PDF d'une période (type_document=factures,
+    du=, au=) ou des relevés de compte (type_document=releves, clients=...),
+    en ZIP ou en un seul PDF (format=zip|pdf). Répond 202 avec l'URL de suivi,
+    ou 503 si aucun exécutant n'est actif (le lot ne serait jamais produit).
+    """
+    if not executant_disponible():
+        return JsonResponse({'error': (
+            "Aucun exécutant des PDF par lots n'est actif : lancer le serveur avec run.py, "
+            "ou 'manage.py generer_pdf_lot --surveiller' à côté du serveur web."
+        )}, status=503)
+    try:
+        travail = creer_travail(
+            request.POST.get('type_document', 'factures'),
+            request.POST.get('format', 'zip'),
+            du=request.POST.get('du') or None,
+            au=request.POST.get('au') or None,
+            clients=request.POST.getlist('clients'),
+        )
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages[0]}, status=400)
+    lancer_travail(travail)
+    statut_url = reverse('statut_lot_pdf', args=[travail.pk])
+    reponse = JsonResponse({'id': travail.pk, 'statut': travail.statut, 'statut_url': statut_url}, status=202)
+    reponse['Location'] = statut_url
+    return reponse
+
+def statut_lot_pdf(request, pk):
+    """
+    Avancement d'un lot PDF, à interroger périodiquement ; 'fichier_url' est
+    renseigné une fois le lot terminé.
+    """
+    travail = get_object_or_404(TravailPDF, pk=pk)
+    reponse = JsonResponse({
+        'id': travail.pk,
+        'type_document': travail.type_document,
+        'format': travail.format_sortie,
+        'statut': travail.statut,
+        'nb_total': travail.nb_total,
+        'nb_faits': travail.nb_faits,
+        'progression': round(100 * travail.nb_faits / travail.nb_total) if travail.nb_total else None,
+        'erreur': travail.erreur,
+        'fichier_url': reverse('fichier_lot_pdf', args=[travail.pk]) if travail.statut == 'TERMINE' else None,
+    })
+    patch_cache_control(reponse, no_store=True)
+    return reponse
+
+def fichier_lot_pdf(request, pk):
+    travail = get_object_or_404(TravailPDF, pk=pk, statut='TERMINE')
+    chemin = chemin_fichier(travail)
+    if not chemin.exists():
+        raise Http404("Fichier du lot introuvable.")
+    content_type = 'application/pdf' if travail.format_sortie == 'pdf' else 'application/zip'
+    return FileResponse(open(chemin, 'rb'), as_attachment=True, filename=travail.fichier, content_type=content_type)
 
 def ajouter_paiement(request, facture_pk):
     facture = get_object_or_404(Facture, pk=facture_pk)
     
-    total_paye = Paiement.objects.filter(facture=facture).aggregate(Sum('montant_paye'))['montant_paye__sum'] or Decimal('0.00')
-    solde_restant = facture.montant_total - total_paye
+    solde_restant = facture.solde
 
     if request.method == 'POST':
         form = PaiementForm(request.POST)
@@ -583,14 +567,9 @@ def ajouter_paiement(request, facture_pk):
             if nouveau_paiement.montant_paye > solde_restant:
                 messages.error(request, f"Le montant du paiement ({nouveau_paiement.montant_paye} FCFA) dépasse le solde restant ({solde_restant} FCFA).")
             else:
+                # Le montant payé, le solde et le statut de la facture sont mis à jour par Paiement.save()
                 nouveau_paiement.save()
                 messages.success(request, "Paiement enregistré avec succès!")
-                
-                # Mise à jour du statut de la facture
-                total_paye_apres = Paiement.objects.filter(facture=facture).aggregate(Sum('montant_paye'))['montant_paye__sum'] or Decimal('0.00')
-                if total_paye_apres >= facture.montant_total:
-                    facture.est_payee = True
-                    facture.save()
                     
                 return redirect('detail_facture', pk=facture.pk)
     else:
@@ -607,6 +586,9 @@ def ajouter_paiement(request, facture_pk):
 # --- Vues pour l'interface de vente ---
 @permission_required('gestion_produits_stock.can_access_interface_vente', raise_exception=True)
 def interface_vente(request):
+    # Lieu dont la vente décompte le stock (par défaut "Principal", surchargeable par caisse)
+    lieu_vente_id = id_lieu_vente(request)
+
     if request.method == 'POST':
         facture_form = FactureForm(request.POST, prefix='facture')
         formset = LigneFactureFormSet(request.POST, prefix='lignes')
@@ -615,52 +597,13 @@ def interface_vente(request):
             with transaction.atomic():
                 if facture_form.is_valid() and formset.is_valid():
                     facture = facture_form.save(commit=False)
-                    
-                    # Calculer le montant total de la facture
-                    total_facture = Decimal('0.00')
-                    
-                    # Vérifier le stock avant de sauvegarder
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            produit = form.cleaned_data.get('produit')
-                            quantite = form.cleaned_data.get('quantite')
-                            prix_unitaire_negocie = form.cleaned_data.get('prix_unitaire_negocie')
-                            
-                            stock_principal = Stock.objects.filter(produit=produit, lieu_stockage__nom="Principal").first()
-                            
-                            if not stock_principal or stock_principal.quantite < quantite:
-                                messages.error(request, f"Quantité insuffisante pour le produit {produit.nom}. Stock disponible : {stock_principal.quantite if stock_principal else 0}.")
-                                raise ValidationError("Stock insuffisant.")
-                            
-                            # Calculer le total de la ligne ici
-                            total_ligne = quantite * prix_unitaire_negocie
-                            total_facture += total_ligne
-                    
-                    facture.montant_total = total_facture
-                    facture.save()
-                    
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            ligne_facture = form.save(commit=False)
-                            ligne_facture.facture = facture
-                            
-                            # Mettre à jour le total_ligne avant de sauvegarder
-                            ligne_facture.total_ligne = ligne_facture.quantite * ligne_facture.prix_unitaire_negocie
-                            ligne_facture.save()
-                            
-                            # Décrémenter le stock
-                            stock_principal = Stock.objects.get(produit=ligne_facture.produit, lieu_stockage__nom="Principal")
-                            stock_principal.quantite -= ligne_facture.quantite
-                            stock_principal.save()
-                            
-                            # Créer un mouvement de stock de sortie
-                            StockMovement.objects.create(
-                                produit=ligne_facture.produit,
-                                lieu_stockage_source=stock_principal.lieu_stockage,
-                                quantite=ligne_facture.quantite,
-                                type_mouvement='SORTIE',
-                                description=f"Vente (Facture #{facture.id})"
-                            )
+                    lignes = [
+                        form.save(commit=False)
+                        for form in formset
+                        if form.cleaned_data and not form.cleaned_data.get('DELETE')
+                    ]
+                    # Verrouille les stocks, contrôle et décompte en un nombre constant de requêtes
+                    enregistrer_vente(facture, lignes, lieu_vente_id)
 
                     messages.success(request, "Facture enregistrée avec succès!")
                     return redirect('detail_facture', pk=facture.pk)
@@ -668,6 +611,8 @@ def interface_vente(request):
                     messages.error(request, "Erreur dans le formulaire. Veuillez vérifier les informations.")
                     print("Erreurs FactureForm:", facture_form.errors)
                     print("Erreurs Formset:", formset.errors)
+        except StockInsuffisant as e:
+            messages.error(request, e.message)
         except ValidationError as e:
             print(f"Validation Error: {e}")
         except Exception as e:
@@ -682,10 +627,15 @@ def interface_vente(request):
         'facture_form': facture_form,
         'formset': formset,
     }
-    return render(request, 'gestion_produits_stock/interface_vente.html', context)
+    response = render(request, 'gestion_produits_stock/interface_vente.html', context)
+    # ?caisse=<code> identifie durablement le poste (voir LIEUX_VENTE_PAR_CAISSE)
+    if request.GET.get('caisse'):
+        response.set_cookie(CAISSE_COOKIE, request.GET['caisse'], max_age=365 * 24 * 3600)
+    return response
 
 def modifier_vente(request, pk):
     facture = get_object_or_404(Facture, pk=pk)
+    lieu_vente_id = id_lieu_vente(request)
     
     if request.method == 'POST':
         facture_form = FactureForm(request.POST, instance=facture, prefix='facture')
@@ -694,66 +644,10 @@ def modifier_vente(request, pk):
         try:
             with transaction.atomic():
                 if facture_form.is_valid() and formset.is_valid():
-                    facture_form.save()
-                    
-                    # Récupérer les lignes de facture existantes pour annuler les mouvements de stock
-                    lignes_existantes = {ligne.pk: ligne for ligne in facture.lignes_facture.all()}
-                    
-                    # Préparer la liste des lignes de facture non supprimées
-                    lignes_a_conserver = []
-
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            lignes_a_conserver.append(form.cleaned_data)
-
-                    # Restaurer le stock pour les lignes existantes et vérifier le stock pour les nouvelles lignes
-                    for ligne_existante_pk, ligne_existante in lignes_existantes.items():
-                        stock_principal = Stock.objects.get(produit=ligne_existante.produit, lieu_stockage__nom="Principal")
-                        stock_principal.quantite += ligne_existante.quantite
-                        stock_principal.save()
-
-                    # Supprimer les mouvements de stock précédents pour cette facture
-                    StockMovement.objects.filter(
-                        description=f"Vente (Facture #{facture.id})",
-                        type_mouvement='SORTIE'
-                    ).delete()
-
-                    # Sauvegarder les nouvelles lignes, mettre à jour le stock et créer les nouveaux mouvements
-                    montant_total = Decimal('0.00')
-                    for form in formset:
-                        if form.cleaned_data and not form.cleaned_data.get('DELETE'):
-                            ligne_facture = form.save(commit=False)
-                            ligne_facture.facture = facture
-                            
-                            produit = ligne_facture.produit
-                            quantite = ligne_facture.quantite
-                            
-                            # Vérifier le stock après restauration
-                            stock_principal = Stock.objects.get(produit=produit, lieu_stockage__nom="Principal")
-                            if stock_principal.quantite < quantite:
-                                messages.error(request, f"Quantité insuffisante pour le produit {produit.nom}. Stock disponible : {stock_principal.quantite}.")
-                                raise ValidationError("Stock insuffisant.")
-                            
-                            stock_principal.quantite -= quantite
-                            stock_principal.save()
-
-                            # Calculer le total_ligne avant de sauvegarder
-                            ligne_facture.total_ligne = quantite * ligne_facture.prix_unitaire_negocie
-                            ligne_facture.save()
-                            
-                            StockMovement.objects.create(
-                                produit=produit,
-                                lieu_stockage_source=stock_principal.lieu_stockage,
-                                quantite=quantite,
-                                type_mouvement='SORTIE',
-                                description=f"Vente (Facture #{facture.id})"
-                            )
-                            
-                            montant_total += ligne_facture.total_ligne
-
-                    formset.save()
-                    facture.montant_total = montant_total
-                    facture.save()
+                    facture = facture_form.save(commit=False)
+                    # Seules les différences nettes par produit touchent le stock, au
+                    # lieu de la vente d'origine (celui de la caisse à défaut)
+                    modifier_lignes_vente(facture, formset, lieu_vente_id)
 
                     messages.success(request, "Facture modifiée avec succès!")
                     return redirect('detail_facture', pk=facture.pk)
@@ -761,6 +655,8 @@ def modifier_vente(request, pk):
                     messages.error(request, "Erreur dans le formulaire. Veuillez vérifier les informations.")
                     print("Erreurs FactureForm:", facture_form.errors)
                     print("Erreurs Formset:", formset.errors)
+        except StockInsuffisant as e:
+            messages.error(request, e.message)
         except ValidationError as e:
             print(f"Validation Error: {e}")
         except Exception as e:
@@ -781,40 +677,73 @@ def modifier_vente(request, pk):
 
 # --- API AJAX ---
 def recherche_produit_ajax(request):
-    query = request.GET.get('term', '')
-    if query:
-        produits = Produit.objects.filter(
-            Q(nom__icontains=query) | Q(code_produit__icontains=query)
-        )[:10]
-        
-        results = []
-        for produit in produits:
-            stock_quantite = Stock.objects.filter(
-                produit=produit, 
-                lieu_stockage__nom="Principal"
-            ).aggregate(qte=Coalesce(Sum('quantite'), Decimal('0.00')))['qte']
-            
-            results.append({
-                'id': produit.id,
-                'label': f"{produit.nom} ({produit.code_produit or 'N/A'}) - Stock: {stock_quantite}",
-                'value': produit.nom,
-                'prix_unitaire': float(produit.prix_unitaire),
-                'stock_quantite': float(stock_quantite)
-            })
-        return JsonResponse(results, safe=False)
-    return JsonResponse([], safe=False)
+    """
+    Autocomplétion de la caisse. Les résultats (stock inclus) sont mis en cache
+    par terme normalisé et version du catalogue ; le client renvoie l'ETag reçu
+    (If-None-Match) et obtient 304 tant que rien n'a changé. L'en-tête
+    X-Sequence de la requête est renvoyé pour que le client écarte les réponses
+    arrivées après une saisie plus récente.
+    """
+    # Saisie brute : le code exact s'y compare tel quel ("ABC-123")
+    terme = request.GET.get('term', '').strip()
+    if normaliser_terme(terme):
+        lieu_vente_id = id_lieu_vente(request)
+        etag, version = etag_recherche(terme, lieu_vente_id)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(resultats_recherche(terme, lieu_vente_id, version), safe=False)
+        response['ETag'] = etag
+    else:
+        response = JsonResponse([], safe=False)
+    patch_cache_control(response, private=True, no_cache=True)
+    if request.headers.get('X-Sequence'):
+        response['X-Sequence'] = request.headers['X-Sequence']
+    return response
+
+def scanner_code_ajax(request):
+    """
+    Lecture d'un code-barres : correspondance exacte sur code_produit, servie
+    par la table des codes du processus (sans requête tant que rien ne change).
+    """
+    code = request.GET.get('code', '').strip()
+    if not code:
+        return JsonResponse({'error': 'Code manquant'}, status=400)
+    produit = table_codes.scanner(code, id_lieu_vente(request))
+    if produit is None:
+        return JsonResponse({'error': 'Produit non trouvé'}, status=404)
+    produit['prix_unitaire'] = float(produit['prix_unitaire'])
+    produit['stock_quantite'] = float(produit['stock_quantite'])
+    return JsonResponse(produit)
+
+def stocks_produits_ajax(request):
+    """
+    Stock de plusieurs produits en un appel : ?ids=1,2,3[&lieux=4,5].
+    Sans 'lieux', le lieu de vente de la caisse est utilisé.
+    Réponse : {"stocks": {"<produit_id>": {"<lieu_id>": quantité}}}.
+    """
+    try:
+        produit_ids = lire_ids(request.GET, 'ids')
+        lieu_ids = lire_ids(request.GET, 'lieux') or [id_lieu_vente(request)]
+    except ValueError:
+        return JsonResponse({'error': 'Identifiants invalides'}, status=400)
+    if not produit_ids:
+        return JsonResponse({'error': 'ID de produit manquant'}, status=400)
+    if len(produit_ids) > NB_PRODUITS_MAX_PAR_LOT:
+        return JsonResponse({'error': f'{NB_PRODUITS_MAX_PAR_LOT} produits au maximum par appel'}, status=400)
+    quantites = quantites_par_lieu(produit_ids, lieu_ids)
+    return JsonResponse({'stocks': {
+        produit_id: {lieu_id: float(quantite) for lieu_id, quantite in par_lieu.items()}
+        for produit_id, par_lieu in quantites.items()
+    }})
 
 def get_product_stock_ajax(request):
     product_id = request.GET.get('product_id')
     if product_id:
-        try:
-            produit = Produit.objects.get(pk=product_id)
-            stock_quantite = Stock.objects.filter(
-                produit=produit,
-                lieu_stockage__nom="Principal"
-            ).aggregate(qte=Coalesce(Sum('quantite'), Decimal('0.00')))['qte']
-            
-            return JsonResponse({'stock_quantite': float(stock_quantite)}, safe=False)
-        except Produit.DoesNotExist:
+        produit = annoter_stock_principal(
+            Produit.objects.filter(pk=product_id), id_lieu_vente(request)
+        ).values('stock_principal').first()
+        if produit is None:
             return JsonResponse({'error': 'Produit non trouvé'}, status=404)
-    return JsonResponse({'error': 'ID de produit manquant'}, status=400)
\ No newline at end of file
+        return JsonResponse({'stock_quantite': float(produit['stock_principal'])}, safe=False)
+    return JsonResponse({'error': 'ID de produit manquant'}, status=400)
@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+import os
+
+# Configuration gunicorn du Procfile (hébergement Linux). Les postes de caisse
+# utilisent run.py (gestion_produits_stock/serveur.py).
+#   kill -HUP <maître> : redémarrage progressif (nouveaux workers, puis arrêt
+#   des anciens une fois leurs requêtes terminées)
+#   SERVEUR_ASGI=1 : eisf/asgi.py avec les workers uvicorn (pip install uvicorn)
+# Les PDF par lots ne sont pas produits par les workers web : le processus
+# 'worker' du Procfile (manage.py generer_pdf_lot --surveiller) doit tourner
+# à côté, sinon les demandes de lots sont refusées (503).
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if os.environ.get('SERVEUR_ASGI') == '1':
+    wsgi_app = 'eisf.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'eisf.wsgi:application'
+    # Workers à fils : une facture PDF lente n'occupe qu'un fil
+    worker_class = 'gthread'
+    threads = int(os.environ.get('SERVEUR_FILS', 4))
+
+# Plusieurs processus : les caches de l'application passent par le cache
+# partagé (CACHES, sur disque) et la version du catalogue par la base
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+# Requête abandonnée (worker redémarré) au-delà de ce délai (s)
+timeout = int(os.environ.get('SERVEUR_DELAI_REQUETE', 60))
+# Temps laissé aux requêtes en cours lors d'un arrêt ou d'un redémarrage
+graceful_timeout = int(os.environ.get('SERVEUR_DELAI_ARRET', 30))
+keepalive = int(os.environ.get('SERVEUR_DELAI_INACTIVITE', 5))
+# Workers recyclés régulièrement (mémoire de ReportLab), décalés pour ne pas redémarrer ensemble
+max_requests = 1000
+max_requests_jitter = 100
+# Application chargée une fois dans le maître (table des codes-barres comprise)
+preload_app = True
+accesslog = '-'
@@ -1,35 +1,43 @@
 # run.py
+import argparse
+import multiprocessing
 import os
 import sys
-from wsgiref.simple_server import make_server
 from pathlib import Path
-from django.core.wsgi import get_wsgi_application
 
 BASE_DIR = Path(__file__).resolve().parent
 
 if __name__ == '__main__':
+    # Processus de rendu PDF et de uvicorn dans l'exécutable empaqueté
+    multiprocessing.freeze_support()
+
     # Ajoute le chemin du projet au PYTHONPATH
     sys.path.append(str(BASE_DIR))
     
     # Définit le module de configuration de Django
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "eisf.settings")
-    
-    # Configure l'application WSGI de Django
+
+    parser = argparse.ArgumentParser(description="Serveur de l'application (postes de caisse).")
+    parser.add_argument('--hote', help="Adresse d'écoute (par défaut : SERVEUR_HOTE).")
+    parser.add_argument('--port', type=int, help="Port (par défaut : SERVEUR_PORT).")
+    parser.add_argument('--fils', type=int, help="Requêtes traitées simultanément (par défaut : SERVEUR_FILS).")
+    parser.add_argument('--asgi', action='store_true', help="Servir eisf/asgi.py avec uvicorn.")
+    parser.add_argument('--processus', type=int, help="Processus uvicorn en mode ASGI (par défaut : SERVEUR_PROCESSUS).")
+    options = parser.parse_args()
+
+    # Configure Django ; la table des codes-barres est chargée par eisf/wsgi.py et eisf/asgi.py
     try:
-        application = get_wsgi_application()
+        import django
+        django.setup()
     except Exception as exc:
         print("Erreur de configuration de l'application Django:", exc)
         sys.exit(1)
-    
-    # Définit l'hôte et le port du serveur
-    host = '0.0.0.0'
-    port = 8000
-    
-    # Lance le serveur simple de Python
-    print(f"Lancement du serveur sur http://{host}:{port}/")
+
+    from gestion_produits_stock.serveur import servir
     try:
-        httpd = make_server(host, port, application)
-        httpd.serve_forever()
+        servir(options.hote, options.port, options.fils, options.processus, asgi=options.asgi)
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"Erreur lors du lancement du serveur: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)